@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+"""
+Measure what each 'go' costs when the script only checks the status code.
+
+Loads the same URL repeatedly and reports the time per 'go' + 'code 200'.
+It does this twice: once as twine does it now, and once also doing the
+work twine used to do eagerly after every load -- injecting jQuery
+(webkit only) and parsing the page for its title.  The difference is
+the per-'go' saving of doing that work only when a command needs it.
+
+Usage: python benchmarks/page_load.py [-e <engine>] [-n <loads>] <url>
+
+The test server in tests/ serves a suitable page at http://127.0.0.1:5000/.
+"""
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+thisdir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(thisdir), 'src'))
+
+def eager_extras(browser):
+    """
+    What twine used to do after every successful load.
+    """
+    if browser.javascript_enabled:
+        browser.load_jquery(True)
+    browser.page.title
+
+def time_loads(url, n, extras=None):
+    """
+    Return the average time of 'n' loads of 'url', in seconds.
+    """
+    from twine import commands
+
+    times = []
+    for i in range(n):
+        start = time.time()
+        commands.go(url)
+        commands.code('200')
+        if extras:
+            extras(commands.get_browser())
+        times.append(time.time() - start)
+    return sum(times) / len(times)
+
+def main():
+    parser = OptionParser(usage="%prog [-e <engine>] [-n <loads>] <url>")
+    parser.add_option('-e', '--engine', action="store", dest="engine",
+                      default="webkit",
+                      help="browser engine: 'webkit' (default) or 'http'")
+    parser.add_option('-n', type="int", action="store", dest="loads",
+                      default=50, help="number of loads (default 50)")
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("need a URL to load")
+    url = args[0]
+
+    from twine import commands
+    from cStringIO import StringIO
+
+    commands.reset_browser(options.engine)
+    commands.OUT = StringIO()
+
+    time_loads(url, 3)                  # warm up
+
+    lazy = time_loads(url, options.loads)
+    eager = time_loads(url, options.loads, eager_extras)
+
+    print 'engine %s, %d loads of %s' % (options.engine, options.loads, url)
+    print 'on demand:  %7.2f ms per go' % (lazy * 1000,)
+    print 'eager:      %7.2f ms per go' % (eager * 1000,)
+    print 'saving:     %7.2f ms per go (%.0f%%)' % \
+          ((eager - lazy) * 1000, 100 * (eager - lazy) / eager)
+
+if __name__ == '__main__':
+    main()
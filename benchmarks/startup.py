@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+"""
+Measure how long twine takes to start.
+
+Times 'import twine' and 'twine -v' in fresh interpreters, and checks that
+neither imports the WebKit engine (spynner/PyQt4), pyquery or lxml, which
+should only be loaded once a browser is actually needed.
+
+Usage: python benchmarks/startup.py [<repeat>]
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+thisdir = os.path.dirname(os.path.abspath(__file__))
+srcdir = os.path.join(os.path.dirname(thisdir), 'src')
+twine_script = os.path.join(os.path.dirname(thisdir), 'twine')
+
+heavy_modules = ['spynner', 'PyQt4', 'pyquery', 'lxml', 'requests']
+
+check_imports = """
+import sys, twine
+print ' '.join([ m for m in %r if m in sys.modules ])
+""" % (heavy_modules,)
+
+def environ():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([srcdir, env.get('PYTHONPATH', '')])
+    return env
+
+def best_time(args, repeat):
+    """
+    Run 'args' 'repeat' times and return the fastest wall-clock time.
+    """
+    env = environ()
+    devnull = open(os.devnull, 'w')
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        subprocess.check_call(args, env=env, stdout=devnull, stderr=devnull)
+        times.append(time.time() - start)
+    devnull.close()
+    return min(times)
+
+def main():
+    repeat = 10
+    if len(sys.argv) > 1:
+        repeat = int(sys.argv[1])
+
+    baseline = best_time([sys.executable, '-c', 'pass'], repeat)
+    print 'python startup:  %6.1f ms' % (baseline * 1000,)
+
+    for name, args in (('import twine:', [sys.executable, '-c',
+                                          'import twine']),
+                       ('twine -v:', [sys.executable, twine_script, '-v'])):
+        t = best_time(args, repeat)
+        print '%-16s %6.1f ms (%.1f ms over python startup)' % \
+              (name, t * 1000, (t - baseline) * 1000)
+
+    p = subprocess.Popen([sys.executable, '-c', check_imports],
+                         env=environ(), stdout=subprocess.PIPE)
+    loaded = p.communicate()[0].split()
+    if loaded:
+        print 'heavy modules imported by "import twine": %s' % \
+              (', '.join(loaded),)
+        sys.exit(1)
+    print 'no heavy modules imported by "import twine".'
+
+if __name__ == '__main__':
+    main()
@@ -56,8 +56,8 @@ def set_output(fp):
     Have standard output from twine go to the given fp instead of
     stdout.  fp=None will reset to stdout.
     """
-    import commands, browser
-    commands.OUT = browser.OUT = fp
+    import commands
+    commands.OUT = fp
 
 def set_errout(fp):
     """
@@ -0,0 +1,379 @@
+"""
+Browser state and form handling shared by all of the twine browser engines.
+"""
+
+import re
+import urlparse
+
+from errors import TwineAssertionError
+from utils import make_boolean
+from timing import timed
+from page import PageModel, field_state, field_tags
+
+def _attr_selector(name, value):
+    """
+    A CSS selector for elements whose attribute 'name' is exactly 'value',
+    quoted so that any characters in it are safe.
+    """
+    return '[%s="%s"]' % (name, value.replace('\\', '\\\\')
+                                     .replace('"', '\\"'))
+
+# input types that 'fv' leaves alone; any other input takes a text value.
+unfillable_types = ('submit', 'button', 'image', 'reset', 'file')
+
+class BaseBrowser(object):
+    """
+    Engine-independent part of a twine browser: extra headers, HTTP
+    authentication credentials, history, and form lookup/filling.
+
+    Subclasses provide load(), the url/html properties, soup, the DOM
+    helpers fill(), check(), uncheck(), select() and submit(), and
+    set_form_action(form_number, action), which points the action of a
+    form (numbered from 0) elsewhere; and they call invalidate_page()
+    whenever they load a page or change the structure of its DOM.
+    """
+    # whether this engine can run JavaScript in the page.
+    javascript_enabled = False
+
+    def _init_state(self):
+        self.headers = [("Accept", "text/html; */*")]
+        self._http_status = ""
+        self._content_type = ""
+
+        # requests blocked while loading the current page, by reason; see
+        # requestpolicy.RequestPolicy.check().
+        self._blocked_requests = {}
+
+        self._history = []
+
+        # functions called as fn(action, url) after go() or back() loads a
+        # page, with action 'go' or 'back'; see e.g. extensions/require.py.
+        self._post_load_hooks = []
+
+        # Keep track of old form values so they can be restored on formclear
+        self._previous_form_values = {}
+
+        # Last form modified by user
+        # Used for default submit command
+        self.last_form = None
+
+        # Dictionary of dictionaries
+        # Indexed first by url, and then by realm
+        self._realmCredentials = {}
+
+        # Dictionary indexed by url only
+        # Used when a realm is not specified
+        self._urlCredentials = {}
+
+        self.at_empty_page = True
+
+        # parsed model of the current page; see the 'page' property.
+        self._page = None
+
+    @property
+    def page(self):
+        """
+        The PageModel of the current page, parsed on first use.
+        """
+        if self._page is None:
+            self._page = PageModel(self.soup)
+        return self._page
+
+    def invalidate_page(self):
+        """
+        Forget the parsed page, after a load or a change to the DOM.
+        """
+        self._page = None
+
+    @property
+    def http_status(self):
+        return self._http_status
+
+    @property
+    def content_type(self):
+        return self._content_type
+
+    @property
+    def blocked_requests(self):
+        return self._blocked_requests
+
+    @property
+    def title(self):
+        """
+        The title of the current page, found the first time it's needed.
+        """
+        return self.page.title
+
+    @property
+    def history(self):
+        return self._history
+
+    def add_header(self, header):
+        self.headers.append(header)
+
+    def reset_headers(self):
+        self.headers = [("Accept", "text/html; */*")]
+
+    def add_credentials(self, realm, url, username, password):
+        if realm:
+            if url not in self._realmCredentials:
+                self._realmCredentials[url] = {}
+            self._realmCredentials[url][realm] = (username, password)
+        else:
+            self._urlCredentials[url] = (username, password)
+
+    def http_authentication_callback(self, url, realm):
+        realm_auth = self._realmCredentials.get(url)
+        if realm_auth:
+            realm_auth = realm_auth.get(realm)
+        url_auth = self._urlCredentials.get(url)
+        return realm_auth or url_auth
+
+    def go(self, url):
+        if url:
+            try_urls = [url, ]
+
+            # if this is an absolute URL that is just missing the 'http://' at
+            # the beginning, try fixing that.
+            if url.find('://') == -1:
+                full_url = 'http://%s' % (url,)  # mimic browser behavior
+                try_urls.append(full_url)
+
+            # if this is a '?' or '/' URL, then assume that we want to tack it
+            # onto the end of the current URL.
+            try_urls.append(urlparse.urljoin(self.url, url))
+
+            for u in try_urls:
+                if self.load(u):
+                    self._run_post_load_hooks('go', u)
+                    return True
+            return False
+        else:
+            self.load("")
+            return True
+
+    def back(self):
+        if self._history:
+            last_page = self._history.pop()
+            self.load(last_page, False)
+            self._run_post_load_hooks('back', last_page)
+            return True
+        else:
+            self.load("")
+            return False
+
+    def _run_post_load_hooks(self, action, url):
+        for fn in self._post_load_hooks:
+            fn(action, url)
+
+    ### waiting for the page to change
+
+    def _wait_until(self, condition, timeout, what):
+        """
+        Wait up to 'timeout' seconds for condition() to become true, and
+        fail with a TwineAssertionError if it doesn't.  Without JavaScript
+        nothing changes a loaded page, so this just checks once; engines
+        that run JavaScript override it to wait for events.
+        """
+        if not condition():
+            raise TwineAssertionError("no %s on the page" % (what,))
+
+    def _has_element(self, selector):
+        return len(self.page(selector)) > 0
+
+    def _is_idle(self):
+        return True
+
+    @timed('load')
+    def wait_for(self, selector, timeout):
+        """
+        Wait until an element matching the CSS selector is on the page.
+        """
+        self._wait_until(lambda: self._has_element(selector), timeout,
+                         "element matching '%s'" % (selector,))
+
+    @timed('load')
+    def wait_for_text(self, regexp, timeout):
+        """
+        Wait until the HTML of the page matches the regular expression.
+        """
+        regexp = re.compile(regexp)
+        self._wait_until(lambda: regexp.search(self.html), timeout,
+                         "text matching '%s'" % (regexp.pattern,))
+
+    @timed('load')
+    def wait_for_idle(self, timeout):
+        """
+        Wait until the page has no network requests outstanding.
+        """
+        self._wait_until(self._is_idle, timeout, "quiet network")
+
+    @timed('dom')
+    def find_form(self, formname):
+        """
+        Return (form, form_number) for the form matching 'formname' (a
+        1-based number, a name or an id); form_number is 0-based.
+        """
+        index = self.page.find_form(formname)
+        return (index.form, index.number)
+
+    def form_snapshot(self):
+        """
+        Return the current state of every field in every form; see
+        PageModel.form_state().  Engines that keep field values outside
+        of the parsed page override this.
+        """
+        return self.page.form_state()
+
+    def _initial_form_state(self, form_index):
+        """
+        Return the state of the form with the given FormIndex as it was
+        before the first change to any form on this page.
+        """
+        page = self.page
+        if page.initial_form_state is None:
+            page.initial_form_state = self.form_snapshot()
+
+        forms = page.initial_form_state
+        n = form_index.number
+        if n < len(forms) and \
+           len(forms[n]['fields']) == len(form_index.fields):
+            return forms[n]
+
+        # the live page doesn't match the parsed one; use the parsed one.
+        return dict(fields=[ field_state(field[0])
+                             for field in form_index.fields ])
+
+    def _remember_field(self, form_index, fieldname, fields):
+        """
+        Remember the value field(s) 'fields' had before they were first
+        changed on this page, for 'formclear'.
+        """
+        previous = self._previous_form_values.get(form_index.number, {})
+        if fieldname in previous:
+            return
+
+        form_state = self._initial_form_state(form_index)
+        states = [ form_state['fields'][form_index.field_number(field)]
+                   for field in fields ]
+
+        field_type = states[0]['type']
+        if field_type == "checkbox":
+            value = states[0]['checked']
+        elif field_type == "radio":
+            checked = [ state['value'] for state in states
+                        if state['checked'] ]
+            value = "".join(checked[:1])
+        else:
+            value = states[0]['value']
+
+        self.add_previous_form_value(form_index.number, fieldname, value)
+
+    def add_previous_form_value(self, form_number, fieldname, value):
+        if form_number not in self._previous_form_values:
+            self._previous_form_values[form_number] = {}
+        self._previous_form_values[form_number][fieldname] = value
+
+    @timed('dom')
+    def formvalues(self, formname, pairs, track_previous_values=True):
+        """
+        Set several fields of one form in one go.  'pairs' is a list of
+        (fieldspec, value), where fieldspec is either a field number, name
+        or id as for 'fv', or a compiled regular expression, which sets
+        every (writable) field whose name matches.  For a regexp, value
+        may be a list: consecutive matches get consecutive values, and the
+        last value is used for any remaining matches.
+
+        Unless 'track_previous_values' is False, the values the fields had
+        before are remembered for 'formclear'.  Returns the number of
+        fields (or radio groups) set.
+        """
+        form_index = self.page.find_form(formname)
+
+        assignments = []                # (tag, type, [field, ...], value)
+        for fieldspec, value in pairs:
+            if hasattr(fieldspec, 'search'):
+                matches = form_index.match_fields(fieldspec)
+                if isinstance(value, basestring):
+                    value = [value]
+                if matches and not value:
+                    raise TwineAssertionError(
+                        "no values for the fields matching '%s'" %
+                        (fieldspec.pattern,))
+                for n, (tag, fields) in enumerate(matches):
+                    if track_previous_values:
+                        self._remember_field(form_index, fields[0].attr.name,
+                                             fields)
+                    assignments.append((tag, fields[0].attr.type, fields,
+                                        value[min(n, len(value) - 1)]))
+            else:
+                tag, fields = form_index.find_fields(fieldspec)
+
+                field_type = fields[0].attr.type
+                if len(fields) > 1:
+                    for field in fields:
+                        if field.attr.type != field_type:
+                            raise TwineAssertionError(
+                                "field types do not match")
+
+                if track_previous_values:
+                    self._remember_field(form_index, fieldspec, fields)
+                assignments.append((tag, field_type, fields, value))
+
+        for tag, field_type, fields, value in assignments:
+            if tag not in field_tags:
+                raise TwineAssertionError("Unknown field tag")
+            if field_type == "checkbox":
+                make_boolean(value)     # complain before changing anything
+
+        self._fill_fields(form_index, assignments)
+
+        # Keep track of last form modified
+        self.last_form = formname
+
+        return len(assignments)
+
+    def _fill_fields(self, form_index, assignments):
+        """
+        Apply the (tag, type, [field, ...], value) assignments worked out
+        by formvalues() to the page, through the DOM helpers.  Engines
+        override this to apply them all at once.
+        """
+        for tag, field_type, fields, value in assignments:
+            field = fields[0]
+
+            # fields found by number or id are still filled in by name.
+            if field.attr.name is not None:
+                selector = tag + _attr_selector('name', field.attr.name)
+            else:
+                selector = tag + _attr_selector('id', field.attr.id)
+
+            if tag == "select":
+                self.select("%s option%s" % (selector,
+                                             _attr_selector('value', value)))
+            elif tag == "textarea":
+                self.fill(selector, value)
+            elif field_type == "checkbox":
+                if make_boolean(value):
+                    self.check(selector)
+                else:
+                    self.uncheck(selector)
+            elif field_type == "radio":
+                self.check(selector + _attr_selector('value', value))
+            elif field_type not in unfillable_types:
+                self.fill(selector, value)
+
+    def _formvalue(self, formname, fieldname, value, track_previous_value):
+        self.formvalues(formname, [(fieldname, value)], track_previous_value)
+
+    def formvalue(self, formname, fieldname, value):
+        self._formvalue(formname, fieldname, value, True)
+
+    def formclear(self, formname):
+        form_number = self.page.find_form(formname).number
+        if form_number not in self._previous_form_values:
+            return
+
+        self.formvalues(formname,
+                        self._previous_form_values[form_number].items(),
+                        False)
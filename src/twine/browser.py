@@ -1,36 +1,209 @@
+import os
+import json
+import time
+import urlparse
+
 from spynner import *
-from errors import TwineException, TwineAssertionError
+from basebrowser import BaseBrowser, unfillable_types
 from utils import make_boolean
+from errors import TwineException, TwineAssertionError
+import jsbridge
+from timing import timed
+import tracing
+import httpcache
+
+try:
+    from PyQt4.QtWebKit import QWebSettings
+    from PyQt4.QtNetwork import QNetworkDiskCache
+except ImportError:
+    from PySide.QtWebKit import QWebSettings
+    from PySide.QtNetwork import QNetworkDiskCache
+
+# Evaluates to the live state of every form field, in the format of
+# page.field_state() and PageModel.form_state().
+_form_snapshot_js = """
+(function () {
+    var tags = ['input', 'select', 'textarea'], forms = [];
+    for (var i = 0; i < document.forms.length; i++) {
+        var form = document.forms[i], fields = [];
+        for (var t = 0; t < tags.length; t++) {
+            var elements = form.getElementsByTagName(tags[t]);
+            for (var j = 0; j < elements.length; j++) {
+                var el = elements[j];
+                var field = {tag: tags[t], type: el.getAttribute('type'),
+                             name: el.getAttribute('name'),
+                             id: el.getAttribute('id'),
+                             value: el.value, checked: !!el.checked};
+                if (tags[t] == 'select') {
+                    field.options = [];
+                    for (var k = 0; k < el.options.length; k++) {
+                        var o = el.options[k];
+                        field.options.push({value: o.value, text: o.text,
+                                            selected: o.selected});
+                    }
+                    if (el.selectedIndex < 0 && el.options.length)
+                        field.value = el.options[0].value;
+                }
+                fields.push(field);
+            }
+        }
+        forms.push({name: form.getAttribute('name'),
+                    id: form.getAttribute('id'), fields: fields});
+    }
+    return forms;
+})()
+"""
+
+# Applies a batch of form field changes in one go: 'ops' is a list of
+# {n, name, kind, value}, where n is the field's number in the form (as
+# FormIndex numbers them) and name guards against the live page having
+# different fields than the parsed one.  Evaluates to how many were applied.
+_fill_fields_js = """
+(function (formNumber, ops) {
+    var tags = ['input', 'select', 'textarea'], fields = [], applied = 0;
+    var form = document.forms[formNumber];
+    if (!form) return 0;
+    for (var t = 0; t < tags.length; t++) {
+        var elements = form.getElementsByTagName(tags[t]);
+        for (var j = 0; j < elements.length; j++)
+            fields.push(elements[j]);
+    }
+    for (var i = 0; i < ops.length; i++) {
+        var op = ops[i], el = fields[op.n];
+        if (!el || el.getAttribute('name') != op.name)
+            continue;
+        if (op.kind == 'checkbox') {
+            el.checked = op.value;
+        } else if (op.kind == 'radio') {
+            for (var j = 0; j < fields.length; j++) {
+                var r = fields[j];
+                if (r.type == 'radio' && r.getAttribute('name') == op.name)
+                    r.checked = (r.value == op.value);
+            }
+        } else if (op.kind == 'select') {
+            for (var k = 0; k < el.options.length; k++) {
+                var o = el.options[k];
+                if (o.value == op.value)
+                    o.selected = true;
+                else if (!el.multiple)
+                    o.selected = false;
+            }
+        } else {
+            el.value = op.value;
+        }
+        applied++;
+    }
+    return applied;
+})(%d, %s)
+"""
+
+# how often (in ms) waits wake up to check their condition and timeout
+# when nothing else happens, and how long (in seconds) the network must be
+# quiet for wait_for_idle().
+_wait_interval = 100
+_idle_time = 0.5
+
+def _js_string(selector):
+    """
+    Escape 'selector' for the single-quoted JavaScript strings the spynner
+    DOM helpers put it in.
+    """
+    return selector.replace('\\', '\\\\').replace("'", "\\'")
+
+def _option(key):
+    """
+    Return the value of a 'config' option.
+    """
+    import commands
+    return commands._options[key]
+
+def _request_policy():
+    """
+    Return the RequestPolicy set up by 'config' and 'block_urls'.
+    """
+    import commands
+    return commands.request_policy()
+
+class _SharedDiskCache(QNetworkDiskCache):
+    """
+    Qt's disk cache, which only refuses no-store responses, with the
+    rules of a cache shared by scripts (see httpcache.is_storable()):
+    responses marked private, those to requests with credentials, and so
+    on, aren't stored.
+    """
+    def __init__(self, browser, parent):
+        QNetworkDiskCache.__init__(self, parent)
+        self._browser = browser
+
+    def prepare(self, meta_data):
+        try:
+            status = int(toString(meta_data.attributes().get(
+                QNetworkRequest.HttpStatusCodeAttribute)))
+        except (AttributeError, TypeError, ValueError):
+            status = None
+        headers = dict([ (str(name).lower(), str(value))
+                         for name, value in meta_data.rawHeaders() ])
+        host = urlparse.urlsplit(unicode(toString(meta_data.url()))).netloc
+        authorized = host in self._browser._authorized_hosts
+
+        if not httpcache.is_storable(status, headers, authorized):
+            return None
+        return QNetworkDiskCache.prepare(self, meta_data)
+
+class TwineBrowser(BaseBrowser, Browser):
+    javascript_enabled = True
 
-class TwineBrowser(Browser):
     def __init__(self, debug_level):
         super(TwineBrowser, self).__init__(debug_level = debug_level)
 
-        self.headers = [("Accept", "text/html; */*")]
-        self._http_status = ""
-        self._content_type = ""
-        self._title = ""
-
-        self._history = []
-
-        # Keep track of old form values so they can be restored on formclear
-        self._previous_form_values = {}
-
-        # Last form modified by user
-        # Used for default submit command
-        self.last_form = None
-
-        # Dictionary of dictionaries
-        # Indexed first by url, and then by realm
-        self._realmCredentials = {}
-
-        # Dictionary indexed by url only
-        # Used when a realm is not specified
-        self._urlCredentials = {}
+        self._init_state()
 
         self.set_http_authentication_callback(self.http_authentication_callback)
 
-        self.at_empty_page = True
+        # whether jQuery is known to be in the current page; see
+        # _ensure_jquery().
+        self._jquery_loaded = False
+
+        # when each outstanding request was made, by URL; for tracing.
+        self._request_starts = {}
+        self.set_url_filter(self._filter_request)
+
+        # whether replies are counted as cache hits/misses; see set_cache().
+        self._cache_enabled = False
+
+        # hosts that have asked for HTTP authentication: Qt sends them the
+        # credentials again unasked, so none of their responses go into
+        # the shared cache.  See _SharedDiskCache.
+        self._authorized_hosts = set()
+
+        # the URL of the page requests are made for; see _filter_request().
+        self._page_url = ""
+
+        # whether the main frame is loading a new document that hasn't
+        # replaced the old one yet, and whether the request being made is
+        # that document's (or a redirect of it); see _create_request().
+        self._navigating = False
+        self._navigation_request = False
+        self._spynner_create_request = self.manager.createRequest
+        self.manager.createRequest = self._create_request
+
+        # network replies created but not yet finished, for
+        # wait_for_idle(), and when the count last dropped to zero; see
+        # _create_request().
+        self._pending_requests = 0
+        self._idle_since = time.time()
+
+        # for the 'domready' and 'none' load strategies: whether the page
+        # being loaded has replaced the old one yet, whether the headers of
+        # its response (not a redirect) have arrived, and whether the last
+        # load returned before the page finished loading.
+        self._committed = False
+        self._main_response = False
+        self._loading_in_background = False
+        self._main_frame = self.webpage.mainFrame()
+        self._main_frame.loadStarted.connect(self._on_load_started)
+        self._main_frame.javaScriptWindowObjectCleared.connect(self._on_commit)
+        self.webpage.loadFinished.connect(self._on_page_load_finished)
 
     @property
     def url(self):
@@ -47,49 +220,35 @@ class TwineBrowser(Browser):
             return super(TwineBrowser, self).html
 
     @property
-    def http_status(self):
-        return self._http_status
-
-    @property
-    def content_type(self):
-        return self._content_type
-
-    @property
-    def title(self):
-        return self._title
-
-    @property
-    def history(self):
-        return self._history
-
-    def add_header(self, header):
-        self.headers.append(header)
-
-    def reset_headers(self):
-        self.headers = [("Accept", "text/html; */*")]
-
-    def add_credentials(self, realm, url, username, password):
-        if realm:
-            if url not in self._realmCredentials:
-                self._realmCredentials[url] = {}
-            self._realmCredentials[url][realm] = (username, password)
-        else:
-            self._urlCredentials[url] = (username, password)
-
-    def http_authentication_callback(self, url, realm):
-        realm_auth = self._realmCredentials.get(url)
-        if realm_auth:
-            realm_auth = realm_auth.get(realm)
-        url_auth = self._urlCredentials.get(url)
-        return realm_auth or url_auth
+    @timed('dom')
+    def soup(self):
+        return super(TwineBrowser, self).soup
 
+    @timed('load')
     def load(self, url, add_to_history = True):
         if url:
             old_url = self.url
             self._http_statuses = {}
             self._content_types = {}
 
-            ret = super(TwineBrowser, self).load(url)
+            # forget (and stop) whatever the last load left running.
+            if self._loading_in_background:
+                self.webpage.triggerAction(QWebPage.Stop)
+                self._events_loop(0.0)
+                self._loading_in_background = False
+            self._load_status = None
+
+            # the page the requests made from now on are made for.
+            self._page_url = url
+            self._blocked_requests = {}
+            self._apply_web_settings()
+
+            strategy = _option('load_strategy')
+            if strategy == 'full':
+                ret = super(TwineBrowser, self).load(url)
+            else:
+                ret = self._load_early(url, strategy)
+            self.invalidate_page()
 
             if ret:
                 if add_to_history and old_url:
@@ -99,38 +258,157 @@ class TwineBrowser(Browser):
 
                 self._http_status = self._http_statuses.get(self.url, "")
                 self._content_type = self._content_types.get(self.url, "")
-                self._title =  self.soup("title").text() or ""
+                self._page_url = self.url
 
                 self._previous_form_values = {}
 
-                self.load_jquery(True)
-
             return ret
         else:
             self.at_empty_page = True
+            self.invalidate_page()
             return True
 
-    def go(self, url):
-        if url:
-            try_urls = [url, ]
-
-            # if this is an absolute URL that is just missing the 'http://' at
-            # the beginning, try fixing that.
-            if url.find('://') == -1:
-                full_url = 'http://%s' % (url,)  # mimic browser behavior
-                try_urls.append(full_url)
-
-            # if this is a '?' or '/' URL, then assume that we want to tack it
-            # onto the end of the current URL.
-            try_urls.append(urlparse.urljoin(self.url, url))
-
-            for u in try_urls:
-                if self.load(u):
-                    return True
+    def set_cache(self, directory, max_size):
+        """
+        Keep a persistent HTTP cache in 'directory', of up to 'max_size'
+        bytes, with Qt's disk cache; see httpcache.
+        """
+        cache = _SharedDiskCache(self, self.manager)
+        cache.setCacheDirectory(os.path.join(directory, 'webkit'))
+        cache.setMaximumCacheSize(max_size)
+        self.manager.setCache(cache)
+        self._cache_enabled = True
+
+    def _apply_web_settings(self):
+        settings = self.webpage.settings()
+        settings.setAttribute(QWebSettings.AutoLoadImages,
+                              make_boolean(_option('load_images')))
+        settings.setAttribute(QWebSettings.PluginsEnabled,
+                              make_boolean(_option('plugins')))
+
+    def _load_early(self, url, strategy, timeout=10):
+        """
+        Start loading 'url', and return as soon as the page's response
+        starts to arrive ('none': its headers, and enough of it to replace
+        the old page) or its DOM is ready ('domready'), leaving the rest of
+        it, images, stylesheets and so on to load in the background.
+        """
+        self._committed = False
+        self._main_response = False
+        self._headers = self.headers[:]
+        self.webpage.mainFrame().load(self.make_request(url))
+
+        start = time.time()
+        while not self._early_load_done(strategy):
+            if self._load_status is not None:   # finished, or failed
+                return self._load_status
+            if time.time() - start > timeout:
+                raise SpynnerTimeout("Timeout reached: %d seconds" % timeout)
+            self._events_loop()
+
+        self._loading_in_background = self._load_status is None
+        return True
+
+    def _early_load_done(self, strategy):
+        # the old page is replaced as soon as the new one's response starts
+        # arriving: for 'none', that's all it takes.
+        if not self._committed:
             return False
-        else:
-            self.load("")
-            return True
+        if strategy == 'none':
+            return self._main_response
+
+        frame = self.webpage.mainFrame()
+        state = toString(frame.evaluateJavaScript("document.readyState"))
+        return state in ('interactive', 'complete')
+
+    def _on_load_started(self):
+        # the main frame is navigating: by load(), a link, a form, a script...
+        self._navigating = True
+
+    def _on_commit(self):
+        # a new document has replaced the old one in the main frame.
+        self._committed = True
+        self._navigating = False
+
+    def _on_page_load_finished(self, successful):
+        self._navigating = False
+
+        # the page may have changed since a 'domready'/'none' load returned.
+        if self._loading_in_background:
+            self._loading_in_background = False
+            self.invalidate_page()
+
+    def _wait_until(self, condition, timeout, what):
+        """
+        Run the Qt event loop until condition() becomes true.  The loop
+        sleeps until something happens (a network reply, a JavaScript
+        timer...), with a timer to wake it up regularly for the timeout
+        and for conditions that depend on time passing.
+        """
+        deadline = time.time() + float(timeout)
+        timer = QtCore.QTimer()
+        timer.start(_wait_interval)
+        try:
+            while not condition():
+                if time.time() > deadline:
+                    raise TwineAssertionError(
+                        "timed out after %g seconds waiting for %s" %
+                        (float(timeout), what))
+                self.application.processEvents(
+                    QtCore.QEventLoop.WaitForMoreEvents)
+        finally:
+            timer.stop()
+            self.invalidate_page()      # the page has (probably) changed
+
+    def _has_element(self, selector):
+        return self._evaluate_javascript(
+            "document.querySelector(%s) !== null" % (json.dumps(selector),))
+
+    def _is_idle(self):
+        # no requests outstanding, and none for a moment: requests often
+        # come in quick succession.
+        return not self._pending_requests and \
+               time.time() - self._idle_since >= _idle_time
+
+    @timed('load')
+    def wait_for_js(self, expression, timeout):
+        """
+        Wait until the JavaScript expression is true in the page.
+        """
+        self._wait_until(lambda: self.evaluate_javascript(expression),
+                         timeout, "'%s' to be true" % (expression,))
+
+    def invalidate_page(self):
+        super(TwineBrowser, self).invalidate_page()
+        self._jquery_loaded = False
+
+    def _ensure_jquery(self):
+        """
+        Inject jQuery into the current page, for the spynner DOM helpers
+        and run_javascript code, unless it's already there.  Pages don't
+        get it on load, so that scripts that never touch the DOM don't pay
+        for it.
+        """
+        if not self._jquery_loaded:
+            self.load_jquery(True)      # checks whether the page has it
+            self._jquery_loaded = True
+
+    def fill(self, selector, value):
+        self._ensure_jquery()
+        return super(TwineBrowser, self).fill(_js_string(selector), value)
+
+    def check(self, selector):
+        self._ensure_jquery()
+        return super(TwineBrowser, self).check(_js_string(selector))
+
+    def uncheck(self, selector):
+        self._ensure_jquery()
+        return super(TwineBrowser, self).uncheck(_js_string(selector))
+
+    def select(self, selector, *args, **kw):
+        self._ensure_jquery()
+        return super(TwineBrowser, self).select(_js_string(selector),
+                                                *args, **kw)
 
     def _on_reply(self, reply):
         super(TwineBrowser, self)._on_reply(reply)
@@ -151,146 +429,206 @@ class TwineBrowser(Browser):
 
         self._content_types[self._reply_url] = content_type
 
+        if self._cache_enabled:
+            from_cache = toString(reply.attribute(
+                QNetworkRequest.SourceIsFromCacheAttribute))
+            if from_cache == 'true':
+                httpcache.stats['hits'] += 1
+            else:
+                httpcache.stats['misses'] += 1
+
+        start = self._request_starts.pop(self._reply_url, None)
+        if tracing.enabled:
+            tracing.async_span(self._reply_url, 'network',
+                               start or time.time(),
+                               dict(url=self._reply_url, status=http_status,
+                                    content_type=content_type))
+
+    def _on_authentication_required(self, reply, authenticator):
+        self._authorized_hosts.add(
+            urlparse.urlsplit(unicode(toString(reply.url()))).netloc)
+        super(TwineBrowser, self)._on_authentication_required(reply,
+                                                              authenticator)
+
+    def _on_main_response(self, reply):
+        # the headers of the main frame's document, or of a redirect; load()
+        # may return before the reply finishes, so note its status now.
+        try:
+            http_status = "%s" % toString(
+            reply.attribute(QNetworkRequest.HttpStatusCodeAttribute))
+        except:
+            http_status = ""
+        if http_status.startswith('3') and http_status != '304':
+            return
+
+        try:
+            content_type = "%s" % toString(
+            reply.header(QNetworkRequest.ContentTypeHeader))
+        except:
+            content_type = ""
+
+        url = unicode(toString(reply.url()))
+        self._http_statuses[url] = http_status
+        self._content_types[url] = content_type
+        self._main_response = True
+
+    def _create_request(self, operation, request, data):
+        """
+        The network manager's createRequest(), wrapped to tell the URL
+        filter which requests are for the main frame's document (until
+        that document is committed, it's all the main frame asks for,
+        redirects included), to watch for that document's response
+        headers, and to count the replies outstanding.
+
+        Every reply is counted, blocked ones (for about:blank) too, until
+        it finishes or is destroyed: aborted replies finish as well.
+        """
+        self._navigation_request = self._navigating and \
+            request.originatingObject() is self._main_frame
+        if request.hasRawHeader('Authorization'):
+            self._authorized_hosts.add(
+                urlparse.urlsplit(unicode(toString(request.url()))).netloc)
+        navigation = self._navigation_request
+        try:
+            reply = self._spynner_create_request(operation, request, data)
+        finally:
+            self._navigation_request = False
+
+        if navigation:
+            reply.metaDataChanged.connect(
+                lambda: self._on_main_response(reply))
+
+        self._pending_requests += 1
+        counted = [True]
+        def finished(*args):            # (destroyed passes the reply)
+            if counted:
+                del counted[:]
+                self._pending_requests -= 1
+                if not self._pending_requests:
+                    self._idle_since = time.time()
+        reply.finished.connect(finished)
+        reply.destroyed.connect(finished)
+        return reply
+
+    def _filter_request(self, operation, url):
+        """
+        spynner URL filter, called for every request the page makes;
+        returns False for the requests the request policy blocks.  The
+        main frame's own navigations are never blocked.
+        """
+        if not self._navigation_request:
+            policy = _request_policy()
+            reason = policy and policy.check(url, self._page_url)
+            if reason:
+                self._blocked_requests[reason] = \
+                    self._blocked_requests.get(reason, 0) + 1
+                return False
+
+        self._request_starts[url] = time.time()
+        return True
+
     def _javascript_console_message(self, message, line, sourceid):
         self.javascript_message = message
         super(TwineBrowser, self)._javascript_console_message(message, line,
                                                               sourceid)
 
-    def run_javascript(self, jscode):
+    @timed('load')
+    def submit(self, *args, **kw):
+        self._ensure_jquery()
+        try:
+            return super(TwineBrowser, self).submit(*args, **kw)
+        finally:
+            self.invalidate_page()
+
+    @timed('dom')
+    def run_javascript(self, jscode, changes_page=True):
+        """
+        Run 'jscode' in the page and return the last console message it
+        logged.  Pass changes_page=False for code that only reads the
+        page, so that the parsed page can be kept.
+        """
+        self._ensure_jquery()
         self.javascript_message = ""
         self.runjs(jscode)
+        if changes_page:
+            self.invalidate_page()
         return self.javascript_message
 
-    def back(self):
-        if self._history:
-            last_page = self._history.pop()
-            self.load(last_page, False)
-            return True
-        else:
-            self.load("")
-            return False
-
-    def find_form(self, formname):
-        try:
-            form_number = int(formname)
-            form_number -= 1
-
-            all_forms = [ i for i in self.soup("form").items() ]
-
-            if len(all_forms) > form_number:
-                form = all_forms[form_number]
-            else:
-                raise TwineAssertionError("no matching forms!")
-
-        except ValueError:
-            all_forms = [ i for i in self.soup("form").items() ]
-
-            form_matches = []
-
-            for i, form in enumerate(all_forms):
-                if form.attr.name == formname:
-                    form_matches.append(form)
-                    form_number = i
-
-            if len(form_matches) > 1:
-                raise TwineAssertionError("multiple form matches")
-            if form_matches:
-                form = form_matches[0]
-            else:
-                raise TwineAssertionError("no matching forms!")
-
-        return (form, form_number)
-
-    def add_previous_form_value(self, form_number, fieldname, value):
-        if form_number not in self._previous_form_values:
-            self._previous_form_values[form_number] = {}
-        self._previous_form_values[form_number][fieldname] = value
-
-    def _formvalue(self, formname, fieldname, value, track_previous_value):
-        form, form_number = self.find_form(formname)
-
+    def evaluate_javascript(self, expressions, changes_page=False):
+        """
+        Evaluate a JavaScript expression, or a list of them, in the page
+        with a single call, and return the (JSON-serializable) result, or
+        the list of results.  Raises TwineException on JavaScript errors.
+        Pass changes_page=True for code that changes the DOM.
+
+        Like run_javascript(), this puts jQuery in the page for scripts
+        that use it.
+        """
+        self._ensure_jquery()
+        return self._evaluate_javascript(expressions, changes_page)
+
+    @timed('dom')
+    def _evaluate_javascript(self, expressions, changes_page=False):
+        # evaluate_javascript(), without jQuery: for twine's own code.
+        single = isinstance(expressions, basestring)
+        if single:
+            expressions = [expressions]
+
+        output = self.webframe.evaluateJavaScript(
+            jsbridge.make_script(expressions))
+        if changes_page:
+            self.invalidate_page()
+
+        results = jsbridge.parse_results(output, expressions)
+        if single:
+            return results[0]
+        return results
+
+    def form_snapshot(self):
+        """
+        Get the live state of every form field with a single JavaScript
+        call, rather than one per field.
+        """
         try:
-            fieldname = int(fieldname)
-            fieldname -= 1
-
-            all_fields = [ i for i in form.find("input").items() ]
-            all_fields.extend([ i for i in form.find("select").items() ])
-            all_fields.extend([ i for i in form.find("textarea").items() ])
-
-            if len(all_fields) > fieldname:
-                field = all_fields[fieldname]
+            return self._evaluate_javascript(_form_snapshot_js)
+        except TwineException:          # e.g. no page
+            return super(TwineBrowser, self).form_snapshot()
+
+    def _fill_fields(self, form_index, assignments):
+        """
+        Apply all of the field changes with a single JavaScript call,
+        rather than one jQuery query per field.
+        """
+        ops = []
+        for tag, field_type, fields, value in assignments:
+            if tag == 'select':
+                kind = 'select'
+            elif tag == 'textarea':
+                kind = 'value'
+            elif field_type == 'checkbox':
+                kind, value = 'checkbox', make_boolean(value)
+            elif field_type == 'radio':
+                kind = 'radio'
+            elif field_type in unfillable_types:
+                continue
             else:
-                raise TwineAssertionError("no field matches \"%d\"" % fieldname)
-
-        except ValueError:
-            for field_tag in ("input", "select", "textarea"):
-                fields = [ i for i in form.find("%s[name=%s]" %
-                    (field_tag, fieldname)).items() ]
-
-                if fields:
-                    matched_field_tag = field_tag
-                    break
-                #if len(fields) > 1:
-                    #raise TwineAssertionError("multiple field matches")
-
-                #if fields:
-                    #field = fields[0]
-                    #matched_field_tag = field_tag
-                    #break
-
-        if not fields:
-            raise TwineAssertionError("no field matches \"%s\"" % fieldname)
-
-        field_type = fields[0].attr.type
-        if len(fields) > 1:
-            for field in fields:
-                if field.attr.type != field_type:
-                    raise TwineAssertionError("field types do not match")
-
-        field = fields[0]
-
-        if matched_field_tag == "input":
-            if field_type == "text" or field_type == "password":
-                if track_previous_value:
-                    self.add_previous_form_value(form_number, fieldname,
-                                                 field.attr.value or "")
-                self.fill("input[name=%s]" % fieldname, value)
-            elif field_type == "checkbox":
-                if track_previous_value:
-                    self.add_previous_form_value(formname, fieldname,
-                                                 field.attr.checked or False)
-                checked = make_boolean(value)
-                if checked:
-                    self.check("input[name=%s]" % fieldname)
-                else:
-                    self.uncheck("input[name=%s]" % fieldname)
-            elif field_type == "radio":
-                if track_previous_value:
-                    self.add_previous_form_value(formname, fieldname,
-                                                 field.attr.value)
-                self.check("input[name=%s][value=%s]" % (fieldname, value,))
-        elif matched_field_tag == "select":
-            # TODO: add to previous form values
-            self.select("option[value=%s]" % value)
-        elif matched_field_tag == "textarea":
-            if track_previous_value:
-                self.add_previous_form_value(formname, fieldname,
-                                             field.attr.value or "")
-            self.fill("textarea[name=%s]" % fieldname, value)
-        else:
-            raise TwineAssertionError("Unknown field tag")
-
-        # Keep track of last form modified
-        self.last_form = formname
+                kind = 'value'
+            ops.append(dict(n=form_index.field_number(fields[0]),
+                            name=fields[0].attr.name, kind=kind, value=value))
 
-    def formvalue(self, formname, fieldname, value):
-        self._formvalue(formname, fieldname, value, True)
-
-    def formclear(self, formname):
-        form, form_number = self.find_form(formname)
-        if form_number not in self._previous_form_values:
+        if not ops:
             return
 
-        for fieldname in self._previous_form_values[form_number]:
-            previous_value = self._previous_form_values[form_number][fieldname]
-            self._formvalue(formname, fieldname, previous_value, False)
+        jscode = _fill_fields_js % (form_index.number, json.dumps(ops))
+        try:
+            applied = self._evaluate_javascript(jscode)
+        except TwineException:
+            applied = None
+        if applied != len(ops):
+            # the live form doesn't match the parsed one; go field by field.
+            super(TwineBrowser, self)._fill_fields(form_index, assignments)
+
+    def set_form_action(self, form_number, action):
+        jscode = "document.forms[%d].setAttribute('action', %s)" % \
+                 (form_number, json.dumps(action))
+        self._evaluate_javascript(jscode, changes_page=True)
@@ -0,0 +1,209 @@
+"""
+Check twine scripts for mistakes without running them ('twine --check').
+
+Scripts are tokenized (through the compiled-script cache) and checked
+against the command registry; no browser is ever created, so checking
+thousands of scripts takes a moment rather than a browser startup each.
+
+The problems reported are:
+
+  * lines that can't be parsed, and unbalanced quotes;
+  * unknown commands, including commands from extension modules that no
+    script loads with 'extend_with', and extension modules that can't be
+    imported;
+  * wrong numbers of arguments, except where a '__var' argument makes the
+    count unknowable before the script runs;
+  * 'runfile' targets that can't be read;
+  * unknown engines in '# twine: engine=...' comments.
+"""
+
+import os
+
+import parse
+import commands
+
+class Problem(object):
+    """
+    A mistake found in a script; 'lineno' is 1-based, or None for problems
+    with the whole file.
+    """
+    def __init__(self, filename, lineno, message):
+        self.filename = filename
+        self.lineno = lineno
+        self.message = message
+
+    def __str__(self):
+        if self.lineno is None:
+            return "%s: %s" % (self.filename, self.message)
+        return "%s:%d: %s" % (self.filename, self.lineno, self.message)
+
+def _is_literal(arg):
+    """
+    Return True if 'arg' has the same value at runtime as in the script.
+    """
+    return not (arg.startswith('$') or arg.startswith('__') or '${' in arg)
+
+class ScriptChecker(object):
+    """
+    Checks a set of scripts.  Extensions loaded by any of the scripts count
+    as loaded for all of them, as they do when the scripts are run one
+    after the other.
+    """
+    def __init__(self):
+        self._scripts = {}              # filename => CompiledScript/IOError
+        self._extensions = {}           # module name => {command: info}
+        self._extension_errors = {}     # module name => error message
+
+    def _load(self, filename):
+        script = self._scripts.get(filename)
+        if script is None:
+            try:
+                script = parse.load_script(filename)
+            except IOError, e:
+                script = e
+            self._scripts[filename] = script
+        return script
+
+    def _load_extension(self, module_name):
+        if module_name in self._extensions or \
+           module_name in self._extension_errors:
+            return
+
+        try:
+            mod = __import__(module_name, {}, {}, ['__name__'])
+        except Exception, e:
+            self._extension_errors[module_name] = \
+                "can't import extension module '%s': %s" % (module_name, e)
+            return
+
+        # same rules as 'extend_with'.
+        fnlist = getattr(mod, '__all__', None)
+        if fnlist is None:
+            fnlist = [ fn for fn in dir(mod) if not fn.startswith('_') and
+                       callable(getattr(mod, fn)) ]
+
+        cmds = {}
+        for name in fnlist:
+            fn = getattr(mod, name, None)
+            if fn is not None:
+                cmds[name] = parse.CommandInfo(name, fn)
+        self._extensions[module_name] = cmds
+
+    def _collect(self, filenames):
+        """
+        Compile 'filenames' and the scripts they 'runfile', loading every
+        extension module they name.
+        """
+        todo = list(filenames)
+        while todo:
+            script = self._load(todo.pop())
+            if isinstance(script, IOError):
+                continue
+
+            for command in script:
+                if command.cmd == 'extend_with' and len(command.args) == 1 \
+                   and _is_literal(command.args[0]):
+                    self._load_extension(command.args[0])
+                elif command.cmd == 'runfile':
+                    for target in command.args:
+                        if _is_literal(target) and \
+                           target not in self._scripts:
+                            todo.append(target)
+
+    def _lookup(self, name):
+        info = parse.command_registry.get(name)
+        if info is None:
+            for cmds in self._extensions.values():
+                info = cmds.get(name)
+                if info is not None:
+                    break
+        return info
+
+    def check_script(self, filename):
+        """
+        Return the list of Problems in one (already collected) script.
+        """
+        script = self._load(filename)
+        if isinstance(script, IOError):
+            return [Problem(filename, None, "can't read script: %s" %
+                            (script.strerror or script,))]
+
+        problems = []
+        def report(command, message):
+            problems.append(Problem(filename, command.lineno + 1, message))
+
+        if script.pragma and script.pragma not in commands._engines:
+            problems.append(Problem(filename, None,
+                                    "unknown engine '%s' in engine comment"
+                                    % (script.pragma,)))
+
+        for command in script:
+            if command.error:
+                report(command, command.error)
+                continue
+            if command.cmd is None:
+                continue
+
+            cmd, args = command.cmd, command.args
+
+            leftover = parse.scan_line(command.line)[2]
+            if leftover[:1] in ('"', "'"):
+                report(command, "unbalanced quote: %s" % (leftover.strip(),))
+            elif leftover.strip():
+                report(command, "ignored text: %s" % (leftover.strip(),))
+
+            info = self._lookup(cmd)
+            if info is None:
+                report(command, "unknown twine command: '%s'" % (cmd,))
+            elif not [ a for a in args if a.startswith('__') ] and \
+                 not info.accepts(len(args)):
+                if info.max_args is None:
+                    expected = "at least %d" % (info.min_args,)
+                elif info.min_args == info.max_args:
+                    expected = "%d" % (info.min_args,)
+                else:
+                    expected = "%d to %d" % (info.min_args, info.max_args)
+                report(command, "'%s' takes %s argument(s), %d given" %
+                       (cmd, expected, len(args)))
+
+            if cmd == 'extend_with' and args and _is_literal(args[0]):
+                error = self._extension_errors.get(args[0])
+                if error:
+                    report(command, error)
+            elif cmd == 'runfile':
+                for target in args:
+                    if _is_literal(target) and \
+                       isinstance(self._load(target), IOError):
+                        report(command, "can't read runfile target '%s'" %
+                               (target,))
+
+        return problems
+
+    def check(self, filenames):
+        """
+        Check the given scripts; returns a list of (filename, problems).
+        """
+        self._collect(filenames)
+        return [ (filename, self.check_script(filename))
+                 for filename in filenames ]
+
+def check_files(filenames, out):
+    """
+    Check the given scripts and report problems to 'out'.  Returns the
+    number of problems found.
+    """
+    results = ScriptChecker().check(filenames)
+
+    n_problems = 0
+    n_bad_files = 0
+    for filename, problems in results:
+        for problem in problems:
+            print>>out, problem
+        if problems:
+            n_problems += len(problems)
+            n_bad_files += 1
+
+    print>>out, '--'
+    print>>out, '%d problem(s) in %d of %d files.' % (n_problems, n_bad_files,
+                                                      len(results))
+    return n_problems
@@ -25,6 +25,12 @@ __all__ = ['get_browser',
            'echo',
            'save_html',
            'sleep',
+           'wait_for',
+           'wait_for_text',
+           'wait_for_js',
+           'wait_for_idle',
+           'block_urls',
+           'unblock_urls',
            'agent',
            'showforms',
            'showlinks',
@@ -63,6 +69,7 @@ __all__ = ['get_browser',
            'info',
            'browse',
            'run_javascript',
+           'eval_javascript',
            'save_screenshot'
            ]
 
@@ -72,28 +79,135 @@ from errors import TwineException, TwineAssertionError
 import utils
 from utils import make_boolean, set_form_control_value, run_tidy
 from namespaces import get_twine_glocals
+from requestpolicy import RequestPolicy, parse_types
+import httpcache
+import visited
 
-from browser import TwineBrowser
-import spynner
-import pyquery
 import urlparse
 
-browser = TwineBrowser(debug_level = spynner.ERROR)
-browser.set_html_parser(pyquery.PyQuery)
+# available browser engines; see the 'engine' config option.  'auto'
+# picks 'http' or 'webkit' for each script, see parse.choose_engine(),
+# and 'http' if webkit isn't installed.
+_engines = ('auto', 'webkit', 'http')
+
+# when 'go' returns with the webkit engine; see the 'load_strategy' option.
+_load_strategies = ('full', 'domready', 'none')
+
+# commands that only work on a JavaScript-capable engine.  Extensions
+# with JavaScript-dependent commands should add them here.
+javascript_commands = ['run_javascript', 'eval_javascript', 'save_screenshot',
+                       'browse', 'wait_for', 'wait_for_text', 'wait_for_js',
+                       'wait_for_idle']
+
+def _make_browser(engine=None):
+    """
+    Create a new browser using the given engine, or the engine selected
+    by the 'engine' option.
+
+    The engines are imported here rather than at the top of the module:
+    spynner pulls in Qt/WebKit, which is by far the slowest part of
+    starting twine, and isn't needed by '--check', '-v' or the http engine.
+    """
+    engine = engine or _options.get('engine')
+    if engine == 'auto':
+        engine = webkit_installed() and 'webkit' or 'http'
+    if engine == 'http':
+        from httpbrowser import HTTPBrowser
+        return HTTPBrowser()
+
+    import spynner
+    import pyquery
+    from browser import TwineBrowser
+
+    b = TwineBrowser(debug_level = spynner.ERROR)
+    b.set_html_parser(pyquery.PyQuery)
+    return b
+
+# whether spynner (and so the webkit engine) is installed; see
+# webkit_installed().
+_webkit_installed = None
+
+def webkit_installed():
+    """
+    Whether the webkit engine can be used.  This only looks for spynner,
+    without importing it (and Qt).
+    """
+    global _webkit_installed
+    import imp
+
+    if _webkit_installed is None:
+        try:
+            imp.find_module('spynner')
+            _webkit_installed = True
+        except ImportError:
+            _webkit_installed = False
+    return _webkit_installed
+
+def _set_up_cache(b):
+    """
+    Give browser 'b' the disk cache selected by the 'cache_dir' and
+    'cache_size' options, if any.
+    """
+    if _options['cache_dir']:
+        max_size = int(float(_options['cache_size']) * 1024 * 1024)
+        b.set_cache(_options['cache_dir'], max_size)
+
+# the current browser, created on first use; see get_browser().
+_browser = None
+
+# the engine requested by the last reset_browser(), or None for the
+# 'engine' option.
+_browser_engine = None
 
 def get_browser():
-    return browser
+    """
+    Return the current browser, creating it if need be.
+    """
+    global _browser
+
+    if _browser is None:
+        _browser = _make_browser(_browser_engine)
+        _set_up_cache(_browser)
+    return _browser
+
+def get_url():
+    """
+    Return the URL of the current page, without creating a browser just
+    to find out that it's empty.
+    """
+    if _browser is None:
+        return ""
+    return _browser.url
+
+class _LazyBrowser(object):
+    """
+    Stand-in for the current browser that creates it on first use.
 
-def reset_browser():
+    Commands and extensions use the module-level 'browser' name; going
+    through get_browser() keeps that working across reset_browser() calls.
     """
-    >> reset_browser
+    def __getattr__(self, name):
+        return getattr(get_browser(), name)
 
-    Reset the browser completely.
+    def __setattr__(self, name, value):
+        setattr(get_browser(), name, value)
+
+def reset_browser(engine=None):
+    """
+    >> reset_browser [<engine>]
+
+    Reset the browser completely.  If <engine> ('webkit' or 'http') is
+    given, the new browser uses it instead of the 'engine' config option.
     """
-    global browser
+    global _browser, _browser_engine
+
+    if engine is not None and engine not in _engines:
+        raise TwineException("unknown engine '%s'; use one of %s" %
+                             (engine, ", ".join(_engines)))
 
-    browser = TwineBrowser(debug_level = spynner.ERROR)
-    browser.set_html_parser(pyquery.PyQuery)
+    # the new browser is only created when something uses it.
+    _browser = None
+    _browser_engine = engine
 
 def exit(code = "0"):
     """
@@ -189,8 +303,8 @@ def follow(what):
     """
     regexp = re.compile(what)
     links = [
-             (l.text or '', l.get("href"))
-             for l in browser.soup("a")
+             (l[0].text or '', l.attr.href or '')
+             for l in browser.page.links
             ]
     found_link = ''
     for link in links:
@@ -327,6 +441,53 @@ def sleep(interval=1):
     """
     time.sleep(float(interval))
 
+def _wait_timeout(timeout):
+    if timeout is None:
+        timeout = _options['wait_timeout']
+    try:
+        return float(timeout)
+    except ValueError:
+        raise TwineException("timeout must be a number of seconds, not '%s'"
+                             % (timeout,))
+
+def wait_for(selector, timeout=None):
+    """
+    >> wait_for <css selector> [<timeout>]
+
+    Wait until an element matching the CSS selector is on the page, e.g.
+    after an AJAX request.  Returns as soon as there is one; fails if
+    there is none after <timeout> seconds (default: the 'wait_timeout'
+    option).
+    """
+    browser.wait_for(selector, _wait_timeout(timeout))
+
+def wait_for_text(regexp, timeout=None):
+    """
+    >> wait_for_text <regexp> [<timeout>]
+
+    Wait until the page HTML matches the regular expression, as 'find'
+    would; see 'wait_for' for the timeout.
+    """
+    browser.wait_for_text(regexp, _wait_timeout(timeout))
+
+def wait_for_js(expression, timeout=None):
+    """
+    >> wait_for_js <expression> [<timeout>]
+
+    Wait until the JavaScript expression is true in the page, e.g.
+    'window.appReady'; see 'wait_for' for the timeout.
+    """
+    browser.wait_for_js(expression, _wait_timeout(timeout))
+
+def wait_for_idle(timeout=None):
+    """
+    >> wait_for_idle [<timeout>]
+
+    Wait until the page has no network requests outstanding (and has had
+    none for half a second); see 'wait_for' for the timeout.
+    """
+    browser.wait_for_idle(_wait_timeout(timeout))
+
 def agent(agent_string):
     """
     >> agent <agent_string>
@@ -358,10 +519,7 @@ def submit(submit_button=None):
     if browser.last_form is None:
         raise TwineAssertionError("No default submit available")
 
-    formname = browser.last_form
-    form, form_number = browser.find_form(browser.last_form)
-
-    submits = [ i for i in form.find("input[type=submit]").items() ]
+    submits = browser.page.find_form(browser.last_form).submits
 
     if not submits:
         raise TwineAssertionError("form has no submit button")
@@ -387,46 +545,43 @@ def _trunc(s, length):
     
     return s
 
+def _list_repr(values):
+    return "[%s]" % (", ".join([ "'%s'" % (v,) for v in values ]),)
+
 def showforms():
     """
     >> showforms
     
     Show all of the forms on the current page.
     """
-    for i, form in enumerate(browser.soup("form").items()):
-        # Group radio fields
-        radio_options = [ f for f in form.find("input").items()
-                          if f.attr.type == "radio" ]
+    # the current state of every form, in one go.
+    for i, form in enumerate(browser.form_snapshot()):
+        fields = form['fields']
 
+        # Group radio fields
         radio_fields = {}
-        for radio_option in radio_options:
-            name = radio_option.attr.name
-            if name in radio_fields:
-                radio_fields[name].append(radio_option.attr.value)
-            else:
-                radio_fields[name] = [radio_option.attr.value]
-
-        if form.attr.name:
-            print>>OUT, "Form name=%s (#%d)" % (form.attr.name, i + 1,)
+        for field in fields:
+            if field['type'] == "radio":
+                radio_fields.setdefault(field['name'], []).append(field)
+
+        if form['name']:
+            print>>OUT, "Form name=%s (#%d)" % (form['name'], i + 1,)
         else:
             print>>OUT, "Form #%d" % (i + 1,)
 
-        # Form fields(input and select)
-        fields = [ i for i in form.find("input").items() ]
-        fields.extend([ i for i in form.find("select").items() ])
-        fields.extend([ i for i in form.find("textarea").items() ])
-
         if fields:
             print>>OUT, "## ## __Name__________________ __Type___ __ID________ __Value__________________"
 
             submit_number = 1
             for j, field in enumerate(fields):
+                field_type = field['type']
+
                 # Skip this field if it's part of a radio group already printed
-                if field.attr.type == "radio" and \
-                   field.attr.name not in radio_fields:
+                if field_type == "radio" and \
+                   field['name'] not in radio_fields:
                        continue
 
-                if field.attr.type == "submit":
+                if field_type == "submit":
                     # Print form number
                     print>>OUT, ("%-2s" % (j + 1,)),
 
@@ -438,70 +593,45 @@ def showforms():
                     print>>OUT, ("%-5s" % (j + 1,)),
 
                 # Print form name
-                print>>OUT, ("%-23s " % (_trunc(field.attr.name, 23),)),
+                print>>OUT, ("%-23s " % (_trunc(field['name'], 23),)),
 
                 # Print form type
-                if field.is_("input"):
-                    if field.attr.type:
-                        print>>OUT, ("%-9s" % (_trunc(field.attr.type, 9))),
+                if field['tag'] == "input":
+                    if field_type:
+                        print>>OUT, ("%-9s" % (_trunc(field_type, 9))),
                     else:
                         print>>OUT, ("%-9s" % "text"),
-                elif field.is_("textarea"):
-                    print>>OUT, ("%-9s" % "textarea"),
-                elif field.is_("select"):
-                    print>>OUT, ("%-9s" % "select"),
+                else:
+                    print>>OUT, ("%-9s" % field['tag']),
 
                 # Print form ID
-                form_id = _trunc(field.attr.id, 12) or "(None)"
+                form_id = _trunc(field['id'], 12) or "(None)"
                 print>>OUT, ("%-12s" % form_id),
 
                 # Print form value, or options
-                if field.is_("select"):
-                    options = field.find("option").items()
-                    option_values = [ o.attr.value
-                                      for o in field.find("option").items() ]
-
-                    # FIX: select names aren't necessarily unique
-                    selector = "select[name=%s]" % field.attr.name
-                    jsc = "console.log($('%s').val())" % selector
-                    selected_option = browser.run_javascript(jsc)
-
-                    value = "['%s'] of %s" % (selected_option, option_values,)
+                if field['tag'] == "select":
+                    option_values = [ o['value'] for o in field['options'] ]
+                    value = "['%s'] of %s" % (field['value'],
+                                              _list_repr(option_values),)
                     print>>OUT, _trunc(value, 40)
-                elif field.is_("textarea"):
-                    # FIX: textarea names aren't necessarily unique
-                    selector = "textarea[name=%s]" % field.attr.name
-                    jsc = "console.log($('%s').val())" % selector
-                    print>>OUT, browser.run_javascript(jsc)
-                else:
-                    if field.attr.type == "submit":
-                        print>>OUT, _trunc(field.attr.value, 40)
-                    elif field.attr.type == "radio":
-                        selector = "input[name=%s]:checked" % field.attr.name
-                        jsc = "console.log($('%s').val())" % selector
-                        selected_option = browser.run_javascript(jsc)
-
-                        radio_values = radio_fields[field.attr.name]
-
-                        value = "['%s'] of %s" % (selected_option,
-                                                  radio_values,)
-                        print>>OUT, _trunc(value, 40)
-
-                        del radio_fields[field.attr.name]
-                    elif field.attr.type == "checkbox":
-                        selector = "input[name=%s]" % field.attr.name
-                        jsc = "console.log($('%s').attr('checked'))" % selector
-                        checked_status = browser.run_javascript(jsc)
-                        if checked_status == "true":
-                            print>>OUT, "checked"
-                        else:
-                            print>>OUT, "unchecked"
-
+                elif field['tag'] == "textarea":
+                    print>>OUT, field['value']
+                elif field_type == "submit":
+                    print>>OUT, _trunc(field['value'], 40)
+                elif field_type == "radio":
+                    radios = radio_fields.pop(field['name'])
+                    checked = [ r['value'] for r in radios if r['checked'] ]
+                    value = "['%s'] of %s" % ("".join(checked[:1]),
+                                              _list_repr([ r['value']
+                                                           for r in radios ]),)
+                    print>>OUT, _trunc(value, 40)
+                elif field_type == "checkbox":
+                    if field['checked']:
+                        print>>OUT, "checked"
                     else:
-                        # FIX: input names aren't necessarily unique
-                        selector = "input[name=%s]" % field.attr.name
-                        jsc = "console.log($('%s').val())" % selector
-                        print>>OUT, browser.run_javascript(jsc)
+                        print>>OUT, "unchecked"
+                else:
+                    print>>OUT, field['value']
 
 def showlinks():
     """
@@ -509,7 +639,7 @@ def showlinks():
     
     Show all of the links on the current page.
     """
-    for n, link in enumerate(browser.soup("a").items()):
+    for n, link in enumerate(browser.page.links):
         print>>OUT, "%d. %s ==> %s" % (n, link.text(), link.attr.href,)
     print>>OUT, ''
 
@@ -580,27 +710,7 @@ def formaction(formname, action):
     Sets action parameter on form to action_url
     """
     form, form_number = browser.find_form(formname)
-    if form.attr.name:
-        jscode = "$('form[name=%s]').attr('action', '%s');" % (form.attr.name,
-                                                               action,)
-        browser.run_javascript(jscode)
-    try:
-        formname = int(formname)
-        formname -= 1
-
-        all_forms = [ i for i in browser.soup("form").items() ]
-
-        if len(all_forms) > formname:
-            form = all_forms[formname]
-        else:
-            raise TwineAssertionError("no matching forms!")
-
-        jscode = "$('form')[%s].attr('action', '%s');" % (str(formname),
-                                                          action,)
-        browser.run_javascript(jscode)
-
-    except ValueError:
-        raise TwineAssertionError("no matching forms!")
+    browser.set_form_action(form_number, action)
 
 fa = formaction
 
@@ -618,7 +728,36 @@ def extend_with(module_name):
     
     Import contents of given module.
     """
-    raise TwineAssertionError("Not yet implemented")
+    import parse, shell
+
+    global_dict, local_dict = get_twine_glocals()
+
+    exec "from %s import *" % (module_name,) in global_dict
+    mod = sys.modules[module_name]
+
+    # find the commands: everything in __all__, or else all public
+    # functions in the module.
+    fnlist = getattr(mod, '__all__', None)
+    if fnlist is None:
+        fnlist = [ fn for fn in dir(mod) if not fn.startswith('_') and
+                   callable(getattr(mod, fn)) ]
+
+    for command in fnlist:
+        fn = getattr(mod, command)
+        parse.register_command(command, fn)
+        shell.add_command(command, fn.__doc__)
+
+    print>>OUT, "Imported extension module '%s'." % (module_name,)
+    print>>OUT, "(at %s)" % (mod.__file__,)
+
+    if shell.interactive:
+        if mod.__doc__:
+            print>>OUT, "\nDescription:\n\n%s\n" % (mod.__doc__.strip(),)
+        elif fnlist:
+            print>>OUT, 'New commands:\n'
+            for name in fnlist:
+                print>>OUT, '\t', name
+            print>>OUT, ''
 
 def getinput(prompt):
     """
@@ -720,7 +859,7 @@ def run_python(cmd):
 
     # set __url__
     local_dict['__cmd__'] = cmd
-    local_dict['__url__'] = commands.browser.url
+    local_dict['__url__'] = commands.get_url()
 
     exec(cmd, global_dict, local_dict)
 
@@ -850,15 +989,31 @@ _orig_options = dict(readonly_controls_writeable=False,
                      require_BeautifulSoup=False,
                      allow_parse_errors=True,
                      with_default_realm=False,
-                     acknowledge_equiv_refresh=True
+                     acknowledge_equiv_refresh=True,
+                     engine='auto',
+                     load_strategy='full',
+                     wait_timeout='10',
+                     block_types='',
+                     block_third_party=False,
+                     load_images=True,
+                     plugins=False,
+                     cache_dir='',
+                     cache_size='50',
+                     link_cache_ttl='86400',
+                     recheck_links=False,
+                     visited_store='memory',
+                     visited_capacity='1000000',
+                     visited_error_rate='0.001'
                      )
 
 _options = {}
 _options.update(_orig_options)
 
+browser = _LazyBrowser()
+
 def config(key=None, value=None):
     """
-    >> config [<key> [<int value>]]
+    >> config [<key> [<value>]]
 
     Configure/report various options.  If no <value> is given, report
     the current key value; if no <key> given, report current settings.
@@ -866,6 +1021,34 @@ def config(key=None, value=None):
     So far:
 
      * 'acknowledge_equiv_refresh', default 1 -- follow HTTP-EQUIV=REFRESH
+     * 'engine', default auto -- browser engine: 'webkit', 'http' (no
+       JavaScript), or 'auto' to pick one per script
+     * 'load_strategy', default full -- when page loads return with the
+       webkit engine: 'full' once everything (images, scripts...) has
+       loaded, 'domready' once the DOM is ready, or 'none' as soon as the
+       page's response starts to arrive; the rest keeps loading in the
+       background
+     * 'wait_timeout', default 10 -- seconds the 'wait_for' commands wait
+     * 'block_types', default none -- comma-separated types of resources
+       (image, font, media, stylesheet, script) the webkit engine doesn't
+       fetch for pages; see also 'block_urls'
+     * 'block_third_party', default 0 -- don't fetch resources from other
+       sites than the page's (webkit)
+     * 'load_images', default 1 -- let webkit load images at all
+     * 'plugins', default 0 -- enable browser plugins (webkit)
+     * 'cache_dir', default none -- keep an HTTP cache in this directory,
+       shared by every browser and twine process that uses it
+     * 'cache_size', default 50 -- maximum size of the cache, in megabytes
+     * 'link_cache_ttl', default 86400 -- seconds before link checkers
+       recheck a good link remembered in the cache directory
+     * 'recheck_links', default 0 -- ignore remembered link checks
+     * 'visited_store', default memory -- how link checkers remember the
+       links they checked: 'memory', 'sqlite' (on disk) or 'bloom' (a
+       Bloom filter, of fixed size)
+     * 'visited_capacity', default 1000000 -- links the Bloom filter is
+       sized for
+     * 'visited_error_rate', default 0.001 -- share of unchecked links the
+       Bloom filter may take for checked ones, at its capacity
      * 'readonly_controls_writeable', default 0 -- make ro controls writeable
      * 'require_tidy', default 0 -- *require* that tidy be installed
      * 'use_BeautifulSoup', default 1 -- use the BeautifulSoup parser
@@ -894,9 +1077,109 @@ def config(key=None, value=None):
             print>>OUT, 'key %s: value %s' % (key, v)
             print>>OUT, ''
         else:
-            value = make_boolean(value)
+            if isinstance(v, bool):
+                value = make_boolean(value)
+            elif key == 'engine' and value not in _engines:
+                raise TwineException("unknown engine '%s'; use one of %s" %
+                                     (value, ", ".join(_engines)))
+            elif key == 'cache_size':
+                try:
+                    float(value)
+                except ValueError:
+                    raise TwineException("cache_size must be a number of "
+                                         "megabytes, not '%s'" % (value,))
+            elif key == 'visited_store' and value not in visited.store_kinds:
+                raise TwineException("unknown visited store '%s'; use one "
+                                     "of %s" % (value,
+                                                ", ".join(visited.store_kinds)))
+            elif key == 'visited_capacity':
+                try:
+                    if int(value) < 1:
+                        raise ValueError
+                except ValueError:
+                    raise TwineException("visited_capacity must be a "
+                                         "positive number, not '%s'" % (value,))
+            elif key == 'visited_error_rate':
+                try:
+                    if not 0 < float(value) < 1:
+                        raise ValueError
+                except ValueError:
+                    raise TwineException("visited_error_rate must be "
+                                         "between 0 and 1, not '%s'" % (value,))
+            elif key == 'link_cache_ttl':
+                try:
+                    float(value)
+                except ValueError:
+                    raise TwineException("link_cache_ttl must be a number of "
+                                         "seconds, not '%s'" % (value,))
+            elif key == 'block_types':
+                try:
+                    value = ",".join(parse_types(value))
+                except ValueError, e:
+                    raise TwineException(str(e))
+            elif key == 'load_strategy' and value not in _load_strategies:
+                raise TwineException("unknown load strategy '%s'; use one "
+                                     "of %s" % (value,
+                                                ", ".join(_load_strategies)))
             _options[key] = value
 
+            _reset_request_policy()
+
+            # a new engine (or cache) means a new browser.
+            if key in ('engine', 'cache_dir', 'cache_size') and value != v:
+                reset_browser()
+
+# regular expressions given to 'block_urls'.
+_blocked_urls = []
+
+# the RequestPolicy built from the options and _blocked_urls, or None if
+# it needs (re)building.
+_request_policy = None
+
+def request_policy():
+    """
+    Return the RequestPolicy for the current 'block_*' options and the
+    'block_urls' patterns.
+    """
+    global _request_policy
+
+    if _request_policy is None:
+        _request_policy = RequestPolicy(parse_types(_options['block_types']),
+                                        _blocked_urls,
+                                        _options['block_third_party'])
+    return _request_policy
+
+def _reset_request_policy():
+    global _request_policy
+    _request_policy = None
+
+def block_urls(regexp):
+    """
+    >> block_urls <regexp>
+
+    Don't fetch any resource pages ask for (images, scripts, frames...)
+    whose URL matches the regular expression; for the webkit engine,
+    which would otherwise fetch everything.  'info' reports how many
+    requests were blocked.  See also the 'block_types' and
+    'block_third_party' config options, and 'unblock_urls'.
+    """
+    try:
+        re.compile(regexp)
+    except re.error, e:
+        raise TwineException("bad regular expression '%s': %s" % (regexp, e))
+
+    _blocked_urls.append(regexp)
+    _reset_request_policy()
+
+def unblock_urls():
+    """
+    >> unblock_urls
+
+    Forget all of the URL patterns given to 'block_urls'.
+    """
+    del _blocked_urls[:]
+    _reset_request_policy()
+
 def info():
     """
     >> info
@@ -930,10 +1213,20 @@ def info():
         title = browser.title
         print >>OUT, '\tPage title:', title
 
-        form_count = len(browser.soup("form"))
+        form_count = len(browser.page.forms)
         if form_count:
             print >>OUT, '\tThis page contains %d form(s)' % (form_count,)
 
+    if _options['cache_dir']:
+        print >>OUT, '\tHTTP cache:', httpcache.format_stats()
+
+    blocked = browser.blocked_requests
+    if blocked:
+        print >>OUT, '\tBlocked requests: %d (%s)' % \
+              (sum(blocked.values()),
+               ", ".join([ "%s %d" % (reason, n)
+                           for reason, n in sorted(blocked.items()) ]))
+
     print >>OUT, ''
 
 def browse():
@@ -955,6 +1248,31 @@ def run_javascript(code):
     if output:
         print "Javascript console:", output
 
+def eval_javascript(*expressions):
+    """
+    >> eval_javascript <expression> [<expression> ...]
+
+    Evaluates JavaScript expressions in the page, all in one go, and sets
+    __js__ to the result: the value of the expression, or a list of values
+    if several are given.  Values must be JSON-serializable (strings,
+    numbers, booleans, null, arrays and plain objects).
+    """
+    if not expressions:
+        raise TwineAssertionError("eval_javascript needs an expression")
+
+    if len(expressions) == 1:
+        result = browser.evaluate_javascript(expressions[0],
+                                             changes_page=True)
+    else:
+        result = browser.evaluate_javascript(list(expressions),
+                                             changes_page=True)
+
+    print>>OUT, '==> %r' % (result,)
+
+    global_dict, local_dict = get_twine_glocals()
+    local_dict['__js__'] = result
+    return result
+
 def save_screenshot(filename):
     """
     >> save_screenshot <filename>
@@ -0,0 +1,273 @@
+"""
+Compiled twine scripts, and the in-memory/on-disk cache that keeps them.
+
+A compiled script is the list of commands in a script file, each with its
+line number and already-tokenized arguments.  Compiled scripts are cached
+in memory and in a '__twinecache__' directory next to the script, keyed by
+the script's path, modification time and the twine version, so scripts
+that are run over and over (by 'runfile', 'csv_iterate', or nightly runs)
+are only tokenized once.
+
+Arguments are further compiled into Argument templates, whose '$var',
+'__var' and '${expr}' parts are turned into code objects once per process
+rather than being re-evaluated from source text on every execution.
+"""
+
+import os
+import re
+import cPickle
+
+CACHE_DIR = '__twinecache__'
+
+# set to False to stop reading & writing compiled scripts on disk.
+use_disk_cache = True
+
+class Command(object):
+    """
+    One non-empty line of a script.
+
+    'cmd' is None for comments.  If the line could not be parsed, 'error'
+    holds the parse error message, to be raised when execution gets there.
+    """
+    __slots__ = ('lineno', 'line', 'cmd', 'args', 'error', '_templates')
+
+    def __init__(self, lineno, line, cmd, args, error=None):
+        self.lineno = lineno
+        self.line = line
+        self.cmd = cmd
+        self.args = args
+        self.error = error
+        self._templates = None
+
+    def __getstate__(self):
+        return (self.lineno, self.line, self.cmd, self.args, self.error)
+
+    def __setstate__(self, state):
+        self.lineno, self.line, self.cmd, self.args, self.error = state
+        self._templates = None
+
+    @property
+    def templates(self):
+        """
+        The Argument templates for this command's arguments.
+        """
+        if self._templates is None:
+            self._templates = [ get_argument(arg) for arg in self.args ]
+        return self._templates
+
+class CompiledScript(object):
+    """
+    A tokenized script: its source name, its commands, and the engine
+    named by an engine pragma comment (or None).
+    """
+    def __init__(self, source, commands, pragma=None):
+        self.source = source
+        self.commands = commands
+        self.pragma = pragma
+
+    def __iter__(self):
+        return iter(self.commands)
+
+    def __len__(self):
+        return len(self.commands)
+
+###
+
+variable_expression = re.compile("\${(.*?)}")
+
+def _compile_expression(source):
+    """
+    Compile a Python expression, or return the error compile() raises;
+    like other evaluation errors, that's only raised when the argument
+    is expanded.
+    """
+    try:
+        return compile(source, '<argument>', 'eval')
+    except (SyntaxError, TypeError), e:
+        return e
+
+def _evaluate(code, globals_dict, locals_dict):
+    if isinstance(code, Exception):
+        raise code
+    return eval(code, globals_dict, locals_dict)
+
+class Argument(object):
+    """
+    A compiled script argument.  Expansion follows these rules:
+
+      * '__name' evaluates to the value of '__name'; a list value is
+        spliced into the arguments.
+      * '$name' evaluates to the value of 'name' (any Python expression).
+      * otherwise, each '${expr}' in the argument is replaced by the value
+        of 'expr'.
+
+    Names that aren't defined are left alone, and '\\n' becomes a newline.
+    """
+    __slots__ = ('text', 'kind', 'code', 'parts')
+
+    def __init__(self, text):
+        self.text = text
+        self.code = None
+        self.parts = None
+
+        if text.startswith('__'):
+            self.kind = 'splice'
+            self.code = _compile_expression(text)
+        elif text.startswith('$') and not text.startswith('${'):
+            self.kind = 'value'
+            self.code = _compile_expression(text[1:])
+        elif variable_expression.search(text):
+            self.kind = 'substitute'
+            self.parts = []
+            pos = 0
+            for m in variable_expression.finditer(text):
+                self.parts.append((text[pos:m.start()], None))
+                self.parts.append((m.group(),
+                                   _compile_expression(m.group(1))))
+                pos = m.end()
+            self.parts.append((text[pos:], None))
+        else:
+            self.kind = 'constant'
+            self.text = text.replace('\\n', '\n')
+
+    def expand(self, globals_dict, locals_dict, newargs):
+        """
+        Append the value(s) of this argument to the list 'newargs'.
+        """
+        kind = self.kind
+        if kind == 'constant':
+            newargs.append(self.text)
+        elif kind == 'substitute':
+            s = ''
+            for text, code in self.parts:
+                if code is None:
+                    s = s + text
+                else:
+                    try:
+                        s = s + _evaluate(code, globals_dict, locals_dict)
+                    except NameError:
+                        s = s + text
+            newargs.append(s.replace('\\n', '\n'))
+        else:
+            try:
+                val = _evaluate(self.code, globals_dict, locals_dict)
+            except NameError:           # not in dictionary; don't interpret.
+                val = self.text
+
+            if kind == 'value' or isinstance(val, str) or \
+               isinstance(val, unicode):
+                newargs.append(val.replace('\\n', '\n'))
+            else:
+                newargs.extend([ i.replace('\\n', '\n') for i in val ])
+
+_argument_cache = {}                    # argument text => Argument
+
+def get_argument(text):
+    """
+    Return the (shared) Argument template for the argument text 'text'.
+    """
+    arg = _argument_cache.get(text)
+    if arg is None:
+        if len(_argument_cache) > 10000:
+            _argument_cache.clear()
+        arg = _argument_cache[text] = Argument(text)
+    return arg
+
+###
+
+_memory_cache = {}                      # abspath => (stamp, CompiledScript)
+
+def _version():
+    import twine
+    return twine.__version__
+
+def _stamp(filename):
+    """
+    Everything a cached compile of 'filename' depends on.
+    """
+    st = os.stat(filename)
+    return (st.st_mtime, st.st_size, _version())
+
+def _cache_filename(path):
+    dirname, basename = os.path.split(path)
+    return os.path.join(dirname, CACHE_DIR,
+                        '%s.twine-%s.pickle' % (basename, _version()))
+
+def get(filename):
+    """
+    Return the cached CompiledScript for 'filename', or None if there is
+    no up-to-date compiled version of it.
+    """
+    path = os.path.abspath(filename)
+    try:
+        stamp = _stamp(path)
+    except OSError:
+        return None
+
+    cached = _memory_cache.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    if not use_disk_cache:
+        return None
+
+    try:
+        fp = open(_cache_filename(path), 'rb')
+        try:
+            cached_stamp, script = cPickle.load(fp)
+        finally:
+            fp.close()
+    except Exception:                   # missing, unreadable or stale format
+        return None
+
+    if cached_stamp != stamp:
+        return None
+
+    _memory_cache[path] = (stamp, script)
+    return script
+
+def put(filename, script):
+    """
+    Cache the CompiledScript 'script' for 'filename'.
+    """
+    path = os.path.abspath(filename)
+    try:
+        stamp = _stamp(path)
+    except OSError:
+        return
+
+    _memory_cache[path] = (stamp, script)
+
+    if not use_disk_cache:
+        return
+
+    # write to a temporary file and rename it into place, so that parallel
+    # twine processes never see a half-written cache file.
+    cache_filename = _cache_filename(path)
+    tmp_filename = '%s.%d.tmp' % (cache_filename, os.getpid())
+    try:
+        cache_dir = os.path.dirname(cache_filename)
+        if not os.path.isdir(cache_dir):
+            try:
+                os.mkdir(cache_dir)
+            except OSError:             # another process may have beaten us
+                if not os.path.isdir(cache_dir):
+                    raise
+
+        fp = open(tmp_filename, 'wb')
+        try:
+            cPickle.dump((stamp, script), fp, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            fp.close()
+        os.rename(tmp_filename, cache_filename)
+    except (IOError, OSError):          # e.g. read-only script directory
+        try:
+            os.unlink(tmp_filename)
+        except OSError:
+            pass
+
+def clear():
+    """
+    Forget all compiled scripts held in memory.
+    """
+    _memory_cache.clear()
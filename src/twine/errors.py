@@ -15,3 +15,9 @@ class TwineNameError(TwineException):
     Error to raise when an unknown command is called.
     """
     pass
+
+class TwineParseError(TwineException):
+    """
+    Error to raise when a line of a twine script cannot be parsed.
+    """
+    pass
@@ -20,21 +20,72 @@ __all__ = ['check_links', 'report_bad_links']
 DEBUG=True
 
 import re
+import urlparse
 from twine import commands
 from twine.errors import TwineAssertionError
 
 ### first, set up config options & persistent 'bad links' memory...
 
-if commands._options.get('check_links.only_collection_bad_links') is None:
+if commands._options.get('check_links.only_collect_bad_links') is None:
     commands._options['check_links.only_collect_bad_links'] = False
 
+# how many links to check at once, and how long to wait for each.
+if commands._options.get('check_links.workers') is None:
+    commands._options['check_links.workers'] = '8'
+if commands._options.get('check_links.timeout') is None:
+    commands._options['check_links.timeout'] = '10'
+
+def workers_option():
+    """
+    The 'check_links.workers' option, as a number of threads (at least 1).
+    """
+    return max(1, int(commands._options['check_links.workers']))
+
 bad_links_dict = {}
 
+# links checked successfully by check_links calls without a 'visited'
+# set of their own; see twine.visited.
+_visited = None
+
+def collect_urls(page, base_url, regexp=None, verbose=None):
+    """
+    Return the unique absolute HTTP URLs linked to from 'page' (a
+    PageModel of the page at 'base_url'), matching 'regexp', if given,
+    in document order.
+    """
+    if verbose is None:
+        verbose = DEBUG
+    OUT = commands.OUT
+
+    collected_urls = []
+    for link in page.links:
+        href = link.attr.href
+        if not href:
+            continue
+        url = urlparse.urljoin(base_url, href.strip())
+        url = url.split('#', 1)[0]      # get rid of subpage pointers
+
+        if not (url.startswith('http://') or url.startswith('https://')):
+            if verbose:
+               print>>OUT, "url '%s' is not an HTTP link; ignoring" % (url,)
+            continue
+
+        if regexp and not regexp.search(url):
+            if verbose:
+                print>>OUT, "URL %s doesn't match regexp" % (url,)
+            continue
+
+        if url not in collected_urls:
+            collected_urls.append(url)
+            if verbose:
+                print>>OUT, "Gathered URL %s." % (url,)
+    return collected_urls
+
 #
 # main function: 'check_links'
 #
 
-def check_links(pattern = '', visited={}):
+def check_links(pattern = '', visited=None):
     """
     >> check_links [ <pattern> ]
 
@@ -45,107 +96,97 @@ def check_links(pattern = '', visited={}):
 
         check_links http://.*\.google\.com
 
-    would check only links to google URLs.  Note that because 'follow'
-    is used to visit the pages, the referrer URL is properly set on the
-    visit.
+    would check only links to google URLs.  Links that were checked
+    successfully before aren't checked again (see 'visited_store' in
+    'config').
+
+    The links are checked concurrently ('config check_links.workers',
+    default 8), with HEAD requests (or GET, if HEAD fails) that carry the
+    browser's cookies and extra headers, and the current page as the
+    referrer.  The browser stays on the current page.
+
+    With a cache directory ('twine --cache DIR'), good links are
+    remembered across runs; see 'link_cache_ttl' and 'recheck_links'
+    in 'config'.
     """
-    from twine import commands
+    global _visited
+    from twine import linkcheck
+    from twine.visited import store_from_options
+
+    if visited is None:
+        if _visited is None:
+            _visited = store_from_options()
+        visited = _visited
 
     if DEBUG:
         print 'in check_links'
     
     OUT = commands.OUT
-    browser = commands.browser
+    browser = commands.get_browser()
 
-    #
-    # compile the regexp
-    #
-    
     regexp = None
     if pattern:
         regexp = re.compile(pattern)
 
-    #
-    # iterate over all links, collecting those that match.
-    #
-    # note that in the case of duplicate URLs, only one of the
-    # links is actually followed!
-    #
-
-    collected_urls = {}
-
-    links = list(browser._browser.links())
-    if not links:
+    collected_urls = collect_urls(browser.page, browser.url, regexp)
+    if not collected_urls:
         if DEBUG:
             print>>OUT, "no links to check!?"
         return
-        
-    for link in links:
-        url = link.absolute_url
-        url = url.split('#', 1)[0]      # get rid of subpage pointers
 
-        if not (url.startswith('http://') or url.startswith('https://')):
-            if DEBUG:
-               print>>OUT, "url '%s' is not an HTTP link; ignoring" % (url,)
-            continue
-
-        if regexp:
-            if regexp.search(url):
-                collected_urls[url] = link
-                if DEBUG:
-                    print>>OUT, "Gathered URL %s -- matched regexp" % (url,)
-            elif DEBUG:
-                print>>OUT, "URL %s doesn't match regexp" % (url,)
-        else:
-            collected_urls[url] = link
-            if DEBUG:
-                print>>OUT, "Gathered URL %s." % (url,)
+    to_check = [ url for url in collected_urls if url not in visited ]
+    if DEBUG:
+        for url in collected_urls:
+            if url in visited:
+                print>>OUT, "Trying %s (already visited successfully)" % (url,)
 
     #
-    # now, for each unique URL, follow the link. Trap ALL exceptions
-    # as failures.
+    # now check each unique URL; anything but a 200 is a failure.
     #
 
+    workers = workers_option()
+    timeout = float(commands._options['check_links.timeout'])
+    session = linkcheck.session_for_browser(browser, workers)
+
     failed = []
-    for link in collected_urls.values():
-        went = False
-        try:
+    cache = linkcheck.link_cache()
+    recheck = commands._options['recheck_links']
+    for result in linkcheck.check_urls(session, to_check, browser.url,
+                                       workers, timeout, cache, recheck):
+        if result.ok:
+            visited.add(result.url)
             if DEBUG:
-                print>>OUT, "Trying %s" % (link.absolute_url,),
-                
-            if not visited.has_key(link.absolute_url):
-                went = True
-                browser.follow_link(link)
-                
-                code = browser.get_code()
-                assert code == 200
-
-                visited[link.absolute_url] = 1
-                
-                if DEBUG:
-                    print>>OUT, '...success!'
-            else:
-                if DEBUG:
-                    print>>OUT, ' (already visited successfully)'
-        except:
-            failed.append(link.absolute_url)
+                print>>OUT, "Trying %s ...success!%s" % \
+                      (result.url, result.cached and " (cached)" or "")
+        else:
+            failed.append(result.url)
             if DEBUG:
-                print>>OUT, '...failure ;('
+                print>>OUT, "Trying %s ...failure ;( (%s)" % \
+                      (result.url, result.error or result.status)
 
-        if went:
-            browser.back()
+    # report in page order, not in the order the checks finished.
+    failed.sort(key=collected_urls.index)
 
     if failed:
-        if commands._options['check_links.only_collect_bad_links']:
-            for l in failed:
-                refering_pages = bad_links_dict.get(l, [])
-                print '***', browser.get_url()
-                refering_pages.append(browser.get_url())
-                bad_links_dict[l] = refering_pages
-        else:
-            print>>OUT, '\nCould not follow %d links' % (len(failed),)
-            print>>OUT, '\t%s\n' % '\n\t'.join(failed)
-            raise TwineAssertionError("broken links on page")
+        record_bad_links(failed, browser.url, "broken links on page")
+
+def record_bad_links(failed, referring_page, message):
+    """
+    Deal with the links in 'failed', found on 'referring_page': collect
+    them for 'report_bad_links' if 'check_links.only_collect_bad_links'
+    is set, or else list them and fail with 'message'.
+    """
+    OUT = commands.OUT
+
+    if commands._options['check_links.only_collect_bad_links']:
+        for l in failed:
+            refering_pages = bad_links_dict.get(l, [])
+            refering_pages.append(referring_page)
+            bad_links_dict[l] = refering_pages
+    else:
+        print>>OUT, '\nCould not follow %d links' % (len(failed),)
+        print>>OUT, '\t%s\n' % '\n\t'.join(failed)
+        raise TwineAssertionError(message)
 
 def report_bad_links(fail_if_exist='+', flush_bad_links='+'):
     """
@@ -153,7 +194,7 @@ def report_bad_links(fail_if_exist='+', flush_bad_links='+'):
 
     Report all of the links collected across check_links runs (collected
     if and only if the config option check_links.only_collect_bad_links
-    is set).
+    is set), and how many link checks the link cache saved.
 
     If <fail-if-exist> is false (true by default) then the command will
     fail after reporting any bad links.
@@ -167,9 +208,12 @@ def report_bad_links(fail_if_exist='+', flush_bad_links='+'):
     fail_if_exist = utils.make_boolean(fail_if_exist)
     flush_bad_links = utils.make_boolean(flush_bad_links)
 
-    from twine import commands
+    from twine import commands, linkcheck
     OUT = commands.OUT
 
+    if linkcheck.link_cache() is not None:
+        print>>OUT, '\nLink cache: %s' % (linkcheck.format_stats(),)
+
     if not bad_links_dict:
         print>>OUT, '\nNo bad links to report.\n'
     else:
@@ -0,0 +1,295 @@
+"""
+Extension function to crawl a site and record the status of every page.
+
+Usage:
+
+   crawl <start_url> [ <depth> [ <pattern> ] ]
+
+Visit the pages reachable from 'start_url', breadth first, up to 'depth'
+links away, and write a line of JSON per page to the file given by the
+'crawl.output' option (default 'crawl.jsonl'):
+
+   {"url": ..., "status": 200, "referrer": ..., "depth": 1,
+    "time": 0.042, "bytes": 5120, "error": null}
+
+Only pages on the start URL's host are crawled, or, if 'pattern' is
+given, pages whose URL matches that regular expression.
+
+Pages are fetched by 'crawl.workers' threads (default 8), with at most
+'crawl.per_host' (default 2) at a time from any one host.  They're
+fetched with the browser's cookies and extra headers; the browser
+itself stays on its page.
+
+The crawl frontier -- every URL found, and whether it's been fetched --
+is kept in an SQLite database, 'crawl.state' (default 'crawl.db').  If a
+crawl is interrupted, running 'crawl' again with the same state file
+carries on where it stopped, appending to the output (and skipping the
+pages already written to it).  The state file is removed once the crawl
+is complete.
+"""
+
+__all__ = ['crawl']
+
+import os
+import re
+import time
+import urlparse
+from twine import commands
+
+### config options
+
+for _key, _value in (('crawl.workers', '8'),
+                     ('crawl.per_host', '2'),
+                     ('crawl.timeout', '10'),
+                     ('crawl.state', 'crawl.db'),
+                     ('crawl.output', 'crawl.jsonl')):
+    if commands._options.get(_key) is None:
+        commands._options[_key] = _value
+
+# the most of a page to read, looking for links.
+max_page_size = 5 * 1024 * 1024
+
+class Frontier(object):
+    """
+    The URLs of a crawl, by canonical URL, with how far they are from the
+    start, where they were found, and whether they've been fetched
+    ('pending', 'active' or 'done'), in the SQLite database at 'path'.
+    """
+    def __init__(self, path):
+        import sqlite3
+
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS frontier ("
+                        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                        "url TEXT UNIQUE, host TEXT, depth INTEGER, "
+                        "referrer TEXT, state TEXT)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS frontier_state "
+                        "ON frontier (state, depth, id)")
+        # fetches cut short by an interruption start again.
+        self.db.execute("UPDATE frontier SET state = 'pending' "
+                        "WHERE state = 'active'")
+        self.db.commit()
+
+    def add(self, url, depth, referrer):
+        """
+        Add 'url' if it's new; returns whether it was.
+        """
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO frontier (url, host, depth, referrer, "
+            "state) VALUES (?, ?, ?, ?, 'pending')",
+            (url, urlparse.urlsplit(url).netloc, depth, referrer))
+        return cursor.rowcount == 1
+
+    def pending(self, n, busy_hosts=()):
+        """
+        Return up to 'n' pending URLs, nearest first, from hosts not in
+        'busy_hosts', as [(url, host, depth, referrer)].
+        """
+        busy_hosts = list(busy_hosts)
+        query = "SELECT url, host, depth, referrer FROM frontier " \
+                "WHERE state = 'pending'"
+        if busy_hosts:
+            query += " AND host NOT IN (%s)" % ",".join("?" * len(busy_hosts))
+        query += " ORDER BY depth, id LIMIT ?"
+        return self.db.execute(query, busy_hosts + [n]).fetchall()
+
+    def start(self, url):
+        self.db.execute("UPDATE frontier SET state = 'active' WHERE url = ?",
+                        (url,))
+
+    def done(self, url):
+        self.db.execute("UPDATE frontier SET state = 'done' WHERE url = ?",
+                        (url,))
+
+    def commit(self):
+        self.db.commit()
+
+    def count(self, state=None):
+        if state is None:
+            return self.db.execute("SELECT COUNT(*) FROM frontier"
+                                   ).fetchone()[0]
+        return self.db.execute("SELECT COUNT(*) FROM frontier "
+                               "WHERE state = ?", (state,)).fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+def _fetch(session, url, timeout):
+    """
+    GET 'url'; returns (status, bytes, seconds, error, links), with the
+    links of HTML pages.  Trap ALL exceptions as failures: this runs in
+    a worker thread.
+    """
+    from lxml import html as lxml_html
+    import pyquery
+    from twine.page import PageModel
+    from check_links import collect_urls
+
+    start = time.time()
+    try:
+        response = session.get(url, timeout=timeout, stream=True)
+        try:
+            content = response.raw.read(max_page_size, decode_content=True)
+            size = len(content)
+            if response.raw.read(1):    # too big to read it all
+                size = int(response.headers.get('content-length') or size)
+        finally:
+            response.close()
+        elapsed = time.time() - start
+
+        links = []
+        if response.status_code == 200 and content.strip() and \
+           'html' in response.headers.get('content-type', ''):
+            doc = lxml_html.document_fromstring(content,
+                                                base_url=response.url)
+            page = PageModel(pyquery.PyQuery(doc))
+            links = collect_urls(page, response.url, verbose=False)
+    except Exception, e:
+        return None, 0, time.time() - start, \
+               str(e) or e.__class__.__name__, []
+
+    return response.status_code, size, elapsed, None, links
+
+def _written_urls(path):
+    """
+    Return the set of URLs already in the crawl output at 'path', so that
+    a resumed crawl doesn't write them twice.  A line cut short by the
+    interruption is ignored.
+    """
+    import json
+
+    urls = set()
+    if not os.path.exists(path):
+        return urls
+    for line in open(path):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and record.get('url'):
+            urls.add(record['url'])
+    return urls
+
+def crawl(start_url, depth='2', pattern=''):
+    """
+    >> crawl <start_url> [ <depth> [ <pattern> ] ]
+
+    Crawl the pages reachable from 'start_url' up to 'depth' links away
+    (default 2), writing their status to the 'crawl.output' file as JSON
+    lines.  If 'pattern' is given, crawl the URLs that match that regular
+    expression instead of those on the start URL's host.
+
+    An interrupted crawl carries on where it stopped when run again; see
+    the 'crawl' extension module for the options.
+    """
+    import json
+    from multiprocessing.pool import ThreadPool
+    from Queue import Queue
+    from twine import linkcheck
+    from twine.visited import normalize_url
+
+    OUT = commands.OUT
+    browser = commands.get_browser()
+    options = commands._options
+
+    max_depth = int(depth)
+    workers = max(1, int(options['crawl.workers']))
+    per_host = max(1, int(options['crawl.per_host']))
+    timeout = float(options['crawl.timeout'])
+
+    start_url = normalize_url(urlparse.urljoin(browser.url, start_url))
+    if pattern:
+        regexp = re.compile(pattern)
+        in_scope = lambda url: regexp.search(url)
+    else:
+        start_host = urlparse.urlsplit(start_url).netloc
+        in_scope = lambda url: urlparse.urlsplit(url).netloc == start_host
+
+    resuming = os.path.exists(options['crawl.state'])
+    frontier = Frontier(options['crawl.state'])
+    frontier.add(start_url, 0, None)
+    frontier.commit()
+    written = set()
+    if resuming:
+        print>>OUT, 'resuming crawl: %d of %d pages done' % \
+              (frontier.count('done'), frontier.count())
+        # pages written out, but interrupted before they were marked done.
+        written = _written_urls(options['crawl.output'])
+
+    output = open(options['crawl.output'], resuming and 'a+' or 'w')
+    if resuming and os.path.getsize(options['crawl.output']):
+        output.seek(-1, 2)
+        if output.read(1) != '\n':     # the last line was cut short
+            output.write('\n')
+    session = linkcheck.session_for_browser(browser, workers)
+    finished = Queue()
+    active = {}                         # host => fetches in progress
+    pool = ThreadPool(workers)
+
+    def start(url, host, depth, referrer):
+        def fetch():
+            # always post a result, or the loop below waits for it forever.
+            try:
+                result = _fetch(session, url, timeout)
+            except Exception, e:
+                result = None, 0, 0.0, str(e) or e.__class__.__name__, []
+            finished.put((url, host, depth, referrer, result))
+        frontier.start(url)
+        active[host] = active.get(host, 0) + 1
+        pool.apply_async(fetch)
+
+    crawled = bad = 0
+    try:
+        while True:
+            # start as many fetches as the limits allow...
+            n_active = sum(active.values())
+            if n_active < workers:
+                busy = [ h for h, n in active.items() if n >= per_host ]
+                # (look further ahead, past URLs from the same host.)
+                for url, host, d, referrer in \
+                        frontier.pending(workers * per_host, busy):
+                    if active.get(host, 0) < per_host:
+                        start(url, host, d, referrer)
+                        n_active += 1
+                        if n_active == workers:
+                            break
+                frontier.commit()
+            if not active:
+                break
+
+            # ...then deal with the next one to finish.
+            # (with a timeout, so that Ctrl-C gets through.)
+            url, host, d, referrer, result = finished.get(True, 1e6)
+            active[host] -= 1
+            if not active[host]:
+                del active[host]
+            status, size, elapsed, error, links = result
+
+            if url not in written:
+                print>>output, json.dumps(dict(url=url, status=status,
+                                               referrer=referrer, depth=d,
+                                               time=round(elapsed, 3),
+                                               bytes=size, error=error))
+                output.flush()
+
+            crawled += 1
+            if status != 200:
+                bad += 1
+            if d < max_depth:
+                for link in links:
+                    link = normalize_url(link)
+                    if in_scope(link):
+                        frontier.add(link, d + 1, url)
+            frontier.done(url)
+            frontier.commit()
+    finally:
+        pool.terminate()
+        output.close()
+        complete = frontier.count('done') == frontier.count()
+        frontier.close()
+
+    print>>OUT, 'crawled %d pages (%d not OK); results in %s' % \
+          (crawled, bad, options['crawl.output'])
+    if complete:
+        os.remove(options['crawl.state'])
@@ -24,14 +24,22 @@ _requirements = []                      # what requirements to satisfy
 
 ignore_once = False                     # reset after each hook call
 ignore_always = False                   # never reset
-links_visited = {}                      # list of known good links, for
-                                        #   link checking.
+links_visited = None                    # known good links, for link
+                                        #   checking; see twine.visited.
+
+def _links_visited():
+    global links_visited
+    from twine.visited import store_from_options
+
+    if links_visited is None:
+        links_visited = store_from_options()
+    return links_visited
 
 def _require_post_load_hook(action, *args, **kwargs):
     """
     post-load hook function to be called after each page is loaded.
     
-    See TwineBrowser._journey() for more information.
+    See BaseBrowser._run_post_load_hooks() for more information.
     """
     if action == 'back':                # do nothing on a 'back'
         return
@@ -67,11 +75,10 @@ def _require_post_load_hook(action, *args, **kwargs):
             ignore_always = True
             if DEBUG:
                 print>>OUT, 'REQUIRING functioning links'
-                print>>OUT, '(already visited:)'
-                print "\n\t".join(links_visited.keys())
+                print>>OUT, '(already visited: %d)' % (len(_links_visited()),)
                 
             try:
-                check_links(visited=links_visited)
+                check_links(visited=_links_visited())
             finally:
                 ignore_always = False
 
@@ -140,7 +147,10 @@ def flush_visited():
     """
     >> flush_visited
     
-    Flush the list of pages successfully visited already.
+    Flush the list of pages successfully visited already.  The next link
+    check starts a new list, as set up by the 'visited_store' option.
     """
     global links_visited
-    links_visited.clear()
+    if links_visited is not None:
+        links_visited.close()
+        links_visited = None
@@ -0,0 +1,199 @@
+"""
+Extension function to check every page listed in a sitemap.
+
+Usage:
+
+   sitemap_check <sitemap_url|file> [ <sample_percent> ]
+
+Read the sitemap (or sitemap index, following the sitemaps it lists) at
+the given URL or in the given file, and make sure that each of the pages
+it lists answers with HTTP status 200.  An index on the web may only list
+sitemaps on the web; indexes listed in an index, and sitemaps listed
+twice, aren't read.  If 'sample_percent' is given,
+check only that share of the pages, picked at random.
+
+Sitemaps are parsed as they download, and their pages checked in
+batches, so even very large sitemaps are never held in memory.  Pages
+are checked as check_links checks links (concurrently, with the
+browser's cookies and headers; see the 'check_links.workers' and
+'check_links.timeout' options), and bad ones are reported the same way:
+with 'check_links.only_collect_bad_links' set, they're collected for
+'report_bad_links', with the sitemap as their referring page.
+"""
+
+__all__ = ['sitemap_check']
+
+import os
+import zlib
+import random
+import urlparse
+from twine import commands
+from check_links import record_bad_links, workers_option
+
+# how many pages to read from the sitemap before checking them.
+batch_size = 1000
+
+class _GunzipStream(object):
+    """
+    Decompress a gzipped file object as it's read (gzip.GzipFile needs
+    to seek, which an HTTP response can't).
+    """
+    def __init__(self, fp):
+        self.fp = fp
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._buffer = ''
+
+    def read(self, n=-1):
+        while n < 0 or len(self._buffer) < n:
+            data = self.fp.read(65536)
+            if not data:
+                self._buffer += self._decompressor.flush()
+                break
+            self._buffer += self._decompressor.decompress(data)
+
+        if n < 0:
+            n = len(self._buffer)
+        data, self._buffer = self._buffer[:n], self._buffer[n:]
+        return data
+
+def _is_url(source):
+    return source.startswith('http://') or source.startswith('https://')
+
+def _listed_sitemap(index, loc):
+    """
+    Return where the sitemap listed as 'loc' in the index at 'index' is,
+    or None if it can't be read from there: an index on the web mustn't
+    make twine read local files.
+    """
+    if _is_url(index):
+        loc = urlparse.urljoin(index, loc)
+        if not _is_url(loc):
+            return None
+        return loc
+    if _is_url(loc):
+        return loc
+    return os.path.join(os.path.dirname(index), loc)
+
+def _open_sitemap(session, source, timeout):
+    """
+    Return a file object for the sitemap at 'source', a URL or a file
+    name, and a function to close it with.
+    """
+    if _is_url(source):
+        response = session.get(source, timeout=timeout, stream=True)
+        if response.status_code != 200:
+            response.close()
+            raise IOError("cannot get sitemap '%s': HTTP %s" %
+                          (source, response.status_code))
+        fp = response.raw
+        fp.decode_content = True        # Content-Encoding: gzip
+        close = response.close
+        needs_gunzip = 'gzip' not in response.headers.get('content-encoding',
+                                                          '')
+    else:
+        fp = open(source, 'rb')
+        close = fp.close
+        needs_gunzip = True
+
+    if needs_gunzip and source.endswith('.gz'):
+        fp = _GunzipStream(fp)
+    return fp, close
+
+def iter_sitemap(session, source, timeout=10, follow_index=True):
+    """
+    Yield the page URLs listed in the sitemap at 'source', parsing it
+    incrementally; if it's a sitemap index, yield those of the sitemaps
+    it lists (once each), unless 'follow_index' is False.  Indexes don't
+    list indexes, so the listed sitemaps' own lists aren't followed.
+    """
+    from lxml import etree
+
+    sitemaps = []
+    fp, close = _open_sitemap(session, source, timeout)
+    try:
+        # sitemaps come from anywhere: don't let them pull in files or
+        # URLs through external entities.
+        for event, elem in etree.iterparse(fp, events=('end',),
+                                           resolve_entities=False,
+                                           no_network=True, load_dtd=False):
+            if not isinstance(elem.tag, basestring):    # comments etc.
+                continue
+            kind = etree.QName(elem).localname
+            if kind not in ('url', 'sitemap'):
+                continue
+
+            for child in elem:
+                if isinstance(child.tag, basestring) and \
+                   etree.QName(child).localname == 'loc' and child.text:
+                    if kind == 'url':
+                        yield child.text.strip()
+                    elif follow_index:
+                        sitemaps.append(child.text.strip())
+
+            # forget what's been read.
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    finally:
+        close()
+
+    seen = set([source])
+    for loc in sitemaps:
+        sitemap = _listed_sitemap(source, loc)
+        if sitemap is None or sitemap in seen:
+            continue
+        seen.add(sitemap)
+        for url in iter_sitemap(session, sitemap, timeout, False):
+            yield url
+
+def sitemap_check(source, sample_percent='100'):
+    """
+    >> sitemap_check <sitemap_url|file> [ <sample_percent> ]
+
+    Make sure that all of the pages listed in a sitemap (or a sitemap
+    index) can be visited with an HTTP response 200 (success), or only
+    'sample_percent' of them, picked at random.  See the 'sitemap_check'
+    extension module for details.
+    """
+    from twine import linkcheck
+
+    OUT = commands.OUT
+    browser = commands.get_browser()
+    options = commands._options
+
+    sample = float(sample_percent) / 100
+    workers = workers_option()
+    timeout = float(options['check_links.timeout'])
+    session = linkcheck.session_for_browser(browser, workers)
+    # (the sitemap download stays open: keep it out of the checkers' pool.)
+    sitemap_session = linkcheck.session_for_browser(browser, 1)
+    cache = linkcheck.link_cache()
+    recheck = options['recheck_links']
+
+    def check(batch):
+        for result in linkcheck.check_urls(session, batch, None, workers,
+                                           timeout, cache, recheck):
+            if not result.ok:
+                failed.append(result.url)
+                print>>OUT, "%s ...failure ;( (%s)" % \
+                      (result.url, result.error or result.status)
+
+    listed = checked = 0
+    failed = []
+    batch = []
+    for url in iter_sitemap(sitemap_session, source, timeout):
+        listed += 1
+        if sample < 1 and random.random() >= sample:
+            continue
+        batch.append(url)
+        if len(batch) == batch_size:
+            check(batch)
+            checked += len(batch)
+            batch = []
+    check(batch)
+    checked += len(batch)
+
+    print>>OUT, 'checked %d of %d pages in %s; %d failed' % \
+          (checked, listed, source, len(failed))
+    if failed:
+        record_bad_links(failed, source, "broken pages in sitemap")
@@ -0,0 +1,54 @@
+"""
+The original pyparsing grammar for the twine mini-language.
+
+twine.parse tokenizes scripts with its own hand-written scanner; this
+module is only imported when that is switched off (see
+twine.parse.use_pyparsing()) and as the reference the scanner is tested
+against.
+"""
+
+from pyparsing import OneOrMore, Word, printables, quotedString, Optional, \
+     alphas, alphanums, ParseException, ZeroOrMore, restOfLine, Combine, \
+     Literal, Group, removeQuotes, CharsNotIn
+
+### pyparsing stuff
+
+# basically, a valid Python identifier:
+command = Word(alphas + "_", alphanums + "_")
+command = command.setResultsName('command')
+command.setName("command")
+
+# arguments to it.
+
+# we need to reimplement all this junk from pyparsing because pcre's
+# idea of escapable characters contains a lot more than the C-like
+# thing pyparsing implements
+_bslash = "\\"
+_sglQuote = Literal("'")
+_dblQuote = Literal('"')
+_escapables = printables
+_escapedChar = Word(_bslash, _escapables, exact=2)
+dblQuotedString = Combine( _dblQuote + ZeroOrMore( CharsNotIn('\\"\n\r') | _escapedChar | '""' ) + _dblQuote ).streamline().setName("string enclosed in double quotes")
+sglQuotedString = Combine( _sglQuote + ZeroOrMore( CharsNotIn("\\'\n\r") | _escapedChar | "''" ) + _sglQuote ).streamline().setName("string enclosed in single quotes")
+quotedArg = ( dblQuotedString | sglQuotedString )
+quotedArg.setParseAction(removeQuotes)
+quotedArg.setName("quotedArg")
+
+plainArgChars = printables.replace('#', '').replace('"', '').replace("'", "")
+plainArg = Word(plainArgChars)
+plainArg.setName("plainArg")
+
+arguments = Group(ZeroOrMore(quotedArg | plainArg))
+arguments = arguments.setResultsName('arguments')
+arguments.setName("arguments")
+
+# comment line.
+comment = Literal('#') + restOfLine
+comment = comment.suppress()
+comment.setName('comment')
+
+full_command = (
+    comment
+    | (command + arguments + Optional(comment))
+    )
+full_command.setName('full_command')
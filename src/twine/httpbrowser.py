@@ -0,0 +1,409 @@
+"""
+A lightweight, JavaScript-less browser engine for twine.
+
+HTTPBrowser talks HTTP directly through 'requests' and parses pages with
+lxml, so it never starts Qt or WebKit.  It implements the same surface as
+TwineBrowser for everything that doesn't need a JavaScript engine: page
+loads, history, HTTP auth, cookies, and form filling/submission.
+
+Select it with 'config engine http' or 'twine --engine http'.
+"""
+
+import os
+import re
+import time
+import urllib
+import urlparse
+
+from basebrowser import BaseBrowser, unfillable_types
+from errors import TwineException
+from utils import make_boolean, parse_mozilla_cookies, _follow_equiv_refresh
+from timing import timed
+import tracing
+import httpcache
+
+_realm_re = re.compile(r'realm="([^"]*)"', re.IGNORECASE)
+
+_mozilla_header = ["# Netscape HTTP Cookie File", ""]
+
+# <meta http-equiv="refresh" content="5; url=...">
+_refresh_re = re.compile(r'''^\s*[\d.]*\s*[;,]\s*url\s*=\s*['"]?([^'"]+)''',
+                         re.IGNORECASE)
+
+# how many refreshes to follow in a row, as with redirects.
+_max_refreshes = 10
+
+def _refresh_url(doc, base_url):
+    """
+    Return the URL the page in 'doc' refreshes to, or None.
+    """
+    for meta in doc.iter('meta'):
+        if (meta.get('http-equiv') or '').lower() != 'refresh':
+            continue
+        m = _refresh_re.match(meta.get('content') or '')
+        if m:
+            url = urlparse.urljoin(base_url, m.group(1).strip())
+            if url != base_url:         # reloading forever isn't useful
+                return url
+    return None
+
+def _cached_response(entry):
+    """
+    Make a 'requests' response out of a cache entry.
+    """
+    import requests
+
+    response = requests.models.Response()
+    response.status_code = entry.status
+    response.headers = requests.structures.CaseInsensitiveDict(entry.headers)
+    response.encoding = requests.utils.get_encoding_from_headers(
+        response.headers)
+    response.url = entry.url
+    response._content = entry.content
+    return response
+
+class HTTPBrowser(BaseBrowser):
+    """
+    Browser engine built on 'requests' + lxml.  No JavaScript, no Qt.
+    """
+    def __init__(self):
+        import requests
+
+        self._init_state()
+
+        self._session = requests.Session()
+        self._response = None
+        self._doc = None                # lxml tree of the current page
+        self._url = ""
+        self._cache = None              # httpcache.DiskCache, or None
+
+    @property
+    def url(self):
+        if self.at_empty_page:
+            return ""
+        else:
+            return self._url
+
+    @property
+    def html(self):
+        if self.at_empty_page or self._response is None:
+            return ""
+        else:
+            return self._response.text
+
+    @property
+    @timed('dom')
+    def soup(self):
+        import pyquery
+        if self._doc is None:
+            return pyquery.PyQuery("<html></html>")
+        return pyquery.PyQuery(self._doc)
+
+    ### page loading
+
+    def set_cache(self, directory, max_size):
+        """
+        Keep a persistent HTTP cache in 'directory', of up to 'max_size'
+        bytes; see httpcache.
+        """
+        self._cache = httpcache.DiskCache(os.path.join(directory, 'http'),
+                                          max_size)
+
+    def _request(self, method, url, **kw):
+        import requests
+
+        headers = dict(self.headers)
+        if self._url:
+            headers.setdefault("Referer", self._url)
+
+        entry = None
+        use_cache = self._cache is not None and method == 'GET'
+        if use_cache:
+            entry = self._cache.get(url)
+            if entry is not None:
+                if entry.is_fresh():
+                    httpcache.stats['hits'] += 1
+                    return _cached_response(entry)
+                headers.update(entry.validators())
+
+        start = time.time()
+        try:
+            response = self._session.request(method, url, headers=headers,
+                                             **kw)
+
+            # retry with credentials if the server asks for them.
+            if response.status_code == 401:
+                challenge = response.headers.get('WWW-Authenticate', '')
+                m = _realm_re.search(challenge)
+                realm = m and m.group(1) or ""
+
+                credentials = self.http_authentication_callback(url, realm)
+                if credentials:
+                    response = self._session.request(method, url,
+                                                     headers=headers,
+                                                     auth=credentials, **kw)
+        except (requests.RequestException, ValueError):
+            if tracing.enabled:
+                tracing.async_span(url, 'network', start,
+                                   dict(url=url, status='', content_type=''))
+            return None
+
+        if use_cache:
+            response = self._update_cache(url, response, entry)
+
+        if tracing.enabled:
+            tracing.async_span(url, 'network', start,
+                               dict(url=response.url,
+                                    status="%s" % (response.status_code,),
+                                    content_type=response.headers.get(
+                                        'Content-Type', '')))
+        return response
+
+    def _update_cache(self, url, response, entry):
+        """
+        Store 'response' in the cache if it can be, or, if it says that
+        the stale cache 'entry' is still good, return that instead.
+        """
+        if entry is not None and response.status_code == 304:
+            httpcache.stats['hits'] += 1
+            httpcache.stats['revalidated'] += 1
+            entry.headers.pop('age', None)
+            for name in ('Cache-Control', 'Expires', 'Date', 'ETag',
+                         'Last-Modified', 'Age'):
+                if name in response.headers:
+                    entry.headers[name.lower()] = response.headers[name]
+            entry.stored = time.time()
+            self._cache.put(entry)
+            return _cached_response(entry)
+
+        httpcache.stats['misses'] += 1
+        # (requests sets Authorization for auth=..., e.g. after a 401.)
+        authorized = 'Authorization' in response.request.headers
+        if not response.history and \
+           httpcache.is_storable(response.status_code, response.headers,
+                                 authorized):
+            self._cache.put(httpcache.CacheEntry(url, response.status_code,
+                                                 response.headers,
+                                                 response.content,
+                                                 time.time()))
+        return response
+
+    def _set_page(self, response, add_to_history):
+        from lxml import html as lxml_html
+        from lxml.etree import ParserError
+
+        old_url = self.url
+        if add_to_history and old_url:
+            self._history.append(old_url)
+
+        self._response = response
+        self._url = response.url
+        self.at_empty_page = False
+        self.last_form = None
+        self._previous_form_values = {}
+
+        self._http_status = "%s" % (response.status_code,)
+        self._content_type = response.headers.get('Content-Type', '')
+
+        self._doc = None
+        self.invalidate_page()
+        if 'html' in self._content_type or 'xml' in self._content_type:
+            try:
+                self._doc = lxml_html.document_fromstring(
+                    response.content, base_url=response.url)
+            except (ParserError, ValueError):
+                pass
+
+    @timed('load')
+    def load(self, url, add_to_history = True):
+        if url:
+            response = self._request('GET', url)
+            if response is None:
+                return False
+
+            self._set_page(response, add_to_history)
+            self._follow_refresh()
+            return True
+        else:
+            self.at_empty_page = True
+            self.invalidate_page()
+            return True
+
+    ### JavaScript-only features
+
+    def _no_javascript(self, what):
+        raise TwineException("%s needs JavaScript, which the 'http' engine "
+                             "doesn't provide; use 'config engine webkit'" %
+                             (what,))
+
+    def run_javascript(self, jscode, changes_page=True):
+        self._no_javascript("running JavaScript")
+
+    def evaluate_javascript(self, expressions, changes_page=False):
+        self._no_javascript("evaluating JavaScript")
+
+    def wait_for_js(self, expression, timeout):
+        self._no_javascript("waiting for a JavaScript condition")
+
+    def snapshot(self, *args, **kw):
+        self._no_javascript("taking a screenshot")
+
+    def browse(self):
+        self._no_javascript("browsing")
+
+    ### DOM helpers: same selector-based API as spynner's Browser
+
+    def _select(self, selector):
+        return list(self.soup(selector))
+
+    @timed('dom')
+    def fill(self, selector, value):
+        for element in self._select(selector):
+            if element.tag == 'textarea':
+                element.text = value
+            else:
+                element.set('value', value)
+
+    @timed('dom')
+    def check(self, selector):
+        for element in self._select(selector):
+            if element.get('type') == 'radio':
+                form = element.getparent()
+                while form is not None and form.tag != 'form':
+                    form = form.getparent()
+                if form is not None:
+                    for other in form.iter('input'):
+                        if other.get('type') == 'radio' and \
+                           other.get('name') == element.get('name'):
+                            other.attrib.pop('checked', None)
+            element.set('checked', 'checked')
+
+    @timed('dom')
+    def uncheck(self, selector):
+        for element in self._select(selector):
+            element.attrib.pop('checked', None)
+
+    @timed('dom')
+    def select(self, selector):
+        for option in self._select(selector):
+            select = option.getparent()
+            while select is not None and select.tag != 'select':
+                select = select.getparent()
+            if select is not None and select.get('multiple') is None:
+                for other in select.iter('option'):
+                    other.attrib.pop('selected', None)
+            option.set('selected', 'selected')
+
+    def _fill_fields(self, form_index, assignments):
+        # the page model is built on the live lxml tree, so the indexed
+        # fields can be changed in place without any selector queries.
+        for tag, field_type, fields, value in assignments:
+            if tag == 'select':
+                for select in fields:
+                    multiple = select.attr.multiple is not None
+                    for option in select[0].iter('option'):
+                        option_value = option.get('value')
+                        if option_value is None:
+                            option_value = option.text_content()
+                        if option_value == value:
+                            option.set('selected', 'selected')
+                        elif not multiple:
+                            option.attrib.pop('selected', None)
+            elif tag == 'textarea':
+                for field in fields:
+                    field[0].text = value
+            elif field_type == 'checkbox':
+                checked = make_boolean(value)
+                for field in fields:
+                    if checked:
+                        field[0].set('checked', 'checked')
+                    else:
+                        field[0].attrib.pop('checked', None)
+            elif field_type == 'radio':
+                group = form_index.radio_groups.get(fields[0].attr.name,
+                                                    fields)
+                for field in group:
+                    if field.attr.value == value:
+                        field[0].set('checked', 'checked')
+                    else:
+                        field[0].attrib.pop('checked', None)
+            elif field_type not in unfillable_types:
+                for field in fields:
+                    field[0].set('value', value)
+
+    @timed('load')
+    def submit(self, selector):
+        buttons = self._select(selector)
+        if not buttons:
+            raise TwineException("no element matches '%s'" % (selector,))
+        button = buttons[0]
+
+        form = button.getparent()
+        while form is not None and form.tag != 'form':
+            form = form.getparent()
+        if form is None:
+            raise TwineException("'%s' is not inside a form" % (selector,))
+
+        values = form.form_values()
+        if button.get('name'):
+            values.append((button.get('name'), button.get('value') or ''))
+
+        action = form.get('action') or self.url
+        action = urlparse.urljoin(self.url, action)
+        method = (form.get('method') or 'GET').upper()
+
+        if method == 'POST':
+            response = self._request('POST', action, data=values)
+        else:
+            action = action.split('?', 1)[0] + '?' + urllib.urlencode(values)
+            response = self._request('GET', action)
+
+        if response is None:
+            return False
+
+        self._set_page(response, True)
+        self._follow_refresh()
+        return True
+
+    def _follow_refresh(self):
+        """
+        Follow <meta http-equiv="refresh"> redirects, as browsers do, if
+        the 'acknowledge_equiv_refresh' option is on.  Like HTTP
+        redirects, they don't go in the history.
+        """
+        for i in range(_max_refreshes):
+            if not _follow_equiv_refresh() or self._doc is None:
+                return
+            url = _refresh_url(self._doc, self.url)
+            if url is None:
+                return
+            response = self._request('GET', url)
+            if response is None:
+                return
+            self._set_page(response, False)
+
+    def set_form_action(self, form_number, action):
+        self.soup("form").eq(form_number).attr('action', action)
+        self.invalidate_page()
+
+    ### cookies, in the Mozilla text format spynner uses
+
+    def get_cookies(self):
+        lines = []
+        for cookie in self._session.cookies:
+            lines.append("\t".join([
+                cookie.domain,
+                cookie.domain.startswith(".") and "TRUE" or "FALSE",
+                cookie.path,
+                cookie.secure and "TRUE" or "FALSE",
+                "%d" % (cookie.expires or 0,),
+                cookie.name,
+                cookie.value or "",
+                ]))
+        return "\n".join(_mozilla_header + lines)
+
+    def set_cookies(self, string):
+        self._session.cookies.clear()
+
+        for cookie in parse_mozilla_cookies(string):
+            self._session.cookies.set_cookie(cookie)
@@ -0,0 +1,266 @@
+"""
+A persistent HTTP cache on disk, shared by scripts and worker processes.
+
+Each new browser starts with an empty memory cache, so a test suite
+downloads the same stylesheets and script bundles again for every
+script.  With 'twine --cache DIR' (or 'config cache_dir DIR') browsers
+keep a cache in DIR instead, with a size limit ('config cache_size', in
+megabytes):
+
+  * the webkit engine uses Qt's QNetworkDiskCache, in DIR/webkit;
+  * the http engine uses DiskCache, below, in DIR/http.
+
+Both follow the usual rules for a shared cache, through is_storable():
+responses marked no-store or private, responses to requests with
+credentials (unless marked public), and those that vary on request
+headers, aren't stored.  (The webkit engine counts every response from
+a host that has asked it for credentials as one.)  With DiskCache, fresh
+responses (max-age or Expires) are used as they are; stale ones, and
+those marked no-cache, are revalidated with If-None-Match /
+If-Modified-Since first.
+
+Several processes can use the same directory: each entry is one file,
+written to a temporary file and renamed into place, so readers see
+either the old entry or the new one, never half of one.
+
+Hits and misses, from either engine, are counted in 'stats'.
+"""
+
+import os
+import time
+import email.utils
+import cPickle as pickle
+from hashlib import sha1
+
+# 'hits' includes the 'revalidated' ones: stale entries the server said
+# were still good.
+stats = dict(hits=0, misses=0, revalidated=0)
+
+def clear_stats():
+    for key in stats:
+        stats[key] = 0
+
+def get_stats():
+    return dict(stats)
+
+def merge_stats(other):
+    """
+    Add counts collected elsewhere (e.g. in a worker process).
+    """
+    for key, n in other.items():
+        stats[key] = stats.get(key, 0) + n
+
+def format_stats():
+    return "%d hits (%d revalidated), %d misses" % \
+           (stats['hits'], stats['revalidated'], stats['misses'])
+
+# the functions below take headers as a dictionary with lower-case names,
+# or as a case-insensitive one, like requests'.
+
+def _cache_control(headers):
+    """
+    Parse a Cache-Control header into a dictionary.
+    """
+    directives = {}
+    for part in headers.get('cache-control', '').split(','):
+        part = part.strip().lower()
+        if not part:
+            continue
+        if '=' in part:
+            name, value = part.split('=', 1)
+            directives[name.strip()] = value.strip().strip('"')
+        else:
+            directives[part] = None
+    return directives
+
+def _parse_date(value):
+    if not value:
+        return None
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return email.utils.mktime_tz(parsed)
+
+def _lifetime(directives, headers):
+    if 'no-cache' in directives:
+        return 0
+    # s-maxage is for shared caches, like this one.
+    for name in ('s-maxage', 'max-age'):
+        if name in directives:
+            try:
+                return int(directives[name])
+            except ValueError:
+                return 0
+
+    expires = _parse_date(headers.get('expires'))
+    if expires is not None:
+        date = _parse_date(headers.get('date')) or time.time()
+        return max(expires - date, 0)
+    return 0
+
+def freshness_lifetime(headers):
+    """
+    How many seconds a response with the given headers stays fresh, from
+    when it was received: its lifetime less its Age (how long it had
+    already spent in other caches).
+    """
+    try:
+        age = max(int(headers.get('age') or 0), 0)
+    except ValueError:
+        age = 0
+    return max(_lifetime(_cache_control(headers), headers) - age, 0)
+
+def is_storable(status, headers, authorized=False):
+    """
+    Whether a response with the given status and headers may be stored
+    in the cache, which is shared by scripts; 'authorized' says whether
+    the request carried an Authorization header.
+    """
+    if status != 200:
+        return False
+    directives = _cache_control(headers)
+    if 'no-store' in directives or 'private' in directives:
+        return False
+    if authorized and not ('public' in directives or
+                           's-maxage' in directives):
+        return False
+    vary = [ v.strip().lower() for v in headers.get('vary', '').split(',')
+             if v.strip() ]
+    if [ v for v in vary if v != 'accept-encoding' ]:
+        return False
+    # without a lifetime or a validator, the entry could never be used.
+    return bool(freshness_lifetime(headers) or headers.get('etag') or
+                headers.get('last-modified'))
+
+class CacheEntry(object):
+    """
+    One stored response.
+    """
+    def __init__(self, url, status, headers, content, stored):
+        self.url = url
+        self.status = status
+        self.headers = dict([ (k.lower(), v)     # lower-case names
+                              for k, v in headers.items() ])
+        self.content = content
+        self.stored = stored            # time.time() when stored/revalidated
+
+    def is_fresh(self, now=None):
+        if now is None:
+            now = time.time()
+        return now - self.stored < freshness_lifetime(self.headers)
+
+    def validators(self):
+        """
+        The conditional request headers to revalidate this entry with.
+        """
+        headers = {}
+        if self.headers.get('etag'):
+            headers['If-None-Match'] = self.headers['etag']
+        if self.headers.get('last-modified'):
+            headers['If-Modified-Since'] = self.headers['last-modified']
+        return headers
+
+class DiskCache(object):
+    """
+    HTTP responses stored one file per URL in 'directory', with the
+    least recently used removed when they take more than 'max_size' bytes.
+    """
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self._written = 0               # bytes written since the last trim
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:             # another process got there first
+                if not os.path.isdir(directory):
+                    raise
+
+    def _path(self, url):
+        return os.path.join(self.directory, sha1(url).hexdigest())
+
+    def get(self, url):
+        """
+        Return the CacheEntry for 'url', or None.
+        """
+        path = self._path(url)
+        try:
+            fp = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                entry = CacheEntry(**pickle.load(fp))
+            except Exception:           # damaged, or from another version
+                return None
+        finally:
+            fp.close()
+
+        if entry.url != url:
+            return None
+
+        try:
+            os.utime(path, None)        # recently used
+        except OSError:
+            pass
+        return entry
+
+    def put(self, entry):
+        """
+        Store 'entry', replacing any entry for the same URL.  Failing to
+        store it (e.g. on a full disk) isn't an error: it's only a cache.
+        """
+        path = self._path(entry.url)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            fp = open(tmp, 'wb')
+            try:
+                pickle.dump(entry.__dict__, fp, pickle.HIGHEST_PROTOCOL)
+            finally:
+                fp.close()
+            os.rename(tmp, path)        # atomic
+        except (IOError, OSError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+
+        self._written += len(entry.content)
+        if self._written > self.max_size / 10:
+            self.trim()
+
+    def trim(self):
+        """
+        Remove the least recently used entries until the cache takes no
+        more than 90% of its maximum size.
+        """
+        self._written = 0
+
+        files = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):   # being written
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        if total <= self.max_size:
+            return
+
+        files.sort()
+        target = self.max_size * 9 / 10
+        for mtime, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:             # another process removed it
+                pass
+            total -= size
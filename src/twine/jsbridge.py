@@ -0,0 +1,81 @@
+"""
+Structured JavaScript evaluation for the webkit engine.
+
+'run_javascript' only gets back what the code logs to the console, one
+string per call.  Instead, the bridge wraps a batch of expressions in a
+single script that evaluates each of them in the page's global scope and
+returns all of the results as one JSON string, which is then decoded
+back into Python values.  Commands and extensions that need several
+values from the page can thus collect them in one round trip; see
+TwineBrowser.evaluate_javascript().
+"""
+
+import json
+
+from errors import TwineException
+
+# Evaluates each expression (with an indirect, global-scope eval, so that
+# statements and 'var's work as they do in a <script>) and returns either
+# {"results": [...]} or {"error": ..., "index": ...} as JSON.  undefined
+# becomes null; DOM nodes and other unserializable values are an error.
+_bridge_js = """
+(function (expressions) {
+    var results = [], i = 0;
+    try {
+        for (; i < expressions.length; i++) {
+            var value = (0, eval)(expressions[i]);
+            results.push(value === undefined ? null : value);
+        }
+        return JSON.stringify({results: results});
+    } catch (e) {
+        return JSON.stringify({error: String(e), index: i});
+    }
+})(%s)
+"""
+
+def make_script(expressions):
+    """
+    Return the JavaScript that evaluates the list of 'expressions'.
+    """
+    return _bridge_js % (json.dumps(list(expressions)),)
+
+def encode(obj):
+    """
+    Turn the unicode strings json.loads() returns into UTF-8 strings,
+    like the ones the rest of twine deals in.
+    """
+    if isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    elif isinstance(obj, list):
+        return [ encode(i) for i in obj ]
+    elif isinstance(obj, dict):
+        return dict([ (encode(k), encode(v)) for k, v in obj.items() ])
+    return obj
+
+def parse_results(output, expressions):
+    """
+    Decode the output of make_script(expressions) into the list of
+    results, one per expression.  Raises TwineException if the script
+    failed.
+    """
+    # QtWebKit hands back a QVariant or QString, depending on the sip API.
+    if hasattr(output, 'toString'):
+        output = output.toString()
+    if output is None:
+        output = ""
+
+    try:
+        reply = json.loads(unicode(output))
+    except ValueError:
+        raise TwineException("JavaScript evaluation failed (no page?)")
+
+    if 'error' in reply:
+        index = reply.get('index') or 0
+        if index < len(expressions):
+            where = " in '%s'" % (expressions[index],)
+        else:
+            where = ""
+        raise TwineException("JavaScript error%s: %s" %
+                             (where, encode(reply['error'])))
+
+    return encode(reply['results'])
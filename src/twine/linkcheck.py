@@ -0,0 +1,318 @@
+"""
+Check many URLs at once, without touching the browser's page.
+
+The link-checking extensions used to follow each link with the browser
+and go back, loading the page under test again after every link.
+Instead, check_urls() checks all of the URLs concurrently from a bounded
+pool of threads, sharing a pool of keep-alive HTTP connections, while
+the browser stays on its page.  The requests carry the browser's
+cookies, extra headers (e.g. User-Agent) and the page as the referrer.
+
+Each URL is checked with HEAD, falling back to GET for servers that
+don't answer HEAD properly.
+
+With an HTTP cache directory ('twine --cache DIR'), good links are also
+remembered across runs, in an SQLite database (DIR/links.db): a link
+checked less than 'link_cache_ttl' seconds ago isn't checked again, and
+an older one is rechecked with a conditional request, using its ETag or
+Last-Modified date.  The cache is shared, so links checked with cookies
+or credentials aren't remembered: they may only be good for this user.  'twine --recheck-all' ('config recheck_links 1')
+checks every link again regardless.  Bad links are always rechecked.
+"""
+
+import os
+import re
+import time
+
+# how the links were checked: 'hits' came straight from the link cache,
+# 'revalidated' were confirmed unchanged by the server, 'misses' were
+# checked in full.
+stats = dict(hits=0, misses=0, revalidated=0)
+
+def clear_stats():
+    for key in stats:
+        stats[key] = 0
+
+def format_stats():
+    total = sum(stats.values())
+    ratio = total and 100.0 * (stats['hits'] + stats['revalidated']) / total
+    return "%d hits, %d revalidated, %d misses (%.0f%% from cache)" % \
+           (stats['hits'], stats['revalidated'], stats['misses'], ratio)
+
+# statuses that may mean 'HEAD not supported' rather than a bad link.
+_retry_with_get = (400, 403, 404, 405, 500, 501, 502, 503)
+
+class LinkResult(object):
+    """
+    The outcome of checking one URL: the final HTTP status (after
+    redirects), or None and an error message if there was no response.
+    """
+    def __init__(self, url, status=None, error=None, final_url=None,
+                 headers=None, cached=False, authorized=False):
+        self.url = url
+        self.status = status
+        self.error = error
+        self.final_url = final_url or url
+        self.headers = headers or {}
+        self.cached = cached            # known good from the link cache
+        self.authorized = authorized    # checked with cookies/credentials
+
+    @property
+    def ok(self):
+        return self.status == 200
+
+    def __str__(self):
+        if self.status is None:
+            return "%s: %s" % (self.url, self.error)
+        return "%s: HTTP %s" % (self.url, self.status)
+
+class LinkCache(object):
+    """
+    The status, validators and check time of good links, in the SQLite
+    database at 'path'.  Links checked less than 'ttl' seconds ago are
+    fresh.
+
+    Several processes may share the database; each one must only use a
+    LinkCache from the thread that opened it.
+    """
+    def __init__(self, path, ttl):
+        import sqlite3
+
+        self.path = path
+        self.ttl = ttl
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:             # another process got there first
+                if not os.path.isdir(directory):
+                    raise
+
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("CREATE TABLE IF NOT EXISTS links ("
+                        "url TEXT PRIMARY KEY, status INTEGER, "
+                        "etag TEXT, last_modified TEXT, checked_at REAL)")
+        self.db.commit()
+
+    def get(self, url):
+        """
+        Return (status, etag, last_modified, checked_at) for 'url', or None.
+        """
+        return self.db.execute("SELECT status, etag, last_modified, "
+                               "checked_at FROM links WHERE url = ?",
+                               (url,)).fetchone()
+
+    def is_fresh(self, record, now=None):
+        if now is None:
+            now = time.time()
+        return now - record[3] < self.ttl
+
+    def validators(self, record):
+        """
+        The conditional request headers to recheck a link with.
+        """
+        headers = {}
+        if record[1]:
+            headers['If-None-Match'] = record[1]
+        if record[2]:
+            headers['If-Modified-Since'] = record[2]
+        return headers
+
+    def update(self, results, now=None):
+        """
+        Record a batch of LinkResults: remember the good ones (or, for
+        those the server said were unchanged, when they were checked) and
+        forget the bad ones.  Links checked with cookies or credentials
+        aren't remembered.
+        """
+        if now is None:
+            now = time.time()
+        for result in results:
+            if result.authorized and result.status in (200, 304):
+                continue
+            if result.status == 304:
+                self.db.execute("UPDATE links SET checked_at = ? "
+                                "WHERE url = ?", (now, result.url))
+            elif result.ok:
+                self.db.execute("INSERT OR REPLACE INTO links VALUES "
+                                "(?, ?, ?, ?, ?)",
+                                (result.url, result.status,
+                                 result.headers.get('etag'),
+                                 result.headers.get('last-modified'), now))
+            else:
+                self.db.execute("DELETE FROM links WHERE url = ?",
+                                (result.url,))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+_link_cache = None
+
+def link_cache():
+    """
+    Return the LinkCache for the 'cache_dir' option, or None if there's
+    no cache directory.
+    """
+    global _link_cache
+    import commands
+
+    directory = commands._options['cache_dir']
+    if not directory:
+        return None
+
+    path = os.path.join(directory, 'links.db')
+    if _link_cache is None or _link_cache.path != path:
+        if _link_cache is not None:
+            _link_cache.close()
+        _link_cache = LinkCache(path, 0)
+    _link_cache.ttl = float(commands._options['link_cache_ttl'])
+    return _link_cache
+
+_realm_re = re.compile(r'realm="([^"]*)"', re.IGNORECASE)
+
+class _CredentialsAuth(object):
+    """
+    A requests auth hook that answers an HTTP 401 by asking
+    'credentials(url, realm)' for a (username, password) and, if it gives
+    one, sending the request again with Basic authentication -- as the
+    browsers do with their http_authentication_callback().
+    """
+    def __init__(self, credentials):
+        self.credentials = credentials
+
+    def __call__(self, request):
+        request.register_hook('response', self.handle_401)
+        return request
+
+    def handle_401(self, response, **kw):
+        from requests.auth import HTTPBasicAuth
+
+        request = response.request
+        if response.status_code != 401 or 'Authorization' in request.headers:
+            return response
+
+        m = _realm_re.search(response.headers.get('WWW-Authenticate', ''))
+        credentials = self.credentials(request.url, m and m.group(1) or "")
+        if not credentials:
+            return response
+
+        response.content                # free the connection
+        response.close()
+        retry = HTTPBasicAuth(*credentials)(request.copy())
+        new_response = response.connection.send(retry, **kw)
+        new_response.history.append(response)
+        new_response.request = retry
+        return new_response
+
+def make_session(pool_size, cookies=(), headers=(), credentials=None):
+    """
+    Return a requests session with room for 'pool_size' concurrent
+    connections per host, carrying the given cookies (cookielib.Cookie
+    objects) and headers.  If the server asks for HTTP authentication,
+    'credentials(url, realm)' is asked for a (username, password).
+    """
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                            pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    for cookie in cookies:
+        session.cookies.set_cookie(cookie)
+    session.headers.update(dict(headers))
+    if credentials is not None:
+        session.auth = _CredentialsAuth(credentials)
+    return session
+
+def session_for_browser(browser, pool_size):
+    """
+    Return a session (see make_session()) with the cookies, extra
+    headers and HTTP authentication credentials of 'browser'.
+    """
+    from utils import parse_mozilla_cookies
+
+    return make_session(pool_size, parse_mozilla_cookies(browser.get_cookies()),
+                        browser.headers, browser.http_authentication_callback)
+
+def check_url(session, url, referer=None, timeout=10, headers=None):
+    """
+    Check 'url' with HEAD, or with GET if HEAD fails; returns a LinkResult.
+    'headers' are extra request headers, e.g. for conditional requests.
+    """
+    import requests
+
+    request_headers = dict(headers or {})
+    if referer:
+        request_headers['Referer'] = referer
+
+    try:
+        response = session.head(url, headers=request_headers,
+                                timeout=timeout, allow_redirects=True)
+        if response.status_code in _retry_with_get:
+            # don't download the body: the status is all we need.
+            response = session.get(url, headers=request_headers,
+                                   timeout=timeout, allow_redirects=True,
+                                   stream=True)
+            response.close()
+    except (requests.RequestException, ValueError), e:
+        return LinkResult(url, error=str(e) or e.__class__.__name__)
+
+    sent = [ r.request for r in response.history ] + [response.request]
+    authorized = bool([ r for r in sent if 'Cookie' in r.headers or
+                        'Authorization' in r.headers ])
+    return LinkResult(url, response.status_code, final_url=response.url,
+                      headers=response.headers, authorized=authorized)
+
+def check_urls(session, urls, referer=None, workers=8, timeout=10,
+               cache=None, recheck=False):
+    """
+    Check all of 'urls' with up to 'workers' requests at a time; yields
+    a LinkResult per URL, in the order they finish.
+
+    With a LinkCache, fresh links aren't checked again (unless 'recheck'
+    is set) and stale ones are rechecked with conditional requests; the
+    results are recorded in the cache.
+    """
+    from multiprocessing.pool import ThreadPool
+
+    # look everything up first: the cache can't be used from the pool.
+    validators = {}
+    to_check = []
+    for url in urls:
+        record = cache and cache.get(url)
+        if record and not recheck and cache.is_fresh(record):
+            stats['hits'] += 1
+            yield LinkResult(url, record[0], cached=True)
+            continue
+        if record and not recheck:
+            validators[url] = cache.validators(record)
+        to_check.append(url)
+
+    if not to_check:
+        return
+
+    def check(url):
+        return check_url(session, url, referer, timeout, validators.get(url))
+
+    results = []
+    pool = ThreadPool(max(1, min(workers, len(to_check))))
+    try:
+        for result in pool.imap_unordered(check, to_check):
+            results.append(result)
+            if result.status == 304:
+                stats['revalidated'] += 1
+                yield LinkResult(result.url, 200, final_url=result.final_url,
+                                 headers=result.headers, cached=True)
+            else:
+                stats['misses'] += 1
+                yield result
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+        if cache is not None:
+            cache.update(results)
@@ -16,7 +16,8 @@ def init_global_dict():
     command_list = twine.commands.__all__
     
     import twine.parse
-    twine.parse.command_list.extend(command_list)
+    for command in command_list:
+        twine.parse.register_command(command, global_dict[command])
 
 # local dictionaries.
 _local_dict_stack = []
@@ -0,0 +1,287 @@
+"""
+The parsed model of the current page, shared by all of the commands.
+
+Getting 'soup' from the webkit engine serializes the live DOM and parses
+it again with pyquery, which is slow on big pages.  Browsers instead keep
+a PageModel for the current page, built the first time a command needs it
+and thrown away when the page is loaded or its DOM is changed (by
+JavaScript or form submission); see BaseBrowser.page.  Filling in form
+fields changes their values but not the structure the model indexes, so
+it keeps the model.
+
+Forms and their fields are indexed by number, name and id, so that
+looking up a field on a form with thousands of them doesn't mean walking
+the whole form.
+"""
+
+from errors import TwineAssertionError
+
+# the tags of form fields, in the order fields are numbered.
+field_tags = ('input', 'select', 'textarea')
+
+class FormIndex(object):
+    """
+    Index of one form's fields, built on first use: the fields in order
+    (inputs, then selects, then textareas, as 'showforms' numbers them),
+    fields by tag & name and by id, and radio buttons grouped by name.
+    """
+    def __init__(self, form, number):
+        self.form = form                # pyquery object
+        self.number = number            # 0-based
+        self._fields = None
+
+    def _build(self):
+        self._fields = []
+        self._by_name = {}              # (tag, name) => [field, ...]
+        self._by_id = {}                # id => field
+        self._radio_groups = {}         # name => [radio input, ...]
+        self._submits = []
+        self._numbers = {}              # lxml element => 0-based number
+
+        for tag in field_tags:
+            for field in self.form.find(tag).items():
+                self._numbers[field[0]] = len(self._fields)
+                self._fields.append(field)
+
+                name = field.attr.name
+                if name is not None:
+                    self._by_name.setdefault((tag, name), []).append(field)
+
+                field_id = field.attr.id
+                if field_id and field_id not in self._by_id:
+                    self._by_id[field_id] = field
+
+                if tag == 'input':
+                    field_type = field.attr.type
+                    if field_type == 'radio':
+                        self._radio_groups.setdefault(name, []).append(field)
+                    elif field_type == 'submit':
+                        self._submits.append(field)
+
+    @property
+    def fields(self):
+        if self._fields is None:
+            self._build()
+        return self._fields
+
+    @property
+    def radio_groups(self):
+        """
+        Radio buttons by name, each group in document order.
+        """
+        if self._fields is None:
+            self._build()
+        return self._radio_groups
+
+    @property
+    def submits(self):
+        """
+        The form's submit inputs, in document order.
+        """
+        if self._fields is None:
+            self._build()
+        return self._submits
+
+    def field_number(self, field):
+        """
+        Return the 0-based number of 'field' (a pyquery object) in the form.
+        """
+        if self._fields is None:
+            self._build()
+        return self._numbers[field[0]]
+
+    def find_fields(self, fieldname):
+        """
+        Find the field(s) matching 'fieldname': a 1-based field number,
+        a field name (inputs first, then selects, then textareas), or a
+        field id.  Returns (tag, [field, ...]); several fields share a
+        name in e.g. radio groups.
+        """
+        if self._fields is None:
+            self._build()
+
+        try:
+            n = int(fieldname) - 1
+        except ValueError:
+            pass
+        else:
+            if 0 <= n < len(self._fields):
+                field = self._fields[n]
+                return field[0].tag, [field]
+            raise TwineAssertionError("no field matches \"%d\"" % n)
+
+        for tag in field_tags:
+            fields = self._by_name.get((tag, fieldname))
+            if fields:
+                return tag, fields
+
+        field = self._by_id.get(fieldname)
+        if field is not None:
+            return field[0].tag, [field]
+
+        raise TwineAssertionError("no field matches \"%s\"" % fieldname)
+
+    def match_fields(self, regexp):
+        """
+        Find the fields whose names match the compiled regular expression
+        'regexp', skipping read-only fields.  Returns a list of (tag,
+        [field, ...]) in field order, with each radio group as one entry.
+        """
+        matches = []
+        seen_groups = set()
+        for field in self.fields:
+            name = field.attr.name
+            if name is None or not regexp.search(name) or \
+               field.attr.readonly is not None:
+                continue
+
+            tag = field[0].tag
+            if tag == 'input' and field.attr.type == 'radio':
+                if name not in seen_groups:
+                    seen_groups.add(name)
+                    matches.append((tag, self.radio_groups[name]))
+            else:
+                matches.append((tag, [field]))
+        return matches
+
+def field_state(element):
+    """
+    Return the state of the form field (lxml element) 'element' as a
+    dictionary, in the same form TwineBrowser.form_snapshot() gets it from
+    the live page: tag, type, name, id, value, checked and, for selects,
+    options (each with value, text and selected).
+    """
+    tag = element.tag
+    state = dict(tag=tag, type=element.get('type'), name=element.get('name'),
+                 id=element.get('id'),
+                 checked=element.get('checked') is not None)
+
+    if tag == 'select':
+        options = []
+        for option in element.iter('option'):
+            text = option.text_content()
+            value = option.get('value')
+            if value is None:
+                value = text
+            options.append(dict(value=value, text=text,
+                                selected=option.get('selected') is not None))
+        state['options'] = options
+
+        selected = [ o['value'] for o in options if o['selected'] ]
+        state['value'] = (selected or [ o['value'] for o in options ] or
+                          [""])[0]
+    elif tag == 'textarea':
+        state['value'] = element.text or ""
+    else:
+        state['value'] = element.get('value') or ""
+
+    return state
+
+class PageModel(object):
+    """
+    Parsed view of one page: the pyquery document plus the forms, links
+    and title commands keep asking for, each computed once.
+    """
+    def __init__(self, soup):
+        self.soup = soup
+        self._forms = None
+        self._form_indexes = None
+        self._forms_by_name = None
+        self._forms_by_id = None
+        self._links = None
+        self._title = None
+
+        # form state before the first change to a form on this page, for
+        # 'formclear'; see BaseBrowser._initial_form_state().
+        self.initial_form_state = None
+
+    def __call__(self, selector):
+        """
+        Query the page with a CSS selector, like calling 'soup'.
+        """
+        return self.soup(selector)
+
+    @property
+    def forms(self):
+        """
+        The forms on the page, in document order, as pyquery objects.
+        """
+        if self._forms is None:
+            self._forms = list(self.soup("form").items())
+        return self._forms
+
+    def _index_forms(self):
+        self._form_indexes = [ FormIndex(form, n)
+                               for n, form in enumerate(self.forms) ]
+        self._forms_by_name = {}        # name => [FormIndex, ...]
+        self._forms_by_id = {}          # id => FormIndex
+        for index in self._form_indexes:
+            name = index.form.attr.name
+            if name is not None:
+                self._forms_by_name.setdefault(name, []).append(index)
+            form_id = index.form.attr.id
+            if form_id and form_id not in self._forms_by_id:
+                self._forms_by_id[form_id] = index
+
+    @property
+    def form_indexes(self):
+        """
+        A FormIndex for each form on the page, in document order.
+        """
+        if self._form_indexes is None:
+            self._index_forms()
+        return self._form_indexes
+
+    def find_form(self, formname):
+        """
+        Return the FormIndex of the form matching 'formname': a 1-based
+        form number, a form name, or a form id.
+        """
+        if self._form_indexes is None:
+            self._index_forms()
+
+        try:
+            n = int(formname) - 1
+        except ValueError:
+            pass
+        else:
+            if 0 <= n < len(self._form_indexes):
+                return self._form_indexes[n]
+            raise TwineAssertionError("no matching forms!")
+
+        matches = self._forms_by_name.get(formname)
+        if matches:
+            if len(matches) > 1:
+                raise TwineAssertionError("multiple form matches")
+            return matches[0]
+
+        index = self._forms_by_id.get(formname)
+        if index is None:
+            raise TwineAssertionError("no matching forms!")
+        return index
+
+    def form_state(self):
+        """
+        Return the state of every field in every form, as parsed: a list
+        with a dictionary (name, id, fields) per form, whose 'fields' hold
+        a field_state() per field, in FormIndex order.
+        """
+        return [ dict(name=index.form.attr.name, id=index.form.attr.id,
+                      fields=[ field_state(field[0])
+                               for field in index.fields ])
+                 for index in self.form_indexes ]
+
+    @property
+    def links(self):
+        """
+        The links on the page, in document order, as pyquery objects.
+        """
+        if self._links is None:
+            self._links = list(self.soup("a").items())
+        return self._links
+
+    @property
+    def title(self):
+        if self._title is None:
+            self._title = self.soup("title").text() or ""
+        return self._title
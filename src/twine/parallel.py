@@ -0,0 +1,105 @@
+"""
+Run twine scripts in a pool of worker processes.
+
+Each worker process gets its own browser and its own namespace stack, so
+scripts running at the same time cannot see each other's pages, cookies
+or variables.  Output from each script is captured in the worker and
+handed back to the parent, which prints it in the original file order.
+"""
+
+import sys
+import traceback
+import multiprocessing
+from cStringIO import StringIO
+
+class ScriptResult(object):
+    """
+    Outcome of running a single script in a worker process.
+    """
+    def __init__(self, filename, output, errout, error=None, tb=None,
+                 profile=None, trace=None, cache_stats=None):
+        self.filename = filename
+        self.output = output            # captured stdout/twine output
+        self.errout = errout            # captured stderr/twine error output
+        self.error = error              # str(exception), or None on success
+        self.traceback = tb             # formatted traceback, or None
+        self.profile = profile          # timing.LineStats list, or None
+        self.trace = trace              # tracing events, or None
+        self.cache_stats = cache_stats  # httpcache hit/miss counts
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+def _init_worker(profile, trace):
+    """
+    Set up a freshly started worker process: new browser, empty
+    namespace stack, and profiling/tracing on if the parent has them on.
+    """
+    from twine import commands, namespaces, timing, tracing
+
+    del namespaces._local_dict_stack[:]
+    commands.reset_browser()
+    timing.enable(profile)
+    tracing.enable(trace)
+
+def _run_script(job):
+    """
+    Execute one script inside a worker, capturing all of its output.
+    """
+    import twine
+    from twine import parse, timing, tracing, httpcache
+
+    filename, kw = job
+
+    out, err = StringIO(), StringIO()
+    old_stdout, old_stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = out, err
+    twine.set_output(out)
+    twine.set_errout(err)
+    timing.clear()
+    tracing.clear()
+    httpcache.clear_stats()
+
+    error = tb = None
+    try:
+        try:
+            parse.execute_file(filename, **kw)
+        except Exception, e:
+            error = str(e)
+            tb = traceback.format_exc()
+    finally:
+        sys.stdout, sys.stderr = old_stdout, old_stderr
+        twine.set_output(None)
+        twine.set_errout(None)
+
+    profile = trace = None
+    if timing.enabled:
+        profile = timing.get_stats()
+    if tracing.enabled:
+        trace = tracing.get_events()
+
+    return ScriptResult(filename, out.getvalue(), err.getvalue(), error, tb,
+                        profile, trace, httpcache.get_stats())
+
+def run_files(filenames, jobs, **kw):
+    """
+    Run each of the given script files in a pool of 'jobs' worker
+    processes.  Keyword arguments are passed on to 'execute_file'.
+
+    Yields a ScriptResult for each file, in the order the files were
+    given, as soon as that file (and all the files before it) are done.
+    """
+    from twine import timing, tracing
+
+    pool = multiprocessing.Pool(jobs, _init_worker,
+                                (timing.enabled, tracing.enabled))
+    try:
+        work = [ (filename, kw) for filename in filenames ]
+        for result in pool.imap(_run_script, work):
+            yield result
+
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
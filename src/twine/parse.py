@@ -3,105 +3,208 @@ Code parsing and evaluation for the twine mini-language.
 """
 
 import sys
+import time
 from cStringIO import StringIO
 
-from errors import TwineAssertionError, TwineNameError
-from pyparsing import OneOrMore, Word, printables, quotedString, Optional, \
-     alphas, alphanums, ParseException, ZeroOrMore, restOfLine, Combine, \
-     Literal, Group, removeQuotes, CharsNotIn
+from errors import TwineAssertionError, TwineNameError, TwineParseError
 
 import twine.commands as commands
 import namespaces
+import compiled
+import timing
+import tracing
+import inspect
 import re
 
-### pyparsing stuff
-
-# basically, a valid Python identifier:
-command = Word(alphas + "_", alphanums + "_")
-command = command.setResultsName('command')
-command.setName("command")
-
-# arguments to it.
-
-# we need to reimplement all this junk from pyparsing because pcre's
-# idea of escapable characters contains a lot more than the C-like
-# thing pyparsing implements
-_bslash = "\\"
-_sglQuote = Literal("'")
-_dblQuote = Literal('"')
-_escapables = printables
-_escapedChar = Word(_bslash, _escapables, exact=2)
-dblQuotedString = Combine( _dblQuote + ZeroOrMore( CharsNotIn('\\"\n\r') | _escapedChar | '""' ) + _dblQuote ).streamline().setName("string enclosed in double quotes")
-sglQuotedString = Combine( _sglQuote + ZeroOrMore( CharsNotIn("\\'\n\r") | _escapedChar | "''" ) + _sglQuote ).streamline().setName("string enclosed in single quotes")
-quotedArg = ( dblQuotedString | sglQuotedString )
-quotedArg.setParseAction(removeQuotes)
-quotedArg.setName("quotedArg")
-
-plainArgChars = printables.replace('#', '').replace('"', '').replace("'", "")
-plainArg = Word(plainArgChars)
-plainArg.setName("plainArg")
-
-arguments = Group(ZeroOrMore(quotedArg | plainArg))
-arguments = arguments.setResultsName('arguments')
-arguments.setName("arguments")
-
-# comment line.
-comment = Literal('#') + restOfLine
-comment = comment.suppress()
-comment.setName('comment')
-
-full_command = (
-    comment
-    | (command + arguments + Optional(comment))
-    )
-full_command.setName('full_command')
+### tokenizer
+
+# A hand-written, single-pass equivalent of the pyparsing grammar in
+# twine.grammar, which is much faster.  A line is a comment, or a command
+# (basically a valid Python identifier) followed by any number of quoted
+# or plain arguments and an optional trailing comment.
+#
+# Quoted arguments use pyparsing-like rules rather than Python's: inside
+# the quotes, a backslash "escapes" any printable character (and is kept),
+# a doubled quote stands for itself, and newlines are not allowed.  Like
+# pyparsing, the scanner never backtracks: a quote followed by another
+# quote is always taken as a doubled quote.
+#
+# As with the grammar, anything after the last recognizable argument is
+# silently ignored.
+
+_whitespace = r'[ \t\n\r]*'
+
+_printables = ''.join([ chr(i) for i in range(33, 127) ])
+_plain_arg_chars = _printables.replace('#', '').replace('"', '').replace("'", "")
+
+_command_re = re.compile(_whitespace + r'(?:(#)|([A-Za-z_][A-Za-z0-9_]*))')
+
+# (the quoted-argument patterns are written as "unrolled loops", so that
+# an unterminated quote fails in linear time.)
+_argument_re = re.compile(_whitespace + r"""(?:
+      "([^\\"\n\r]*(?:(?:\\[!-~]|"")[^\\"\n\r]*)*)"(?!")    # double-quoted
+    | '([^\\'\n\r]*(?:(?:\\[!-~]|'')[^\\'\n\r]*)*)'(?!')    # single-quoted
+    | ([%s]+)                                          # plain
+    )""" % (re.escape(_plain_arg_chars),), re.VERBOSE)
+
+_rest_re = re.compile(_whitespace + r'(#.*)?', re.DOTALL)
+
+def _scan_arguments(line, pos):
+    """
+    Collect the arguments in 'line' starting at 'pos'.  Returns the list
+    of arguments and the position scanning stopped at.
+    """
+    args = []
+    match = _argument_re.match
+    while 1:
+        m = match(line, pos)
+        if m is None:
+            return args, pos
+
+        dbl, sgl, plain = m.groups()
+        if plain is not None:
+            args.append(plain)
+        elif dbl is not None:
+            args.append(dbl)
+        else:
+            args.append(sgl)
+        pos = m.end()
+
+def scan_line(line):
+    """
+    Tokenize a line into (command, arguments, leftover).
+
+    'command' is None for comment lines.  'leftover' is the part of the
+    line that couldn't be tokenized (e.g. starting at an unbalanced
+    quote), which is ignored when the line is executed; it's '' if the
+    whole line was understood.
+
+    Raises TwineParseError if the line doesn't start with a command or
+    a comment.
+    """
+    line = line.expandtabs()
+
+    m = _command_re.match(line)
+    if m is None:
+        raise TwineParseError("expected a command or a comment, found '%s'"
+                              % (line.strip(),))
+    if m.group(1):
+        return None, None, ''
+
+    args, pos = _scan_arguments(line, m.end())
+
+    rest = _rest_re.match(line, pos)
+    return m.group(2), args, line[rest.end():]
+
+_use_pyparsing = False
+
+def use_pyparsing(flag):
+    """
+    Turn on/off tokenizing with the original pyparsing grammar (see
+    twine.grammar) instead of the built-in scanner.  'flag' is bool.
+    """
+    global _use_pyparsing
+    _use_pyparsing = bool(flag)
 
 ###
 
-command_list = []           # filled in by namespaces.init_global_dict().
+### command registry
+
+class CommandInfo(object):
+    """
+    A registered twine command: its name, the function implementing it,
+    and how many arguments that function accepts ('max_args' is None if
+    there's no upper limit).
+    """
+    __slots__ = ('name', 'fn', 'min_args', 'max_args')
+
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+        self.min_args, self.max_args = _arity(fn)
+
+    def accepts(self, n):
+        """
+        Return True if the command can be called with 'n' arguments.
+        """
+        return self.min_args <= n and \
+               (self.max_args is None or n <= self.max_args)
+
+def _arity(fn):
+    """
+    Return the (minimum, maximum) number of positional arguments 'fn'
+    accepts; maximum is None for *args functions.
+    """
+    if inspect.ismethod(fn):
+        skip = 1
+        fn = fn.im_func
+    elif inspect.isfunction(fn):
+        skip = 0
+    else:
+        return 0, None                  # some other callable; can't tell.
+
+    args, varargs, varkw, defaults = inspect.getargspec(fn)
+    n_args = len(args) - skip
+    n_defaults = len(defaults or ())
+
+    if varargs:
+        return n_args - n_defaults, None
+    return n_args - n_defaults, n_args
+
+command_registry = {}       # name => CommandInfo; see register_command().
+command_list = []           # command names, in the order they were added.
+
+def register_command(name, fn):
+    """
+    Make 'fn' available as the twine command 'name'.
+
+    The twine commands are registered by namespaces.init_global_dict(),
+    and extension commands by 'extend_with'.
+    """
+    if name not in command_registry:
+        command_list.append(name)
+    command_registry[name] = CommandInfo(name, fn)
 
 ### command/argument handling.
 
 def process_args(args, globals_dict, locals_dict):
     """
-    Take a list of string arguments parsed via pyparsing and evaluate
-    the special variables ('__*').
+    Take a list of string arguments as tokenized from a script line and
+    evaluate the special variables ('$*', '${*}', '__*'); see
+    compiled.Argument.
 
     Return a new list.
     """
     newargs = []
     for arg in args:
-        # __variable substitution.
-        if arg.startswith('__'):
-            try:
-                val = eval(arg, globals_dict, locals_dict)
-            except NameError:           # not in dictionary; don't interpret.
-                val = arg
-
-
-            print '*** VAL IS', val, 'FOR', arg
-            
-            if isinstance(val, str) or isinstance(val, unicode):
-                newargs.append(val)
-            else:
-                newargs.extend(val)
-                
-        # $variable substitution
-        elif arg.startswith('$') and not arg.startswith('${'):
-            try:
-                val = eval(arg[1:], globals_dict, locals_dict)
-            except NameError:           # not in dictionary; don't interpret.
-                val = arg
-            newargs.append(val)
-        else:
-            newargs.append(variable_substitution(arg, globals_dict, locals_dict))
-
-    newargs = [ i.replace('\\n', '\n') for i in newargs ]
+        compiled.get_argument(arg).expand(globals_dict, locals_dict, newargs)
+    return newargs
 
+def expand_arguments(templates, globals_dict, locals_dict):
+    """
+    Like process_args, for a list of already-compiled Argument templates.
+    """
+    newargs = []
+    for template in templates:
+        template.expand(globals_dict, locals_dict, newargs)
     return newargs
 
 ###
 
+# code objects that call a command, compiled with the 'file:line' info
+# of the script line as their file name so that it shows up in error
+# tracebacks.
+_call_code = {}
+
+def _get_call_code(cmdinfo):
+    code = _call_code.get(cmdinfo)
+    if code is None:
+        if len(_call_code) > 10000:
+            _call_code.clear()
+        code = _call_code[cmdinfo] = compile("__fn__(*__args__)", cmdinfo,
+                                             'eval')
+    return code
+
 def execute_command(cmd, args, globals_dict, locals_dict, cmdinfo):
     """
     Actually execute the command.
@@ -109,24 +212,26 @@ def execute_command(cmd, args, globals_dict, locals_dict, cmdinfo):
     Side effects: __args__ is set to the argument tuple, __cmd__ is set to
     the command.
     """
-    global command_list                 # all supported commands:
     # execute command.
     locals_dict['__cmd__'] = cmd
     locals_dict['__args__'] = args
-    if cmd not in command_list:
-        raise TwineNameError("unknown twine command: '%s'" % (cmd,))
 
-    eval_str = "%s(*__args__)" % (cmd,)
-
-    # compile the code object so that we can get 'cmdinfo' into the
-    # error tracebacks.
-    codeobj = compile(eval_str, cmdinfo, 'eval')
+    info = command_registry.get(cmd)
+    if info is None:
+        raise TwineNameError("unknown twine command: '%s'" % (cmd,))
 
-    # eval the codeobj in the appropriate dictionary.
-    result = eval(codeobj, globals_dict, locals_dict)
+    start = tracing.enabled and time.time()
+    try:
+        result = eval(_get_call_code(cmdinfo),
+                      {'__fn__' : info.fn, '__args__' : args})
+    finally:
+        if start:
+            trace_args = tracing.page_args()
+            trace_args['location'] = cmdinfo
+            tracing.complete(cmd, 'command', start, trace_args)
     
     # set __url__
-    locals_dict['__url__'] = commands.get_browser().url
+    locals_dict['__url__'] = commands.get_url()
 
     return result
 
@@ -134,22 +239,153 @@ def execute_command(cmd, args, globals_dict, locals_dict, cmdinfo):
 
 _print_commands = False
 
+def tokenize_command(line):
+    """
+    Split a line into the command and its (unprocessed) arguments.
+
+    Returns (None, None) for comments.
+    """
+    if _use_pyparsing:
+        from grammar import full_command, ParseException
+        try:
+            res = full_command.parseString(line)
+        except ParseException, e:
+            raise TwineParseError(str(e))
+
+        if res:
+            return (res.command, res.arguments.asList())
+        return None, None               # e.g. a comment
+
+    cmd, args, leftover = scan_line(line)
+    return cmd, args
+
+def tokenize_arguments(rest_of_line):
+    """
+    Split the arguments following a command into a list of (unprocessed)
+    arguments.
+    """
+    if _use_pyparsing:
+        from grammar import arguments
+        return arguments.parseString(rest_of_line)[0].asList()
+
+    args, pos = _scan_arguments(rest_of_line.expandtabs(), 0)
+    return args
+
 def parse_command(line, globals_dict, locals_dict):
     """
     Parse command.
     """
-    res = full_command.parseString(line)
-    if res:
+    cmd, args = tokenize_command(line)
+    if cmd is not None:
         if _print_commands:
             print>>commands.OUT, "twine: executing cmd '%s'" % (line.strip(),)
             
-        args = process_args(res.arguments.asList(), globals_dict, locals_dict)
-        return (res.command, args)
+        args = process_args(args, globals_dict, locals_dict)
+        return (cmd, args)
 
     return None, None                   # e.g. a comment
 
 ###
 
+# '# twine: engine=<name>' comment to pick the engine for a script.
+engine_pragma = re.compile(r"^\s*#\s*twine:\s*engine\s*=\s*(\w+)")
+
+def compile_script(inp, source):
+    """
+    Read and tokenize all lines from a file-like iterator up front.
+
+    Returns a CompiledScript with one Command per non-empty line; a line
+    that could not be parsed carries its error message, to be raised when
+    execution reaches it.
+    """
+    script = []
+    pragma = None
+
+    for n, line in enumerate(inp):
+        if not line.strip():            # skip empty lines
+            continue
+
+        m = engine_pragma.match(line)
+        if m:
+            pragma = m.group(1)
+
+        start = time.time()
+        try:
+            cmd, args = tokenize_command(line)
+            script.append(compiled.Command(n, line, cmd, args))
+        except TwineParseError, e:
+            script.append(compiled.Command(n, line, None, None, str(e)))
+            cmd = None
+
+        if cmd is not None and timing.enabled:
+            timing.record_parse(source, n, line, time.time() - start)
+
+    return compiled.CompiledScript(source, script, pragma)
+
+def load_script(filename):
+    """
+    Return the CompiledScript for the given file, from the compiled-script
+    cache if the file hasn't changed since it was last compiled.
+    """
+    script = compiled.get(filename)
+    if script is None:
+        fp = open(filename)
+        try:
+            script = compile_script(fp, filename)
+        finally:
+            fp.close()
+        compiled.put(filename, script)
+
+    return script
+
+def _uses_javascript(script, seen):
+    """
+    Return the first JavaScript-dependent command used by the script or
+    any script it pulls in with 'runfile', or None.
+    """
+    for command in script:
+        cmd = command.cmd
+        if cmd in commands.javascript_commands:
+            return cmd
+
+        if cmd == 'runfile':
+            for filename in command.args:
+                if filename.startswith('$') or filename.startswith('__') \
+                   or '${' in filename or filename in seen:
+                    continue
+                seen.add(filename)
+
+                try:
+                    subscript = load_script(filename)
+                except IOError:
+                    continue
+
+                found = _uses_javascript(subscript, seen)
+                if found:
+                    return found
+
+    return None
+
+def choose_engine(script):
+    """
+    Pick the browser engine for a compiled script: 'http' unless it uses
+    a command that needs JavaScript (and the webkit engine is installed),
+    or an engine pragma says otherwise.
+
+    Returns (engine, reason).
+    """
+    if script.pragma:
+        return script.pragma, "engine pragma"
+
+    found = _uses_javascript(script, set())
+    if found and not commands.webkit_installed():
+        return 'http', "script uses '%s', but the webkit engine isn't " \
+               "installed" % (found,)
+    if found:
+        return 'webkit', "script uses '%s'" % (found,)
+
+    return 'http', "no JavaScript commands"
+
 def execute_string(buf, **kw):
     """
     Execute commands from a string buffer.
@@ -160,7 +396,7 @@ def execute_string(buf, **kw):
     if not kw.has_key('no_reset'):
        kw['no_reset'] = True
     
-    _execute_script(fp, **kw)
+    _execute_script(compile_script(fp, kw['source']), **kw)
 
 def execute_file(filename, **kw):
     """
@@ -168,72 +404,97 @@ def execute_file(filename, **kw):
     """
     # read the input lines
     if filename == "-":
-        inp = sys.stdin
+        script = compile_script(sys.stdin, filename)
     else:
-        inp = open(filename)
+        script = load_script(filename)
 
     kw['source'] = filename
 
-    _execute_script(inp, **kw)
+    start = tracing.enabled and time.time()
+    try:
+        _execute_script(script, **kw)
+    finally:
+        if start:
+            tracing.complete(filename, 'script', start, tracing.page_args())
     
-def _execute_script(inp, **kw):
+def _execute_script(script, **kw):
     """
-    Execute lines taken from a file-like iterator.
+    Execute the commands in a CompiledScript.
     """
+
     # initialize new local dictionary & get global + current local
     namespaces.new_local_dict()
     globals_dict, locals_dict = namespaces.get_twine_glocals()
     
-    locals_dict['__url__'] = commands.get_browser().url
+    locals_dict['__url__'] = commands.get_url()
+
+    # sourceinfo stuff
+    sourceinfo = kw.get('source', "<input>")
 
-    # reset browser
+    # reset browser, picking the engine for this script if need be.
     if not kw.get('no_reset'):
-        commands.reset_browser()
+        engine = commands._options.get('engine')
+        if engine == 'auto':
+            engine, reason = choose_engine(script)
+            print>>commands.OUT, "twine: using the '%s' engine for %s (%s)" \
+                  % (engine, sourceinfo, reason)
+        commands.reset_browser(engine)
 
     # go to a specific URL?
     init_url = kw.get('initial_url')
     if init_url:
         commands.go(init_url)
-        locals_dict['__url__'] = commands.get_browser().url
+        locals_dict['__url__'] = commands.get_url()
 
     # should we catch exceptions on failure?
     catch_errors = False
     if kw.get('never_fail'):
         catch_errors = True
 
-    # sourceinfo stuff
-    sourceinfo = kw.get('source', "<input>")
-    
     try:
 
-        for n, line in enumerate(inp):
-            if not line.strip():            # skip empty lines
-                continue
+        for command in script:
+            n, line, cmd = command.lineno, command.line, command.cmd
 
             cmdinfo = "%s:%d" % (sourceinfo, n,)
-            print 'AT LINE:', cmdinfo
 
-            cmd, args = parse_command(line, globals_dict, locals_dict)
+            if command.error is not None:
+                raise TwineParseError(command.error)
+
             if cmd is None:
                 continue
 
+            if _print_commands:
+                print>>commands.OUT, "twine: executing cmd '%s'" % \
+                      (line.strip(),)
+
+            timing.begin_line(sourceinfo, n, line)
             try:
-                execute_command(cmd, args, globals_dict, locals_dict, cmdinfo)
-            except SystemExit:
-                # abort script execution, if a SystemExit is raised.
-                return
-            except TwineAssertionError, e:
-                print>>commands.ERR, '''\
+                timing.push('subst')
+                try:
+                    args = expand_arguments(command.templates, globals_dict,
+                                            locals_dict)
+                finally:
+                    timing.pop()
+
+                try:
+                    execute_command(cmd, args, globals_dict, locals_dict,
+                                    cmdinfo)
+                except SystemExit:
+                    # abort script execution, if a SystemExit is raised.
+                    return
+                except TwineAssertionError, e:
+                    print>>commands.ERR, '''\
 Oops!  Twine assertion error on line %d of '%s' while executing
 
   >> %s
 
 %s
 ''' % (n, sourceinfo, line.strip(), e)
-                if not catch_errors:
-                    raise
-            except Exception, e:
-                print>>commands.ERR, '''\
+                    if not catch_errors:
+                        raise
+                except Exception, e:
+                    print>>commands.ERR, '''\
 EXCEPTION raised at line %d of '%s'
 
       %s
@@ -242,8 +503,10 @@ Error message: '%s'
 
 ''' % (n, sourceinfo, line.strip(),str(e).strip(),)
 
-                if not catch_errors:
-                    raise
+                    if not catch_errors:
+                        raise
+            finally:
+                timing.end_line()
 
     finally:
         namespaces.pop_local_dict()
@@ -256,22 +519,3 @@ def debug_print_commands(flag):
     """
     global _print_commands
     _print_commands = bool(flag)
-        
-
-variable_expression = re.compile("\${(.*?)}")
-
-def variable_substitution(raw_str, globals_dict, locals_dict):
-    str=''
-    pos = 0
-    for m in variable_expression.finditer(raw_str):
-        str = str+raw_str[pos:m.start()]
-        try:
-            str = str + eval(m.group(1), globals_dict, locals_dict)
-        except NameError:
-            str = str + m.group()
-        pos = m.end()
-
-    str = str+raw_str[pos:]
-
-    return str
-
@@ -0,0 +1,98 @@
+"""
+Which of the requests a page makes to let through.
+
+Twine's assertions look at HTML, so the images, fonts, media and
+third-party scripts a page pulls in are mostly wasted time.  The webkit
+engine asks the RequestPolicy about every request its network access
+manager makes (through spynner's URL filter, see TwineBrowser), and turns
+the ones it blocks into requests for about:blank.  The policy is set up
+with the 'block_types' and 'block_third_party' config options and the
+'block_urls' command.
+
+The URL filter only sees the URL, so resource types are guessed from the
+file extension of the URL's path.
+"""
+
+import re
+import urlparse
+
+# file extensions by resource type.
+resource_types = {
+    'image': ('png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp'),
+    'font': ('woff', 'woff2', 'ttf', 'otf', 'eot'),
+    'media': ('mp3', 'mp4', 'm4a', 'm4v', 'ogg', 'ogv', 'oga', 'wav', 'webm',
+              'avi', 'mov', 'flv'),
+    'stylesheet': ('css',),
+    'script': ('js',),
+}
+
+_types_by_extension = {}
+for _type, _extensions in resource_types.items():
+    for _extension in _extensions:
+        _types_by_extension[_extension] = _type
+
+def resource_type(url):
+    """
+    Guess the type of resource at 'url' ('image', 'font', ...) from its
+    file extension; returns None if there's no telling.
+    """
+    path = urlparse.urlsplit(url)[2]
+    name = path.rsplit('/', 1)[-1]
+    if '.' not in name:
+        return None
+    return _types_by_extension.get(name.rsplit('.', 1)[1].lower())
+
+def parse_types(value):
+    """
+    Parse a comma-separated list of resource types, as given to the
+    'block_types' option.
+    """
+    types = [ t.strip() for t in value.split(',') if t.strip() ]
+    for t in types:
+        if t not in resource_types:
+            raise ValueError("unknown resource type '%s'; use %s" %
+                             (t, ", ".join(sorted(resource_types))))
+    return types
+
+def _host(url):
+    return (urlparse.urlsplit(url).hostname or '').lower()
+
+def _same_site(host, page_host):
+    return host == page_host or host.endswith('.' + page_host) or \
+           page_host.endswith('.' + host)
+
+class RequestPolicy(object):
+    """
+    Decides which requests made by a page to block: those for the given
+    resource types, those whose URL matches one of the given regular
+    expressions, and (with third_party) those to other sites.
+    """
+    def __init__(self, types=(), patterns=(), third_party=False):
+        self.types = set(types)
+        self.patterns = [ re.compile(p) for p in patterns ]
+        self.third_party = third_party
+
+    def __nonzero__(self):
+        return bool(self.types or self.patterns or self.third_party)
+
+    def check(self, url, page_url):
+        """
+        Return why the request for 'url', made by the page at 'page_url',
+        should be blocked -- 'url', 'third-party' or the resource type --
+        or None to let it through.
+        """
+        for pattern in self.patterns:
+            if pattern.search(url):
+                return 'url'
+
+        if self.third_party and page_url:
+            page_host = _host(page_url)
+            if page_host and not _same_site(_host(url), page_host):
+                return 'third-party'
+
+        if self.types:
+            kind = resource_type(url)
+            if kind in self.types:
+                return kind
+
+        return None
@@ -7,6 +7,7 @@ This is an implementation of a command-line interpreter based on the
 
 import cmd
 from twine import commands, parse, __version__
+from errors import TwineException
 import namespaces
 
 try:
@@ -27,7 +28,7 @@ def make_cmd_fn(cmd):
         args = []
         if rest_of_line.strip() != "":
             try:
-                args = parse.arguments.parseString(rest_of_line)[0]
+                args = parse.tokenize_arguments(rest_of_line)
                 args = parse.process_args(args, global_dict,local_dict)
             except Exception, e:
                 print '\nINPUT ERROR: %s\n' % (str(e),)
@@ -120,11 +121,9 @@ class TwineCommandLoop(Singleton, cmd.Cmd):
 
         self.names = []
         
-        global_dict, local_dict = namespaces.get_twine_glocals()
-
         ### add all of the commands from twine.
         for command in parse.command_list:
-            fn = global_dict.get(command)
+            fn = parse.command_registry[command].fn
             self.add_command(command, fn.__doc__)
 
     def add_command(self, command, docstring):
@@ -161,36 +160,47 @@ class TwineCommandLoop(Singleton, cmd.Cmd):
     complete_fv = complete_formvalue
 
     def provide_formname(self, prefix):
+        if not commands.get_url():
+            return []
+
         names = []
-        forms = commands.browser._browser.forms()
-        for f in forms:
-            id = f.attrs.get('id')
+        for f in commands.browser.form_snapshot():
+            id = f['id']
             if id and id.startswith(prefix):
                 names.append(id)
                 continue
-            name = f.name
+            name = f['name']
             if name and name.startswith(prefix):
                 names.append(name)
         return names
 
     def provide_field(self, formname, prefix):
-        names = []
-        form = commands.browser.get_form(formname)
-        if not form:
+        if not commands.get_url():
             return []
-        for c in form.controls:
-            id = c.id
+
+        try:
+            form_number = commands.browser.find_form(formname)[1]
+        except TwineException:
+            return []
+
+        forms = commands.browser.form_snapshot()
+        if form_number >= len(forms):
+            return []
+
+        names = []
+        for c in forms[form_number]['fields']:
+            id = c['id']
             if id and id.startswith(prefix):
                 names.append(id)
                 continue
-            name = c.name
+            name = c['name']
             if name and name.startswith(prefix):
                 names.append(name)
         return names
 
     def _set_prompt(self):
         "Set the prompt to the current page."
-        url = commands.get_browser().url or " *empty page* "
+        url = commands.get_url() or " *empty page* "
         self.prompt = "current page: %s\n>> " % (url,)
 
     def precmd(self, line):
@@ -228,6 +238,12 @@ class TwineCommandLoop(Singleton, cmd.Cmd):
             if self.fail_on_unknown:
                 raise
 
+    def preloop(self):
+        # commands read from the keyboard are interactive (e.g. extend_with
+        # describes the extension), however the loop was started.
+        global interactive
+        interactive = self.use_rawinput
+
     def emptyline(self):
         "Ignore empty lines."
         pass
@@ -269,6 +285,7 @@ def main():
     import sys
     from twine import TwineCommandLoop, execute_file, __version__
     from twine.utils import gather_filenames
+    from twine import timing, tracing, httpcache
     from optparse import OptionParser
     from cStringIO import StringIO
 
@@ -297,12 +314,41 @@ def main():
                       dest="never_fail",
                       help = 'continue executing scripts past errors')
 
+    parser.add_option('--profile-report', action="store_true",
+                      dest="profile_report",
+                      help="time each script line and report the slowest ones")
+
+    parser.add_option('--profile-top', type="int", action="store",
+                      dest="profile_top", default=10,
+                      help="number of lines in the profile report (default 10)")
+
+    parser.add_option('--profile-json', action="store", dest="profile_json",
+                      help="write per-line timings to the given JSON file")
+
+    parser.add_option('--trace', action="store", dest="trace",
+                      help="write a Chrome trace-event JSON file of the run")
+
+    parser.add_option('--cache', action="store", dest="cache",
+                      help="keep a persistent HTTP cache in the given directory")
+    parser.add_option('--recheck-all', action="store_true", dest="recheck_all",
+                      help="check links again even if the cache knows them")
+
+    parser.add_option('-c', '--check', action="store_true", dest="check",
+                      help = 'check scripts for mistakes without running them')
+
     parser.add_option('-v', '--version', action="store_true", dest="show_version",
                       help = 'show version information and exit')
 
     parser.add_option('-u', '--url', nargs=1, action="store", dest="url",
                       help="start at the given URL before each script")
 
+    parser.add_option('-j', '--jobs', type="int", action="store", dest="jobs",
+                      default=1,
+                      help="run scripts in N parallel worker processes")
+
+    parser.add_option('-e', '--engine', action="store", dest="engine",
+                      help="browser engine to use: 'auto' (default), 'webkit' or 'http'")
+
     ####
 
     # parse arguments.
@@ -324,11 +370,32 @@ def main():
         print 'twine version %s.' % (__version__,)
         sys.exit(0)
 
+    if options.engine:
+        commands.config('engine', options.engine)
+    if options.cache:
+        commands.config('cache_dir', options.cache)
+    if options.recheck_all:
+        commands.config('recheck_links', '1')
+
+    if options.check:
+        from twine.check import check_files
+
+        assert args, "--check needs script files or directories to check"
+        if check_files(gather_filenames(args), sys.stdout):
+            sys.exit(1)
+        sys.exit(0)
+
+    if options.profile_report or options.profile_json:
+        timing.enable()
+    if options.trace:
+        tracing.enable()
+
+    # (the profile report goes here even with -q.)
+    old_stdout = sys.stdout
     if options.quiet:
         assert not options.interact, "interactive mode is incompatible with -q"
         assert args, "interactive mode is incompatible with -q"
 
-        old_stdout = sys.stdout
         sys.stdout = StringIO()
 
     # If run from the command line, find & run any scripts put on the command
@@ -341,24 +408,52 @@ def main():
 
         filenames = gather_filenames(args)
 
-        for filename in filenames:
-            print '>> EXECUTING FILE', filename
-
-            try:
-                interactive = False
-                execute_file(filename,
-                             initial_url=options.url,
-                             never_fail=options.never_fail)
-                success.append(filename)
-            except Exception, e:
-                if options.fail:
-#                    import pdb
-#                    _, _, tb = sys.exc_info()
-#                    pdb.post_mortem(tb)
-                    raise
+        if options.jobs > 1 and len(filenames) > 1:
+            from twine.parallel import run_files
+
+            interactive = False
+            results = run_files(filenames, options.jobs,
+                                initial_url=options.url,
+                                never_fail=options.never_fail)
+            for result in results:
+                print '>> EXECUTING FILE', result.filename
+                sys.stdout.write(result.output)
+                sys.stderr.write(result.errout)
+                if result.profile:
+                    timing.merge(result.profile)
+                if result.trace:
+                    tracing.merge(result.trace)
+                if result.cache_stats:
+                    httpcache.merge_stats(result.cache_stats)
+
+                if result.succeeded:
+                    success.append(result.filename)
+                elif options.fail:
+                    results.close()     # stop the workers first
+                    sys.stderr.write(result.traceback)
+                    sys.exit(1)
                 else:
-                    print '** UNHANDLED EXCEPTION:', str(e)
-                    failure.append(filename)
+                    print '** UNHANDLED EXCEPTION:', result.error
+                    failure.append(result.filename)
+        else:
+            for filename in filenames:
+                print '>> EXECUTING FILE', filename
+
+                try:
+                    interactive = False
+                    execute_file(filename,
+                                 initial_url=options.url,
+                                 never_fail=options.never_fail)
+                    success.append(filename)
+                except Exception, e:
+                    if options.fail:
+#                        import pdb
+#                        _, _, tb = sys.exc_info()
+#                        pdb.post_mortem(tb)
+                        raise
+                    else:
+                        print '** UNHANDLED EXCEPTION:', str(e)
+                        failure.append(filename)
 
         print '--'
         print '%d of %d files SUCCEEDED.' % (len(success),
@@ -368,6 +463,25 @@ def main():
             print "\n\t".join(failure)
             failed = True
 
+        if options.cache:
+            print 'HTTP cache:', httpcache.format_stats()
+
+        if options.profile_report:
+            print>>old_stdout, ''
+            timing.report(old_stdout, options.profile_top)
+        if options.profile_json:
+            fp = open(options.profile_json, 'w')
+            try:
+                timing.export_json(fp)
+            finally:
+                fp.close()
+        if options.trace:
+            fp = open(options.trace, 'w')
+            try:
+                tracing.write(fp)
+            finally:
+                fp.close()
+
     if not args or options.interact:
         welcome_msg = ""
         if not args:
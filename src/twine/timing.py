@@ -0,0 +1,245 @@
+"""
+Per-line timing of twine scripts ('twine --profile-report').
+
+When profiling is enabled, the wall time of each executed script line is
+recorded and split into phases:
+
+  * 'parse' -- tokenizing the line (only when the script isn't already
+    in the compiled-script cache);
+  * 'subst' -- expanding '$var', '${expr}' and '__var' arguments;
+  * 'load'  -- page loads and form submissions;
+  * 'dom'   -- DOM queries, form filling and JavaScript;
+  * 'other' -- everything else the command does.
+
+Time spent in lines run by 'runfile' is charged to those lines, not to
+the 'runfile' line.  Phases are timed through push()/pop() pairs, or the
+'timed' decorator, around the relevant browser methods; these do nothing
+unless a line is being timed.
+"""
+
+import time
+
+phases = ('parse', 'subst', 'load', 'dom', 'other')
+
+enabled = False
+
+class LineStats(object):
+    """
+    Accumulated timings for one script line; 'lineno' is 0-based.
+    """
+    def __init__(self, filename, lineno, line):
+        self.filename = filename
+        self.lineno = lineno
+        self.line = line
+        self.calls = 0
+        self.phases = dict([ (phase, 0.0) for phase in phases ])
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    def add(self, other):
+        self.calls += other.calls
+        for phase, t in other.phases.items():
+            self.phases[phase] += t
+
+    def as_dict(self):
+        return dict(filename=self.filename, lineno=self.lineno + 1,
+                    line=self.line, calls=self.calls, total=self.total,
+                    phases=self.phases)
+
+_stats = {}                 # (filename, lineno) => LineStats
+
+# lines being timed; the innermost one last.  Each entry is
+# (LineStats, phase stack), and each phase stack entry is [phase, start].
+_timers = []
+
+def enable(flag=True):
+    """
+    Turn profiling on/off.
+    """
+    global enabled
+    enabled = bool(flag)
+
+def clear():
+    """
+    Forget all recorded timings.
+    """
+    _stats.clear()
+
+def _get_stats(filename, lineno, line):
+    filename = str(filename)
+    key = (filename, lineno)
+    stats = _stats.get(key)
+    if stats is None:
+        stats = _stats[key] = LineStats(filename, lineno, line.strip())
+    return stats
+
+def record_parse(filename, lineno, line, seconds):
+    """
+    Record the time taken to tokenize a line.
+    """
+    if enabled:
+        _get_stats(filename, lineno, line).phases['parse'] += seconds
+
+def begin_line(filename, lineno, line):
+    """
+    Start timing the execution of a line, in phase 'other'.
+    """
+    if not enabled:
+        return
+
+    now = time.time()
+    if _timers:                         # pause the line that ran this one
+        _charge(_timers[-1], now)
+
+    stats = _get_stats(filename, lineno, line)
+    stats.calls += 1
+    _timers.append((stats, [['other', now]]))
+
+def end_line():
+    """
+    Stop timing the current line.
+    """
+    if not _timers:
+        return
+
+    now = time.time()
+    _charge(_timers.pop(), now)         # only the innermost phase is running
+
+    if _timers:                         # resume the line that ran this one
+        _timers[-1][1][-1][1] = now
+
+def _charge(timer, now):
+    """
+    Charge the time since the current phase of 'timer' (re)started to
+    that phase.
+    """
+    stats, stack = timer
+    phase = stack[-1]
+    stats.phases[phase[0]] += now - phase[1]
+    phase[1] = now
+
+def push(phase):
+    """
+    Switch the current line to 'phase', until the matching pop().
+    """
+    if not _timers:
+        return
+
+    now = time.time()
+    timer = _timers[-1]
+    _charge(timer, now)
+    timer[1].append([phase, now])
+
+def pop():
+    """
+    Switch the current line back to the phase it was in before push().
+    """
+    if not _timers:
+        return
+
+    now = time.time()
+    timer = _timers[-1]
+    if len(timer[1]) > 1:
+        _charge(timer, now)
+        timer[1].pop()
+        timer[1][-1][1] = now
+
+def timed(phase):
+    """
+    Decorator: charge the time spent in the decorated function to 'phase'.
+    """
+    def decorator(fn):
+        def wrapper(*args, **kw):
+            if not _timers:
+                return fn(*args, **kw)
+            push(phase)
+            try:
+                return fn(*args, **kw)
+            finally:
+                pop()
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        return wrapper
+    return decorator
+
+###
+
+def get_stats():
+    """
+    Return the recorded timings, as a list of LineStats.
+    """
+    return _stats.values()
+
+def merge(stats):
+    """
+    Add timings recorded elsewhere (e.g. in a worker process).
+    """
+    for s in stats:
+        _get_stats(s.filename, s.lineno, s.line).add(s)
+
+def top_lines(n):
+    """
+    Return the 'n' lines with the most total time, slowest first.
+    """
+    lines = sorted(_stats.values(), key=lambda s: s.total, reverse=True)
+    return lines[:n]
+
+def _by_script():
+    scripts = {}
+    for s in _stats.values():
+        scripts.setdefault(s.filename, []).append(s)
+    for lines in scripts.values():
+        lines.sort(key=lambda s: s.lineno)
+    return sorted(scripts.items())
+
+def _ms(seconds):
+    return "%9.1f" % (seconds * 1000,)
+
+def report(out, top=10):
+    """
+    Print the 'top' slowest lines across all scripts, then a heatmap of
+    each script.  Times are in milliseconds.
+    """
+    print>>out, '== %d slowest lines' % (top,)
+    print>>out, '%9s %6s %s  %s' % ('total ms', 'calls',
+                                    ' '.join([ '%9s' % p for p in phases ]),
+                                    'location')
+    for s in top_lines(top):
+        print>>out, '%s %6d %s  %s:%d: %s' % \
+              (_ms(s.total), s.calls,
+               ' '.join([ _ms(s.phases[p]) for p in phases ]),
+               s.filename, s.lineno + 1, s.line)
+
+    for filename, lines in _by_script():
+        print>>out, ''
+        heatmap(out, filename, lines)
+
+def heatmap(out, filename, lines=None):
+    """
+    Print each timed line of a script with its call count, total time,
+    and a bar showing its share of the script's time.
+    """
+    if lines is None:
+        lines = dict(_by_script()).get(filename, [])
+
+    script_total = sum([ s.total for s in lines ]) or 1.0
+    print>>out, '== %s (%s ms)' % (filename, _ms(script_total).strip())
+    for s in lines:
+        bar = '#' * int(round(20 * s.total / script_total))
+        print>>out, '%5d %6d %s %-20s %s' % (s.lineno + 1, s.calls,
+                                             _ms(s.total), bar, s.line)
+
+def export_json(fp):
+    """
+    Write all recorded timings to 'fp' as JSON: one record per line, per
+    script, with times in seconds.
+    """
+    import json
+
+    scripts = [ dict(filename=filename,
+                     total=sum([ s.total for s in lines ]),
+                     lines=[ s.as_dict() for s in lines ])
+                for filename, lines in _by_script() ]
+    json.dump(dict(phases=phases, scripts=scripts), fp, indent=1)
@@ -0,0 +1,116 @@
+"""
+Chrome trace-event export of script execution ('twine --trace out.json').
+
+When tracing is enabled, twine records a span for each script run, each
+command executed and each network reply received, with the URL, HTTP
+status and content type of the page (or reply) as arguments.  The result
+is a JSON file in the Chrome trace-event format, which chrome://tracing
+and Perfetto (ui.perfetto.dev) can open.
+
+Scripts and commands are complete ('X') events on one thread track.
+Network requests overlap each other and the commands, so they're async
+('b'/'e') events, each with its own id, which the viewers lay out on
+separate tracks.
+
+Each process records its own events under its own pid, so a parallel run
+shows up as one track per worker.  Timestamps are wall-clock times, which
+all the processes of a run share.
+"""
+
+import os
+import time
+
+enabled = False
+
+_events = []
+
+# the id of the last async span recorded by this process.
+_last_id = 0
+
+def enable(flag=True):
+    """
+    Turn tracing on/off.
+    """
+    global enabled
+    enabled = bool(flag)
+
+def clear():
+    """
+    Forget all recorded events.
+    """
+    del _events[:]
+
+def get_events():
+    """
+    Return the events recorded in this process.
+    """
+    return list(_events)
+
+def merge(events):
+    """
+    Add events recorded elsewhere (e.g. in a worker process).
+    """
+    _events.extend(events)
+
+def page_args():
+    """
+    Return the trace arguments describing the current page, without
+    creating a browser if there isn't one yet.
+    """
+    import commands
+
+    b = commands._browser
+    if b is None or not b.url:
+        return {}
+    return dict(url=b.url, status=b.http_status, content_type=b.content_type)
+
+def complete(name, category, start, args=None, end=None):
+    """
+    Record a span called 'name' that started at 'start' and ends at 'end'
+    (default: now); times are time.time() values.
+    """
+    if end is None:
+        end = time.time()
+
+    _events.append(dict(name=name, cat=category, ph='X',
+                        ts=int(start * 1e6), dur=int((end - start) * 1e6),
+                        pid=os.getpid(), tid=0, args=args or {}))
+
+def async_span(name, category, start, args=None, end=None):
+    """
+    Record a span like complete() does, but as a pair of async events, for
+    spans that may overlap others (e.g. network requests).
+    """
+    global _last_id
+
+    if end is None:
+        end = time.time()
+    _last_id += 1
+
+    pid = os.getpid()
+    span_id = '%d.%d' % (pid, _last_id)     # unique across processes
+    for phase, ts, span_args in (('b', start, args or {}), ('e', end, {})):
+        _events.append(dict(name=name, cat=category, ph=phase, id=span_id,
+                            ts=int(ts * 1e6), pid=pid, tid=0,
+                            args=span_args))
+
+def write(fp):
+    """
+    Write all recorded events to 'fp' as a Chrome trace-event JSON file.
+    """
+    import json
+
+    main_pid = os.getpid()
+
+    pids = sorted(set([ e['pid'] for e in _events ] + [main_pid]))
+    metadata = []
+    for pid in pids:
+        if pid == main_pid:
+            name = 'twine'
+        else:
+            name = 'twine worker %d' % (pid,)
+        metadata.append(dict(name='process_name', ph='M', pid=pid, tid=0,
+                             args=dict(name=name)))
+
+    events = sorted(_events, key=lambda e: e['ts'])
+    json.dump(dict(traceEvents=metadata + events, displayTimeUnit='ms'), fp)
@@ -10,7 +10,6 @@ import base64
 
 import subprocess
 
-from lxml import etree, html, cssselect
 import re
 
 from errors import TwineException
@@ -21,6 +20,8 @@ class ResultWrapper(object):
     unified form.  Returned by 'journey'-wrapped functions.
     """
     def __init__(self, req):
+        from lxml import etree, html
+
         self.req = req
         self.lxml = html.fromstring(self.req.text)
         gfEntry = html.FormElement
@@ -51,10 +52,12 @@ class ResultWrapper(object):
         return self.forms
 
     def get_title(self):
+        from lxml import cssselect
         selector = cssselect.CSSSelector("title")
         return selector(self.lxml)[0].text
 
     def get_links(self):
+        from lxml import cssselect
         selector = cssselect.CSSSelector("a")
         return [
                  # (stringify_children(l) or '', l.get("href")) 
@@ -62,6 +65,7 @@ class ResultWrapper(object):
                  for l in selector(self.lxml)
                ]
     def find_link(self, pattern):
+        from lxml import cssselect
         selector = cssselect.CSSSelector("a")
 
         links = [
@@ -196,6 +200,8 @@ def set_form_control_value(control, val):
     """
     Helper function to deal with setting form values on checkboxes, lists etc.
     """
+    from lxml import html
+
     if hasattr(control, 'type') and control.type == 'checkbox':
         try:
             # checkbox = control.get()
@@ -360,6 +366,37 @@ def run_tidy(html):
     return (clean_html, errors)
 
 
+def parse_mozilla_cookies(string):
+    """
+    Parse cookies in the Mozilla text format (as get_cookies() returns
+    them) into a list of cookielib.Cookie, leaving out expired ones.
+    """
+    import time
+    import cookielib
+
+    cookies = []
+    for line in string.split("\n"):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        fields = line.split("\t")
+        if len(fields) != 7:
+            continue
+        domain, domain_flag, path, secure, expires, name, value = fields
+
+        expires = int(expires or 0) or None
+        if expires is not None and expires < time.time():
+            continue
+
+        cookies.append(cookielib.Cookie(0, name, value, None, False,
+                                        domain, domain_flag == "TRUE",
+                                        domain.startswith("."),
+                                        path, True, secure == "TRUE",
+                                        expires, expires is None,
+                                        None, None, {}))
+    return cookies
+
 def _is_valid_filename(f):
     return not (f.endswith('~') or f.endswith('.bak') or f.endswith('.old'))
 
@@ -372,6 +409,8 @@ def gather_filenames(arglist):
     """
     Collect script files from within directories.
     """
+    from compiled import CACHE_DIR
+
     l = []
 
     for filename in arglist:
@@ -380,6 +419,8 @@ def gather_filenames(arglist):
             for (dirpath, dirnames, filenames) in os.walk(filename):
                 if '.svn' in dirpath:   # ignore subversion files
                     continue
+                if CACHE_DIR in dirnames:  # ...and compiled scripts
+                    dirnames.remove(CACHE_DIR)
                 for f in filenames:
                     if _is_valid_filename(f):
                         f = os.path.join(dirpath, f)
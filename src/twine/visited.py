@@ -0,0 +1,207 @@
+"""
+Sets of URLs already checked, for the link checkers.
+
+'require links_ok' checks the links on every page it visits, and skips
+those it checked before; over a long session on a large site, an
+ordinary set of URLs grows without bound.  The 'visited_store' config
+option picks how they're kept instead:
+
+  * 'memory' -- an exact set in memory (the default);
+  * 'sqlite' -- an exact set in a temporary SQLite database on disk;
+  * 'bloom'  -- a Bloom filter in memory, whose size is fixed by the
+    number of URLs it's meant for ('visited_capacity') and the rate of
+    false positives allowed at that number ('visited_error_rate').  A
+    false positive is a link taken for checked when it wasn't.
+
+All of them normalize URLs first, so that e.g. 'HTTP://Example.com:80'
+and 'http://example.com/' count as the same page.
+"""
+
+import os
+import math
+import struct
+import urlparse
+from hashlib import md5
+
+_default_ports = { 'http' : 80, 'https' : 443 }
+
+def normalize_url(url):
+    """
+    Normalize 'url': lower-case the scheme and host, drop the default
+    port, the fragment and empty user info, and give it a path.
+    """
+    scheme, netloc, path, query, fragment = urlparse.urlsplit(url.strip())
+    scheme = scheme.lower()
+
+    userinfo, _, hostport = netloc.rpartition('@')
+    host, sep, port = hostport.rpartition(':')
+    if not sep or not port.isdigit() or ']' in port:   # no port
+        host, port = hostport, ''
+    host = host.lower()
+    if port and int(port) == _default_ports.get(scheme):
+        port = ''
+
+    netloc = host
+    if port:
+        netloc += ':' + port
+    if userinfo:
+        netloc = userinfo + '@' + netloc
+
+    if not path and netloc:
+        path = '/'
+    return urlparse.urlunsplit((scheme, netloc, path, query, ''))
+
+class MemoryVisited(object):
+    """
+    An exact set of URLs, in memory.
+    """
+    def __init__(self):
+        self._urls = set()
+
+    def add(self, url):
+        self._urls.add(normalize_url(url))
+
+    def __contains__(self, url):
+        return normalize_url(url) in self._urls
+
+    def __len__(self):
+        return len(self._urls)
+
+    def clear(self):
+        self._urls.clear()
+
+    def close(self):
+        self.clear()
+
+class SQLiteVisited(object):
+    """
+    An exact set of URLs, in an SQLite database at 'path' (a temporary
+    file, removed by close(), if no path is given).
+    """
+    def __init__(self, path=None):
+        import sqlite3
+        import tempfile
+
+        self._temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='twine-visited-',
+                                        suffix='.db')
+            os.close(fd)
+        self.path = path
+
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS visited "
+                        "(url TEXT PRIMARY KEY)")
+        self.db.commit()
+
+    def add(self, url):
+        self.db.execute("INSERT OR IGNORE INTO visited VALUES (?)",
+                        (normalize_url(url),))
+        self.db.commit()
+
+    def __contains__(self, url):
+        return self.db.execute("SELECT 1 FROM visited WHERE url = ?",
+                               (normalize_url(url),)).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM visited").fetchone()[0]
+
+    def clear(self):
+        self.db.execute("DELETE FROM visited")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+        if self._temporary:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+class BloomVisited(object):
+    """
+    A Bloom filter sized for 'capacity' URLs with a false-positive rate
+    of 'error_rate'; its memory use doesn't grow with the URLs added.
+    Past its capacity, the false-positive rate climbs.
+    """
+    def __init__(self, capacity, error_rate):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("a Bloom filter needs a positive capacity and "
+                             "an error rate between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+        # the usual optimal sizes: m bits and k hash functions.
+        self.num_bits = int(math.ceil(-capacity * math.log(error_rate) /
+                                      math.log(2) ** 2))
+        self.num_hashes = max(1, int(round(self.num_bits * math.log(2) /
+                                           capacity)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+
+    def _positions(self, url):
+        # k positions from two hashes (Kirsch & Mitzenmacher).
+        url = normalize_url(url)
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        digest = md5(url).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [ (h1 + i * h2) % self.num_bits
+                 for i in range(self.num_hashes) ]
+
+    def add(self, url):
+        new = False
+        for pos in self._positions(url):
+            byte, bit = divmod(pos, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                new = True
+        if new:
+            self._count += 1
+
+    def __contains__(self, url):
+        for pos in self._positions(url):
+            byte, bit = divmod(pos, 8)
+            if not self._bits[byte] & (1 << bit):
+                return False
+        return True
+
+    def __len__(self):
+        """
+        The number of URLs added (give or take the false positives).
+        """
+        return self._count
+
+    def clear(self):
+        self._bits = bytearray(len(self._bits))
+        self._count = 0
+
+    def close(self):
+        self.clear()
+
+store_kinds = ('memory', 'sqlite', 'bloom')
+
+def make_store(kind='memory', capacity=1000000, error_rate=0.001):
+    """
+    Return a new, empty visited set of the given kind.
+    """
+    if kind == 'memory':
+        return MemoryVisited()
+    elif kind == 'sqlite':
+        return SQLiteVisited()
+    elif kind == 'bloom':
+        return BloomVisited(capacity, error_rate)
+    raise ValueError("unknown visited store '%s'; use one of %s" %
+                     (kind, ", ".join(store_kinds)))
+
+def store_from_options():
+    """
+    Return a new, empty visited set as configured by the 'visited_store',
+    'visited_capacity' and 'visited_error_rate' options.
+    """
+    import commands
+
+    options = commands._options
+    return make_store(options['visited_store'],
+                      int(options['visited_capacity']),
+                      float(options['visited_error_rate']))
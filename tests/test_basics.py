@@ -4,9 +4,11 @@ from StringIO import StringIO
 from tempfile import TemporaryFile
 
 class TestBasics:
+    engine = 'webkit'
     def setUp(self):
         self.output = StringIO()
         set_output(self.output)
+        reset_browser(self.engine)
 
         go('http://127.0.0.1:5000/')
     def tearDown(self):
@@ -51,11 +53,22 @@ class TestBasics:
     def test_showlinks(self):
         showlinks()
         assert 'Link ==> link' in self.output.getvalue()
+    def test_blocked_redirect(self):
+        # the page's own navigation isn't blocked, even once redirected.
+        block_urls('/link$')
+        try:
+            go('http://127.0.0.1:5000/redirect')
+        finally:
+            unblock_urls()
+        url('127.0.0.1:5000/link')
+        code('200')
 
 class TestShowHistory:
+    engine = 'webkit'
     def setUp(self):
         self.output = StringIO()
         set_output(self.output)
+        reset_browser(self.engine)
 
         fp = TemporaryFile('rw')
     def tearDown(self):
@@ -78,3 +91,23 @@ class TestShowHistory:
         showhistory()
         assert 'History: (2 pages total)' in self.output.getvalue()
         assert '1. http://127.0.0.1:5000/' in self.output.getvalue()
+
+# the same tests with the http engine.
+
+class TestBasicsHTTP(TestBasics):
+    engine = 'http'
+    def tearDown(self):
+        config('acknowledge_equiv_refresh', '1')
+        TestBasics.tearDown(self)
+    def test_refresh(self):
+        go('http://127.0.0.1:5000/refresh')
+        url('127.0.0.1:5000/link$')
+        back()
+        url('127.0.0.1:5000/$')
+    def test_no_refresh(self):
+        config('acknowledge_equiv_refresh', '0')
+        go('http://127.0.0.1:5000/refresh')
+        url('/refresh$')
+
+class TestShowHistoryHTTP(TestShowHistory):
+    engine = 'http'
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+
+from twine import compiled
+from twine.check import ScriptChecker
+
+class TestCheck:
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        compiled.clear()
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        compiled.clear()
+    def write(self, name, contents):
+        filename = os.path.join(self.tempdir, name)
+        fp = open(filename, 'w')
+        fp.write(contents)
+        fp.close()
+        return filename
+    def check(self, contents):
+        filename = self.write('script.twill', contents)
+        [(name, problems)] = ScriptChecker().check([filename])
+        return [ (p.lineno, p.message) for p in problems ]
+    def test_clean(self):
+        assert self.check('go http://127.0.0.1:5000/\n'
+                          '# comment\n'
+                          'fv 1 name "Your Name"\n'
+                          'echo __list\n') == []
+    def test_unknown_command(self):
+        [(lineno, message)] = self.check('go http://x/\ngoo http://x/\n')
+        assert lineno == 2 and 'goo' in message
+    def test_argument_count(self):
+        [(lineno, message)] = self.check('fv 1 name\n')
+        assert "takes 3 argument(s), 2 given" in message
+    def test_splice_skips_argument_count(self):
+        assert self.check('fv __args\n') == []
+    def test_unbalanced_quote(self):
+        problems = self.check('echo "unterminated\n')
+        assert (1, 'unbalanced quote: "unterminated') in problems
+    def test_parse_error(self):
+        [(lineno, message)] = self.check('123 not a command\n')
+        assert lineno == 1
+    def test_runfile(self):
+        self.write('sub.twill', 'echo hi\n')
+        sub = os.path.join(self.tempdir, 'sub.twill')
+        missing = os.path.join(self.tempdir, 'missing.twill')
+        [(lineno, message)] = self.check('runfile %s\nrunfile %s\n' %
+                                         (sub, missing))
+        assert lineno == 2 and 'missing.twill' in message
+    def test_extensions(self):
+        assert self.check('extend_with formfill\n'
+                          'fv_match 1 name.* x\n') == []
+        problems = self.check('extend_with no_such_extension_module\n')
+        assert "can't import" in problems[0][1]
+    def test_unreadable_script(self):
+        [(name, problems)] = ScriptChecker().check(
+            [os.path.join(self.tempdir, 'nope.twill')])
+        assert problems[0].lineno is None
@@ -0,0 +1,51 @@
+import os
+import time
+import shutil
+import tempfile
+
+from twine import compiled, parse
+
+class TestCompiledScriptCache:
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.script = os.path.join(self.tempdir, 'example.twill')
+        self.write('go http://127.0.0.1:5000/\n# a comment\ncode 200\n')
+        compiled.clear()
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        compiled.clear()
+    def write(self, contents):
+        fp = open(self.script, 'w')
+        fp.write(contents)
+        fp.close()
+    def test_compile(self):
+        script = parse.load_script(self.script)
+        assert [ c.cmd for c in script ] == ['go', None, 'code']
+        assert [ c.lineno for c in script ] == [0, 1, 2]
+        assert script.commands[0].args == ['http://127.0.0.1:5000/']
+    def test_memory_cache(self):
+        script = parse.load_script(self.script)
+        assert parse.load_script(self.script) is script
+    def test_disk_cache(self):
+        parse.load_script(self.script)
+        assert os.path.isdir(os.path.join(self.tempdir, compiled.CACHE_DIR))
+
+        compiled.clear()
+        script = compiled.get(self.script)
+        assert script is not None
+        assert [ c.cmd for c in script ] == ['go', None, 'code']
+    def test_modified_script(self):
+        parse.load_script(self.script)
+
+        self.write('find "Hello World!"\n')
+        mtime = time.time() + 10
+        os.utime(self.script, (mtime, mtime))
+
+        assert compiled.get(self.script) is None
+        script = parse.load_script(self.script)
+        assert [ c.cmd for c in script ] == ['find']
+    def test_parse_error(self):
+        self.write('go http://127.0.0.1:5000/\n123 not a command\n')
+        script = parse.load_script(self.script)
+        assert script.commands[0].error is None
+        assert script.commands[1].error is not None
@@ -4,9 +4,11 @@ from StringIO import StringIO
 from tempfile import TemporaryFile
 
 class TestCookies:
+    engine = 'webkit'
     def setUp(self):
         self.output = StringIO()
         set_output(self.output)
+        reset_browser(self.engine)
     def tearDown(self):
         self.output.close()
         set_output(None)
@@ -28,3 +30,8 @@ class TestCookies:
         load_cookies('example_cookies_file')
         show_cookies()
         assert 'examplecookie=examplevalue' in self.output.getvalue()
+
+# the same tests with the http engine.
+
+class TestCookiesHTTP(TestCookies):
+    engine = 'http'
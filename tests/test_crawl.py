@@ -0,0 +1,89 @@
+import os
+import json
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from twine import commands, set_output
+from twine.extensions import crawl as ext
+
+base = 'http://127.0.0.1:5000'
+
+class TestCrawl:
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.state = os.path.join(self.dir, 'crawl.db')
+        self.output = os.path.join(self.dir, 'crawl.jsonl')
+        commands.config('crawl.state', self.state)
+        commands.config('crawl.output', self.output)
+        set_output(StringIO())
+        commands.reset_browser('http')
+    def tearDown(self):
+        set_output(None)
+        commands.reset_browser()
+        shutil.rmtree(self.dir)
+    def results(self):
+        return [ json.loads(line) for line in open(self.output) ]
+    def test_crawl(self):
+        ext.crawl(base + '/links', '1')
+        results = dict([ (r['url'], r) for r in self.results() ])
+        assert sorted(results) == [base + '/', base + '/link', base + '/links',
+                                   base + '/missing', base + '/needs_cookie']
+        assert results[base + '/missing']['status'] == 404
+        assert results[base + '/link']['referrer'] == base + '/links'
+        assert results[base + '/link']['depth'] == 1
+        assert results[base + '/links']['bytes'] > 0
+        assert not os.path.exists(self.state)       # complete
+    def test_depth_and_pattern(self):
+        ext.crawl(base + '/links', '0')
+        assert [ r['url'] for r in self.results() ] == [base + '/links']
+        ext.crawl(base + '/links', '1', '/link')
+        assert sorted([ r['url'] for r in self.results() ]) == \
+               [base + '/link', base + '/links']
+    def test_resume(self):
+        frontier = ext.Frontier(self.state)
+        frontier.add(base + '/links', 0, None)
+        frontier.start(base + '/links')
+        frontier.done(base + '/links')
+        frontier.add(base + '/link', 1, base + '/links')
+        frontier.add(base + '/missing', 1, base + '/links')
+        frontier.start(base + '/missing')   # interrupted while fetching
+        frontier.commit()
+        frontier.close()
+        open(self.output, 'w').write('{}\n')
+
+        ext.crawl(base + '/links', '1')
+        results = self.results()
+        assert results[0] == {}
+        assert sorted([ r['url'] for r in results[1:] ]) == \
+               [base + '/link', base + '/missing']
+    def test_resume_written(self):
+        # interrupted after writing /links out, before marking it done.
+        frontier = ext.Frontier(self.state)
+        frontier.add(base + '/links', 0, None)
+        frontier.start(base + '/links')
+        frontier.commit()
+        frontier.close()
+        open(self.output, 'w').write(
+            json.dumps(dict(url=base + '/links', status=200)) + '\n' +
+            '{"url": "' + base + '/li')
+
+        ext.crawl(base + '/links', '1')
+        lines = open(self.output).read().split('\n')
+        assert lines[1] == '{"url": "' + base + '/li'
+        urls = [ json.loads(line)['url'] for line in lines[2:] if line ]
+        assert base + '/links' not in urls
+        assert base + '/link' in urls           # its links were still found
+    def test_fetch_error(self):
+        # errors outside _fetch's own handling are still results.
+        fetch = ext._fetch
+        def broken(session, url, timeout):
+            raise KeyError(url)
+        ext._fetch = broken
+        try:
+            ext.crawl(base + '/links', '1')
+        finally:
+            ext._fetch = fetch
+        results = self.results()
+        assert len(results) == 1
+        assert results[0]['status'] is None and '/links' in results[0]['error']
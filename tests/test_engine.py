@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from twine import commands, parse, set_output
+from twine.httpbrowser import HTTPBrowser
+
+def compile(lines):
+    return parse.compile_script([ line + '\n' for line in lines ], '<test>')
+
+class TestChooseEngine:
+    def setUp(self):
+        self.installed = commands._webkit_installed
+        commands._webkit_installed = True
+        self.dir = tempfile.mkdtemp()
+    def tearDown(self):
+        commands._webkit_installed = self.installed
+        shutil.rmtree(self.dir)
+    def write(self, name, lines):
+        path = os.path.join(self.dir, name)
+        open(path, 'w').write("".join([ line + '\n' for line in lines ]))
+        return path
+    def test_no_javascript(self):
+        assert parse.choose_engine(compile(['go /', 'find x'])) == \
+               ('http', "no JavaScript commands")
+    def test_javascript_anywhere(self):
+        script = compile(['go /', 'find x', 'code 200',
+                          'wait_for_text "done" 5'])
+        assert parse.choose_engine(script) == \
+               ('webkit', "script uses 'wait_for_text'")
+    def test_pragma(self):
+        assert parse.choose_engine(compile(['# twine: engine=webkit',
+                                            'go /'])) == \
+               ('webkit', "engine pragma")
+        assert parse.choose_engine(compile(['#twine:engine = http',
+                                            'run_javascript "1"'])) == \
+               ('http', "engine pragma")
+    def test_runfile(self):
+        inner = self.write('inner.twill', ['go /', 'eval_javascript "1"'])
+        middle = self.write('middle.twill', ['runfile %s' % (inner,)])
+        script = compile(['go /', 'runfile %s' % (middle,)])
+        assert parse.choose_engine(script) == \
+               ('webkit', "script uses 'eval_javascript'")
+    def test_runfile_cycle(self):
+        loop = os.path.join(self.dir, 'loop.twill')
+        self.write('loop.twill', ['runfile %s' % (loop,), 'find x'])
+        script = compile(['runfile %s' % (loop,), 'runfile missing.twill',
+                          'runfile ${somefile}'])
+        assert parse.choose_engine(script)[0] == 'http'
+    def test_not_installed(self):
+        commands._webkit_installed = False
+        engine, reason = parse.choose_engine(compile(['run_javascript "1"']))
+        assert engine == 'http' and "isn't installed" in reason
+
+class TestEngineOption:
+    def setUp(self):
+        self.output = StringIO()
+        set_output(self.output)
+        self.installed = commands._webkit_installed
+    def tearDown(self):
+        commands._webkit_installed = self.installed
+        commands.config('engine', 'auto')
+        set_output(None)
+        commands.reset_browser()
+    def test_explicit_engine(self):
+        commands._webkit_installed = True
+        commands.config('engine', 'http')
+        parse.execute_string('wait_for_idle 1\n', no_reset=False)
+        assert isinstance(commands.get_browser(), HTTPBrowser)
+        assert 'using the' not in self.output.getvalue()
+    def test_auto(self):
+        parse.execute_string('echo hello\n', no_reset=False)
+        assert isinstance(commands.get_browser(), HTTPBrowser)
+        assert "using the 'http' engine" in self.output.getvalue()
+    def test_auto_fallback(self):
+        commands._webkit_installed = False
+        commands.reset_browser()
+        assert isinstance(commands.get_browser(), HTTPBrowser)
@@ -0,0 +1,127 @@
+import re
+
+import pyquery
+from lxml import html as lxml_html
+
+from twine.basebrowser import BaseBrowser
+from twine.httpbrowser import HTTPBrowser
+from twine.errors import TwineException
+
+html = """<html><body>
+<form name="items">
+  <input type="text" name="item-1" value="old">
+  <input name="item-2">
+  <input type="text" name="item-3" readonly>
+  <input type="text" name="other">
+  <input type="checkbox" name="agree">
+  <input type="radio" name="size" value="s" checked>
+  <input type="radio" name="size" value="l">
+  <select name="color"><option value="red" selected>Red</option>
+                       <option>blue</option></select>
+  <textarea name="notes">hi</textarea>
+  <input type="submit" name="go" value="Go">
+</form>
+</body></html>"""
+
+def make_browser():
+    browser = HTTPBrowser()
+    browser._doc = lxml_html.document_fromstring(html)
+    browser.at_empty_page = False
+    return browser
+
+class TestFormValues:
+    def setUp(self):
+        self.browser = make_browser()
+    def state(self):
+        fields = self.browser.form_snapshot()[0]['fields']
+        return [ (f['name'], f['checked'] and 'on' or f['value'])
+                 for f in fields ]
+    def test_batch(self):
+        page = self.browser.page
+        n = self.browser.formvalues('items', [('item-1', 'a'),
+                                              ('agree', '1'),
+                                              ('size', 'l'),
+                                              ('color', 'blue'),
+                                              ('notes', 'text')])
+        assert n == 5
+        assert self.browser.page is page
+        assert self.browser.last_form == 'items'
+        assert self.state() == [('item-1', 'a'), ('item-2', ''),
+                                ('item-3', ''), ('other', ''),
+                                ('agree', 'on'), ('size', 's'),
+                                ('size', 'on'), ('go', 'Go'),
+                                ('color', 'blue'), ('notes', 'text')]
+    def test_regexp(self):
+        # readonly fields are skipped; values run out onto the last one.
+        n = self.browser.formvalues('items',
+                                    [(re.compile('^item-'), ['x', 'y']),
+                                     (re.compile('^size$'), 'l')])
+        assert n == 3
+        assert self.state()[:3] == [('item-1', 'x'), ('item-2', 'y'),
+                                    ('item-3', '')]
+        assert self.state()[5:7] == [('size', 's'), ('size', 'on')]
+    def test_formclear(self):
+        self.browser.formvalues('items', [(re.compile('item|agree|size'),
+                                           'on'),
+                                          ('notes', 'text')])
+        self.browser.formvalue('items', 'notes', 'more')
+        self.browser.formclear('items')
+        assert self.state() == [('item-1', 'old'), ('item-2', ''),
+                                ('item-3', ''), ('other', ''),
+                                ('agree', ''), ('size', 'on'),
+                                ('size', 'l'), ('go', 'Go'),
+                                ('color', 'red'), ('notes', 'hi')]
+    def test_bad_checkbox_value(self):
+        # nothing is changed if any value is bad.
+        try:
+            self.browser.formvalues('items', [('other', 'x'),
+                                              ('agree', 'maybe')])
+        except TwineException:
+            pass
+        else:
+            assert False
+        assert self.state()[3] == ('other', '')
+    def test_no_values(self):
+        try:
+            self.browser.formvalues('items', [(re.compile('^item-'), [])])
+        except TwineException:
+            pass
+        else:
+            assert False
+        assert self.state()[0] == ('item-1', 'old')
+        # (nothing to match, nothing to set.)
+        assert self.browser.formvalues('items',
+                                       [(re.compile('^none$'), [])]) == 0
+
+awkward_html = """<html><body>
+<form name="awkward">
+  <input type="text" name='a[b].c "d"'>
+  <input type="text" id="x.y">
+  <input type="radio" name="r" value="one two">
+  <select name="s"><option value='a b"c]'>x</option></select>
+</form>
+</body></html>"""
+
+class TestSelectors:
+    """
+    The DOM helpers' selectors must find fields whatever their names and
+    values (the webkit engine falls back on them).
+    """
+    def test_fill_fields(self):
+        class SelectorBrowser(HTTPBrowser):
+            _fill_fields = BaseBrowser._fill_fields.im_func
+            def fill(self, selector, value):
+                found.append(selector)
+            check = uncheck = select = lambda self, selector: \
+                                       found.append(selector)
+
+        browser = SelectorBrowser()
+        browser._doc = lxml_html.document_fromstring(awkward_html)
+        browser.at_empty_page = False
+        found = []
+        browser.formvalues('awkward', [('a[b].c "d"', 'text'), ('2', 'text'),
+                                       ('r', 'one two'), ('s', 'a b"c]')])
+
+        doc = pyquery.PyQuery(browser._doc)
+        assert len(found) == 4
+        assert [ len(doc(selector)) for selector in found ] == [1, 1, 1, 1]
@@ -4,9 +4,11 @@ from StringIO import StringIO
 from tempfile import TemporaryFile
 
 class TestFormValue:
+    engine = 'webkit'
     def setUp(self):
         self.output = StringIO()
         set_output(self.output)
+        reset_browser(self.engine)
 
         go('http://127.0.0.1:5000/form')
     def tearDown(self):
@@ -50,9 +52,11 @@ class TestFormValue:
         url('alternate_form')
 
 class TestShowForms:
+    engine = 'webkit'
     def setUp(self):
         self.output = StringIO()
         set_output(self.output)
+        reset_browser(self.engine)
 
         go('http://127.0.0.1:5000/form')
     def tearDown(self):
@@ -100,3 +104,11 @@ class TestShowForms:
         formvalue('1', 'accept_tos', 'false')
         showforms()
         assert 'unchecked' in self.output.getvalue()
+
+# the same tests with the http engine.
+
+class TestFormValueHTTP(TestFormValue):
+    engine = 'http'
+
+class TestShowFormsHTTP(TestShowForms):
+    engine = 'http'
@@ -0,0 +1,121 @@
+import os
+import time
+import shutil
+import tempfile
+
+from twine import commands, httpcache
+from twine.httpcache import CacheEntry, DiskCache, freshness_lifetime, \
+     is_storable
+
+class TestRules:
+    def test_freshness(self):
+        assert freshness_lifetime({'cache-control': 'public, max-age=60'}) \
+               == 60
+        assert freshness_lifetime({'cache-control': 'no-cache, max-age=60'}) \
+               == 0
+        assert freshness_lifetime(
+            {'date': 'Mon, 01 Jan 2024 00:00:00 GMT',
+             'expires': 'Mon, 01 Jan 2024 00:10:00 GMT'}) == 600
+        assert freshness_lifetime({}) == 0
+        assert freshness_lifetime({'cache-control': 'max-age=60',
+                                   'age': '50'}) == 10
+        assert freshness_lifetime({'cache-control': 'max-age=60',
+                                   'age': '90'}) == 0
+    def test_storable(self):
+        assert is_storable(200, {'cache-control': 'max-age=60'})
+        assert is_storable(200, {'etag': '"x"', 'vary': 'Accept-Encoding'})
+        assert not is_storable(200, {'cache-control': 'no-store',
+                                     'etag': '"x"'})
+        assert not is_storable(200, {'etag': '"x"', 'vary': 'Cookie'})
+        assert not is_storable(200, {})
+        assert not is_storable(404, {'cache-control': 'max-age=60'})
+    def test_not_shared(self):
+        assert not is_storable(200, {'cache-control': 'private, max-age=60'})
+        assert not is_storable(200, {'cache-control': 'max-age=60'},
+                               authorized=True)
+        assert is_storable(200, {'cache-control': 'public, max-age=60'},
+                           authorized=True)
+        assert is_storable(200, {'cache-control': 's-maxage=60'},
+                           authorized=True)
+    def test_entry(self):
+        entry = CacheEntry('http://a/', 200, {'Cache-Control': 'max-age=60',
+                                              'ETag': '"x"'}, 'body',
+                           time.time())
+        assert entry.is_fresh()
+        assert not entry.is_fresh(time.time() + 61)
+        assert entry.validators() == {'If-None-Match': '"x"'}
+
+class TestDiskCache:
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    def test_put_get(self):
+        cache = DiskCache(os.path.join(self.dir, 'c'), 1000)
+        cache.put(CacheEntry('http://a/', 200, {}, 'body', 1.0))
+        entry = DiskCache(os.path.join(self.dir, 'c'), 1000).get('http://a/')
+        assert entry.content == 'body' and entry.stored == 1.0
+        assert cache.get('http://b/') is None
+    def test_trim(self):
+        cache = DiskCache(self.dir, 3000)
+        for i in range(5):
+            cache.put(CacheEntry('http://a/%d' % i, 200, {}, 'x' * 1000, 1.0))
+            path = cache._path('http://a/%d' % i)
+            os.utime(path, (i, i))      # oldest first
+        assert cache.get('http://a/0') is None
+        assert cache.get('http://a/4') is not None
+
+class TestHTTPBrowser:
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        commands.config('cache_dir', self.dir)
+        commands.reset_browser('http')
+        httpcache.clear_stats()
+    def tearDown(self):
+        commands.config('cache_dir', '')
+        commands.reset_browser()
+        shutil.rmtree(self.dir)
+    def test_fresh(self):
+        for i in range(3):
+            commands.go('http://127.0.0.1:5000/cached')
+            commands.find('Hello World!')
+        assert httpcache.get_stats() == dict(hits=2, misses=1,
+                                             revalidated=0)
+    def test_revalidate(self):
+        for i in range(2):
+            commands.go('http://127.0.0.1:5000/revalidate')
+            commands.find('Hello World!')
+            commands.code('200')
+        assert httpcache.get_stats() == dict(hits=1, misses=1,
+                                             revalidated=1)
+
+class TestSharing:
+    """
+    Both engines keep private and authorized responses out of the cache.
+    """
+    engine = 'webkit'
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        commands.config('cache_dir', self.dir)
+        commands.reset_browser(self.engine)
+        httpcache.clear_stats()
+    def tearDown(self):
+        commands.config('cache_dir', '')
+        commands.reset_browser()
+        shutil.rmtree(self.dir)
+    def test_private(self):
+        for i in range(2):
+            commands.go('http://127.0.0.1:5000/private')
+        assert httpcache.get_stats()['hits'] == 0
+    def test_authorized(self):
+        commands.add_auth('twine', 'http://127.0.0.1:5000/protected',
+                          'user', 'pass')
+        commands.go('http://127.0.0.1:5000/protected')
+        commands.code('200')
+        commands.reset_browser(self.engine)
+        commands.go('http://127.0.0.1:5000/protected')
+        commands.code('401')
+        assert httpcache.get_stats()['hits'] == 0
+
+class TestSharingHTTP(TestSharing):
+    engine = 'http'
@@ -0,0 +1,58 @@
+import json
+from StringIO import StringIO
+
+from twine import jsbridge, parse, commands, set_output
+from twine.errors import TwineException
+
+class TestBridge:
+    def test_make_script(self):
+        expressions = ['document.title', 'var x = "a\\"b"; x']
+        script = jsbridge.make_script(expressions)
+        # the expressions are passed in as one JSON array.
+        assert json.dumps(expressions) in script
+    def test_results(self):
+        output = json.dumps(dict(results=[u'caf\xe9', 2, None,
+                                          {u'a': [True]}]))
+        results = jsbridge.parse_results(output, ['a', 'b', 'c', 'd'])
+        assert results == ['caf\xc3\xa9', 2, None, {'a': [True]}]
+        assert type(results[0]) is str
+    def test_error(self):
+        output = json.dumps(dict(error='ReferenceError: nope', index=1))
+        try:
+            jsbridge.parse_results(output, ['1', 'nope'])
+        except TwineException, e:
+            assert "in 'nope'" in str(e)
+            assert 'ReferenceError' in str(e)
+        else:
+            assert False
+    def test_no_output(self):
+        for output in (None, '', 'undefined'):
+            try:
+                jsbridge.parse_results(output, ['1'])
+            except TwineException:
+                pass
+            else:
+                assert False, output
+    def test_needs_javascript(self):
+        script = parse.compile_script(['eval_javascript "document.title"'],
+                                      '<test>')
+        installed = commands._webkit_installed
+        commands._webkit_installed = True
+        try:
+            assert parse.choose_engine(script)[0] == 'webkit'
+        finally:
+            commands._webkit_installed = installed
+
+class TestJQuery:
+    # scripts can use jQuery in expressions, as in run_javascript code.
+    def setUp(self):
+        set_output(StringIO())
+        commands.reset_browser('webkit')
+        commands.go('http://127.0.0.1:5000/')
+    def tearDown(self):
+        set_output(None)
+        commands.reset_browser()
+    def test_eval_javascript(self):
+        assert commands.eval_javascript('$("body").length') == 1
+    def test_wait_for_js(self):
+        commands.wait_for_js('$("body").length == 1', '1')
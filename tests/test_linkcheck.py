@@ -0,0 +1,180 @@
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from twine import commands, set_output, linkcheck
+from twine.linkcheck import LinkCache, LinkResult
+from twine.visited import MemoryVisited
+from twine.errors import TwineAssertionError
+from twine.utils import parse_mozilla_cookies
+from twine.extensions import check_links as ext
+
+cookies = ("# Netscape HTTP Cookie File\n"
+           "127.0.0.1\tFALSE\t/\tFALSE\t0\tsession\tabc\n"
+           ".example.com\tTRUE\t/\tTRUE\t1\texpired\tx\n")
+
+class TestParseCookies:
+    def test_parse(self):
+        parsed = parse_mozilla_cookies(cookies)
+        assert [ (c.name, c.value, c.domain) for c in parsed ] == \
+               [('session', 'abc', '127.0.0.1')]
+        assert parsed[0].discard
+
+class TestCheckLinks:
+    def setUp(self):
+        self.output = StringIO()
+        set_output(self.output)
+        commands.reset_browser('http')
+        ext.bad_links_dict.clear()
+    def tearDown(self):
+        commands.config('check_links.only_collect_bad_links', '0')
+        set_output(None)
+        commands.reset_browser()
+    def test_collect_urls(self):
+        commands.go('http://127.0.0.1:5000/links')
+        browser = commands.get_browser()
+        assert ext.collect_urls(browser.page, browser.url) == [
+            'http://127.0.0.1:5000/', 'http://127.0.0.1:5000/link',
+            'http://127.0.0.1:5000/needs_cookie',
+            'http://127.0.0.1:5000/missing']
+    def test_good_links(self):
+        commands.go('http://127.0.0.1:5000/cookie')
+        commands.go('http://127.0.0.1:5000/links')
+        ext.check_links('link|/$|cookie', MemoryVisited())
+        commands.url('/links$')          # didn't leave the page
+    def test_broken_links(self):
+        commands.go('http://127.0.0.1:5000/links')
+        try:
+            ext.check_links('', MemoryVisited())
+        except TwineAssertionError:
+            pass
+        else:
+            assert False
+        out = self.output.getvalue()
+        assert '/needs_cookie' in out and '/missing' in out
+    def test_collect_bad_links(self):
+        commands.config('check_links.only_collect_bad_links', '1')
+        commands.go('http://127.0.0.1:5000/links')
+        visited = MemoryVisited()
+        ext.check_links('', visited)
+        assert sorted(ext.bad_links_dict) == [
+            'http://127.0.0.1:5000/missing',
+            'http://127.0.0.1:5000/needs_cookie']
+        assert ext.bad_links_dict['http://127.0.0.1:5000/missing'] == \
+               ['http://127.0.0.1:5000/links']
+        assert 'http://127.0.0.1:5000/link' in visited
+        try:
+            ext.report_bad_links()
+        except TwineAssertionError:
+            pass
+        else:
+            assert False
+        assert not ext.bad_links_dict
+    def test_credentials(self):
+        url = 'http://127.0.0.1:5000/protected'
+        browser = commands.get_browser()
+        session = linkcheck.session_for_browser(browser, 1)
+        assert linkcheck.check_url(session, url).status == 401
+
+        commands.add_auth('twine', url, 'user', 'pass')
+        session = linkcheck.session_for_browser(browser, 1)
+        assert linkcheck.check_url(session, url).status == 200
+
+        commands.add_auth('twine', url, 'user', 'wrong')
+        session = linkcheck.session_for_browser(browser, 1)
+        assert linkcheck.check_url(session, url).status == 401
+    def test_no_workers(self):
+        commands.config('check_links.workers', '0')
+        try:
+            commands.go('http://127.0.0.1:5000/links')
+            ext.check_links('link', MemoryVisited())
+        finally:
+            commands.config('check_links.workers', '8')
+        assert ext.workers_option() == 8
+
+class TestLinkCache:
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = LinkCache(os.path.join(self.dir, 'links.db'), 60)
+        linkcheck.clear_stats()
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+    def check(self, urls, recheck=False):
+        session = linkcheck.make_session(2)
+        return sorted([ (r.url, r.status, r.cached) for r in
+                        linkcheck.check_urls(session, urls, cache=self.cache,
+                                             recheck=recheck) ])
+    def test_update(self):
+        self.cache.update([LinkResult('http://a/', 200,
+                                      headers={'etag': '"x"'}),
+                           LinkResult('http://b/', 404)], now=100.0)
+        record = self.cache.get('http://a/')
+        assert record == (200, '"x"', None, 100.0)
+        assert self.cache.is_fresh(record, 159) and \
+               not self.cache.is_fresh(record, 161)
+        assert self.cache.validators(record) == {'If-None-Match': '"x"'}
+        assert self.cache.get('http://b/') is None
+
+        self.cache.update([LinkResult('http://a/', 304)], now=200.0)
+        assert self.cache.get('http://a/')[3] == 200.0
+        self.cache.update([LinkResult('http://a/', 500)])
+        assert self.cache.get('http://a/') is None
+    def test_check_urls(self):
+        good = 'http://127.0.0.1:5000/link'
+        bad = 'http://127.0.0.1:5000/missing'
+        assert self.check([good, bad]) == [(good, 200, False),
+                                           (bad, 404, False)]
+        assert self.check([good, bad]) == [(good, 200, True),
+                                           (bad, 404, False)]
+        assert self.check([good], recheck=True) == [(good, 200, False)]
+        assert linkcheck.stats == dict(hits=1, misses=4, revalidated=0)
+    def test_cookies(self):
+        # good with this session's cookie isn't good for everyone.
+        url = 'http://127.0.0.1:5000/needs_cookie'
+        referer = 'http://127.0.0.1:5000/links'
+        commands.reset_browser('http')
+        try:
+            commands.go('http://127.0.0.1:5000/cookie')
+            with_cookie = linkcheck.session_for_browser(
+                commands.get_browser(), 1)
+        finally:
+            commands.reset_browser()
+        results = list(linkcheck.check_urls(with_cookie, [url], referer,
+                                            cache=self.cache))
+        assert [ (r.status, r.authorized) for r in results ] == [(200, True)]
+        assert self.cache.get(url) is None
+
+        results = list(linkcheck.check_urls(linkcheck.make_session(1), [url],
+                                            referer, cache=self.cache))
+        assert [ (r.status, r.cached) for r in results ] == [(403, False)]
+    def test_revalidate(self):
+        url = 'http://127.0.0.1:5000/revalidate'
+        self.cache.ttl = 0
+        assert self.check([url]) == [(url, 200, False)]
+        assert self.cache.get(url)[1] == '"v1"'
+        assert self.check([url]) == [(url, 200, True)]
+        assert linkcheck.stats == dict(hits=0, misses=1, revalidated=1)
+
+class TestRequire:
+    def setUp(self):
+        from twine.extensions import require
+        self.require = require
+        set_output(StringIO())
+        commands.reset_browser('http')
+    def tearDown(self):
+        self.require.no_require()
+        self.require.flush_visited()
+        set_output(None)
+        commands.reset_browser()
+    def test_links_ok(self):
+        self.require.require('links_ok')
+        try:
+            commands.go('http://127.0.0.1:5000/links')
+        except TwineAssertionError:
+            pass
+        else:
+            assert False
+        assert 'http://127.0.0.1:5000/link' in self.require.links_visited
+        commands.go('http://127.0.0.1:5000/link')     # no links
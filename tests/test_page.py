@@ -0,0 +1,107 @@
+import pyquery
+
+from twine.basebrowser import BaseBrowser
+from twine.errors import TwineAssertionError
+
+html = """<html><head><title>Forms</title></head><body>
+<a href="/one">One</a> <a href="/two">Two</a>
+<form name="first"><input type="text" name="a"></form>
+<form name="second" id="form-2">
+  <textarea name="t"></textarea>
+  <select name="s"><option value="x">X</option></select>
+  <input type="text" name="b" id="field-b">
+  <input type="radio" name="r" value="1"><input type="radio" name="r" value="2">
+  <input type="submit" value="Go">
+</form>
+</body></html>"""
+
+class CountingBrowser(BaseBrowser):
+    """
+    A browser whose page never changes, and which counts how many times
+    it gets parsed.
+    """
+    def __init__(self):
+        self._init_state()
+        self.parses = 0
+    @property
+    def soup(self):
+        self.parses += 1
+        return pyquery.PyQuery(html)
+    def fill(self, selector, value):
+        self.filled = (selector, value)
+    def select(self, selector):
+        self.selected = selector
+    def submit(self, selector):
+        self.invalidate_page()
+
+class TestPageModel:
+    def setUp(self):
+        self.browser = CountingBrowser()
+    def test_parsed_once(self):
+        page = self.browser.page
+        assert page.title == 'Forms'
+        assert [ l.attr.href for l in page.links ] == ['/one', '/two']
+        assert [ f.attr.name for f in page.forms ] == ['first', 'second']
+
+        self.browser.find_form('second')
+        self.browser.find_form('1')
+        assert self.browser.page is page
+        assert self.browser.parses == 1
+    def test_invalidate(self):
+        page = self.browser.page
+        self.browser.formvalue('1', 'a', 'value')
+        assert self.browser.page is page
+        self.browser.submit('input[type=submit]')
+        assert self.browser.page is not page
+        assert self.browser.parses == 2
+
+class TestFormIndex:
+    def setUp(self):
+        self.page = CountingBrowser().page
+    def test_find_form(self):
+        assert self.page.find_form('1').number == 0
+        assert self.page.find_form('second').number == 1
+        assert self.page.find_form('form-2').number == 1
+        for formname in ('3', '0', 'nope'):
+            try:
+                self.page.find_form(formname)
+            except TwineAssertionError:
+                pass
+            else:
+                assert False, formname
+    def test_find_fields(self):
+        form = self.page.find_form('second')
+        # fields are numbered inputs first, then selects, then textareas.
+        assert [ f[0].tag for f in form.fields ] == \
+               ['input', 'input', 'input', 'input', 'select', 'textarea']
+        assert form.find_fields('1')[1][0].attr.name == 'b'
+        assert form.find_fields('t')[0] == 'textarea'
+        assert form.find_fields('field-b')[1][0].attr.name == 'b'
+        tag, radios = form.find_fields('r')
+        assert [ r.attr.value for r in radios ] == ['1', '2']
+        assert form.radio_groups['r'] == radios
+        assert [ s.attr.value for s in form.submits ] == ['Go']
+    def test_fill_by_number(self):
+        browser = CountingBrowser()
+        browser.formvalue('2', '1', 'value')
+        assert browser.filled == ('input[name="b"]', 'value')
+        assert browser.last_form == '2'
+
+class TestFormState:
+    def setUp(self):
+        self.browser = CountingBrowser()
+    def test_snapshot(self):
+        [first, second] = self.browser.form_snapshot()
+        assert first['name'] == 'first' and second['id'] == 'form-2'
+        assert [ f['name'] for f in second['fields'] ] == \
+               ['b', 'r', 'r', None, 's', 't']
+        select = second['fields'][4]
+        assert select['value'] == 'x'
+        assert select['options'] == [dict(value='x', text='X',
+                                          selected=False)]
+        assert second['fields'][5]['value'] == ''
+    def test_remember_initial_values(self):
+        self.browser.formvalue('second', 'b', 'one')
+        self.browser.formvalue('second', 'b', 'two')
+        self.browser.formvalue('second', 's', 'x')
+        assert self.browser._previous_form_values == {1: {'b': '', 's': 'x'}}
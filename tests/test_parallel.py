@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+from twine.parallel import run_files
+
+here = os.path.dirname(os.path.abspath(__file__))
+twine_script = os.path.join(here, '..', 'twine')
+src = os.path.join(here, '..', 'src')
+
+good = ['go http://127.0.0.1:5000/', 'find "Hello World"']
+bad = ['go http://127.0.0.1:5000/', 'find "Goodbye"']
+
+class TestParallel:
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    def write(self, name, lines):
+        path = os.path.join(self.dir, name)
+        open(path, 'w').write("".join([ line + '\n' for line in lines ]))
+        return path
+    def run_twine(self, *args):
+        env = dict(os.environ, PYTHONPATH=src)
+        p = subprocess.Popen([sys.executable, twine_script] + list(args),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             env=env)
+        out, err = p.communicate()
+        return p.returncode, out, err
+
+    def test_run_files(self):
+        files = [ self.write('a.twill', good), self.write('b.twill', bad),
+                  self.write('c.twill', good) ]
+        results = list(run_files(files, 2))
+        assert [ r.filename for r in results ] == files     # in file order
+        assert [ r.succeeded for r in results ] == [True, False, True]
+        assert 'Goodbye' in results[1].error
+        assert 'Traceback' in results[1].traceback
+        assert '==> at http://127.0.0.1:5000/' in results[0].output
+    def test_shell(self):
+        files = [ self.write('a.twill', good), self.write('b.twill', bad),
+                  self.write('c.twill', good) ]
+        status, out, err = self.run_twine('-j', '2', *files)
+        assert status == 1
+        assert out.count('>> EXECUTING FILE') == 3
+        assert '2 of 3 files SUCCEEDED.' in out
+        assert 'Failed:\n\t%s\n' % (files[1],) in out
+    def test_shell_success(self):
+        files = [ self.write('a.twill', good), self.write('c.twill', good) ]
+        status, out, err = self.run_twine('-j', '2', *files)
+        assert status == 0, err
+        assert '2 of 2 files SUCCEEDED.' in out
+    def test_fail_fast(self):
+        files = [ self.write('a.twill', bad),
+                  self.write('b.twill', ['sleep 30']) ]
+        start = time.time()
+        status, out, err = self.run_twine('-f', '-j', '2', *files)
+        assert status == 1
+        assert 'Traceback' in err
+        assert 'SUCCEEDED' not in out
+        assert time.time() - start < 20     # didn't wait for b.twill
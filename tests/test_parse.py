@@ -0,0 +1,148 @@
+import random
+
+from twine import parse, grammar
+from twine.errors import TwineParseError, TwineNameError
+
+# Lines to check the tokenizer against the reference pyparsing grammar.
+corpus = [
+    '# a comment',
+    '   # an indented comment',
+    'go http://127.0.0.1:5000/',
+    'go http://127.0.0.1:5000/ # trailing comment',
+    'go http://127.0.0.1:5000/# comment with no space',
+    'showforms',
+    '  showforms  \n',
+    'fv 1 name "Your Name"',
+    "fv 1 name 'Your Name'",
+    'find "a \\"quoted\\" word"',
+    "find 'it''s'",
+    'find "say ""hi"""',
+    'find ""',
+    "find ''",
+    'find """',
+    'find "unterminated',
+    "find 'unterminated",
+    'find "a\\ b"',
+    'find "trailing backslash\\',
+    'find "a"b"c"',
+    "find 'a'\"b\"'c'",
+    'find foo"bar"baz',
+    'echo $var ${expr} __args',
+    'echo "${1 + 1}" \'$name\'',
+    'go.foo bar',
+    'go-x',
+    'go123 x',
+    '_private_cmd 1 2 3',
+    'echo\ttabbed\targuments',
+    'echo "a\ttab" x',
+    'echo a#b c',
+    'echo a # b "c',
+    'echo caf\xc3\xa9 latte',
+    'echo "caf\xc3\xa9" latte',
+    'echo \x0bvertical tab',
+    'echo "line\\nbreak"',
+    'echo "a\rb"',
+    'echo ~!@$%^&*()-+=[]{}|\\;:,.<>/?',
+    '',
+    '   ',
+    '123 not a command',
+    '"quoted" command',
+    '$var',
+    '-x',
+]
+
+def reference(line):
+    """
+    Tokenize 'line' with the pyparsing grammar.
+    """
+    try:
+        res = grammar.full_command.parseString(line)
+    except grammar.ParseException:
+        return 'error'
+    if res:
+        return (res.command, res.arguments.asList())
+    return (None, None)
+
+def scanner(line):
+    """
+    Tokenize 'line' with the hand-written scanner.
+    """
+    try:
+        return parse.tokenize_command(line)
+    except TwineParseError:
+        return 'error'
+
+def check_line(line):
+    assert scanner(line) == reference(line), \
+           "%r: %r != %r" % (line, scanner(line), reference(line))
+
+    rest = line.split(' ', 1)[-1]
+    assert parse.tokenize_arguments(rest) == \
+           grammar.arguments.parseString(rest)[0].asList(), repr(rest)
+
+class TestTokenizer:
+    def test_corpus(self):
+        for line in corpus:
+            yield check_line, line
+    def test_random_lines(self):
+        rng = random.Random(1234)
+        alphabet = ['a', 'Z', '_', '1', ' ', ' ', '\t', '"', '"', "'", "'",
+                    '\\', '#', '$', '{', '}', '-', '\n', '\r', '\x0b',
+                    '\xe9', 'go ', 'fv ']
+        for i in range(3000):
+            line = ''.join([ rng.choice(alphabet)
+                             for j in range(rng.randint(0, 20)) ])
+            check_line(line)
+    def test_leftover(self):
+        assert parse.scan_line('go x # comment\n')[2] == ''
+        assert parse.scan_line('find "unterminated x')[2] == \
+               '"unterminated x'
+    def test_pyparsing_fallback(self):
+        parse.use_pyparsing(True)
+        try:
+            assert parse.tokenize_command('fv 1 "a b" c # x') == \
+                   ('fv', ['1', 'a b', 'c'])
+            assert parse.tokenize_command('# x') == (None, None)
+        finally:
+            parse.use_pyparsing(False)
+
+class TestArguments:
+    def setUp(self):
+        self.globals_dict = {'name' : 'world'}
+        self.locals_dict = {'__list__' : ['a', 'b'], 'n' : '2'}
+    def process(self, *args):
+        return parse.process_args(list(args), self.globals_dict,
+                                  self.locals_dict)
+    def test_constant(self):
+        assert self.process('plain', 'line\\nbreak') == ['plain',
+                                                         'line\nbreak']
+    def test_value(self):
+        assert self.process('$name', '$undefined') == ['world', '$undefined']
+    def test_substitution(self):
+        assert self.process('hello ${name}, ${n}x ${nope}') == \
+               ['hello world, 2x ${nope}']
+    def test_splice(self):
+        assert self.process('__list__', 'c', '__nope') == \
+               ['a', 'b', 'c', '__nope']
+    def test_syntax_error(self):
+        try:
+            self.process('${1 +}')
+        except SyntaxError:
+            pass
+        else:
+            assert False, "expected a SyntaxError"
+
+class TestRegistry:
+    def test_arity(self):
+        assert parse.command_registry['go'].accepts(1)
+        assert not parse.command_registry['go'].accepts(0)
+        assert parse.command_registry['find'].accepts(2)
+        assert not parse.command_registry['find'].accepts(3)
+        assert parse.command_registry['echo'].accepts(10)
+    def test_unknown_command(self):
+        try:
+            parse.execute_string('no_such_command')
+        except TwineNameError:
+            pass
+        else:
+            assert False, "expected a TwineNameError"
@@ -0,0 +1,65 @@
+from twine import commands
+from twine.requestpolicy import RequestPolicy, resource_type, parse_types
+from twine.errors import TwineException
+
+page = 'http://www.example.com/index.html'
+
+class TestRequestPolicy:
+    def test_resource_type(self):
+        assert resource_type('http://a.com/logo.PNG?v=2') == 'image'
+        assert resource_type('http://a.com/f/font.woff2') == 'font'
+        assert resource_type('http://a.com/app.min.js#x') == 'script'
+        assert resource_type('http://a.com/page') is None
+        assert resource_type('http://a.com/dir.d/page') is None
+    def test_types(self):
+        policy = RequestPolicy(types=['image', 'font'])
+        assert policy.check('http://www.example.com/a.jpg', page) == 'image'
+        assert policy.check('http://www.example.com/a.css', page) is None
+    def test_patterns(self):
+        policy = RequestPolicy(patterns=['analytics', r'\.mp4$'])
+        assert policy.check('http://ga.com/analytics.js', page) == 'url'
+        assert policy.check('http://www.example.com/a.mp4', page) == 'url'
+        assert policy.check('http://www.example.com/a.js', page) is None
+    def test_third_party(self):
+        policy = RequestPolicy(third_party=True)
+        assert policy.check('http://cdn.other.com/a.js', page) == \
+               'third-party'
+        assert policy.check('http://static.www.example.com/a.js', page) \
+               is None
+        assert policy.check('http://example.com/a.js', page) is None
+    def test_empty(self):
+        assert not RequestPolicy()
+        assert RequestPolicy(third_party=True)
+    def test_parse_types(self):
+        assert parse_types(' image, font ,') == ['image', 'font']
+        try:
+            parse_types('image,pictures')
+        except ValueError:
+            pass
+        else:
+            assert False
+
+class TestCommands:
+    def tearDown(self):
+        commands.unblock_urls()
+        commands.config('block_types', '')
+        commands.config('block_third_party', '0')
+    def test_block_urls(self):
+        assert not commands.request_policy()
+        commands.block_urls('ads?\\.')
+        commands.config('block_types', 'image')
+        policy = commands.request_policy()
+        assert policy.check('http://ads.example.com/x.html', page) == 'url'
+        assert policy.check('http://www.example.com/x.gif', page) == 'image'
+        commands.unblock_urls()
+        assert commands.request_policy().check(
+            'http://ads.example.com/x.html', page) is None
+    def test_bad_values(self):
+        for fn, args in ((commands.block_urls, ('(',)),
+                         (commands.config, ('block_types', 'pictures'))):
+            try:
+                fn(*args)
+            except TwineException:
+                pass
+            else:
+                assert False, args
@@ -1,4 +1,4 @@
-from flask import Flask, request, render_template, make_response
+from flask import Flask, request, render_template, make_response, redirect
 from wtforms import Form, validators
 from wtforms import TextField, PasswordField, BooleanField, RadioField
 from wtforms import SelectField, TextAreaField
@@ -47,5 +47,66 @@ def cookie():
   resp.set_cookie('examplecookie', 'examplevalue')
   return resp
 
+# cacheable pages, for the HTTP cache tests
+@test_server.route('/cached')
+def cached():
+  resp = make_response(render_template('index.html'))
+  resp.headers['Cache-Control'] = 'max-age=60'
+  return resp
+
+@test_server.route('/revalidate')
+def revalidate():
+  if request.headers.get('If-None-Match') == '"v1"':
+    return '', 304
+  resp = make_response(render_template('index.html'))
+  resp.headers['Cache-Control'] = 'no-cache'
+  resp.headers['ETag'] = '"v1"'
+  return resp
+
+@test_server.route('/private')
+def private():
+  resp = make_response(render_template('index.html'))
+  resp.headers['Cache-Control'] = 'private, max-age=60'
+  return resp
+
+@test_server.route('/protected')
+def protected():
+  auth = request.authorization
+  if not auth or (auth.username, auth.password) != ('user', 'pass'):
+    resp = make_response('Unauthorized', 401)
+    resp.headers['WWW-Authenticate'] = 'Basic realm="twine"'
+    return resp
+  resp = make_response(render_template('index.html'))
+  resp.headers['Cache-Control'] = 'max-age=60'
+  return resp
+
+@test_server.route('/refresh')
+def refresh():
+  return '<html><head><meta http-equiv="Refresh" ' \
+         'content="0; URL=/link"></head><body>Moved</body></html>'
+
+@test_server.route('/redirect')
+def redirect_route():
+  return redirect('/link')
+
+# pages for the link checker tests
+@test_server.route('/links')
+def links():
+  return render_template('links.html')
+
+@test_server.route('/needs_cookie')
+def needs_cookie():
+  # only for browsers that came from /cookie and follow a link to here
+  if request.cookies.get('examplecookie') != 'examplevalue' or \
+     not request.headers.get('Referer', '').endswith('/links'):
+    return 'Forbidden', 403
+  return render_template('link.html')
+
+@test_server.route('/sitemap.xml')
+def sitemap():
+  resp = make_response(render_template('sitemap.xml'))
+  resp.headers['Content-Type'] = 'application/xml'
+  return resp
+
 if __name__ == "__main__":
     test_server.run(debug = True)
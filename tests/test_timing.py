@@ -0,0 +1,73 @@
+import time
+from StringIO import StringIO
+
+from twine import timing, parse, set_output
+
+class TestTiming:
+    def setUp(self):
+        timing.clear()
+        timing.enable()
+    def tearDown(self):
+        timing.enable(False)
+        timing.clear()
+    def test_phases(self):
+        timing.begin_line('script', 0, 'go x')
+        timing.push('load')
+        time.sleep(0.02)
+        timing.push('dom')
+        time.sleep(0.01)
+        timing.pop()
+        timing.pop()
+        timing.end_line()
+
+        [stats] = timing.get_stats()
+        assert stats.calls == 1
+        assert 0.02 <= stats.phases['load'] < 0.03
+        assert 0.01 <= stats.phases['dom'] < 0.02
+        assert abs(stats.total - sum(stats.phases.values())) < 1e-9
+    def test_nested_line(self):
+        timing.begin_line('outer', 0, 'runfile inner')
+        timing.begin_line('inner', 0, 'sleep')
+        time.sleep(0.02)
+        timing.end_line()
+        timing.end_line()
+
+        stats = dict([ (s.filename, s) for s in timing.get_stats() ])
+        assert stats['inner'].total >= 0.02
+        assert stats['outer'].total < 0.01
+    def test_disabled(self):
+        timing.enable(False)
+        timing.begin_line('script', 0, 'go x')
+        timing.push('load')
+        timing.pop()
+        timing.end_line()
+        assert timing.get_stats() == []
+    def test_execute(self):
+        output = StringIO()
+        set_output(output)
+        try:
+            parse.execute_string('setlocal x 1\n# comment\necho ${x}\n'
+                                 'echo ${x}\n')
+        finally:
+            set_output(None)
+
+        lines = sorted([ (s.lineno, s.calls) for s in timing.get_stats() ])
+        assert lines == [(0, 1), (2, 1), (3, 1)]
+
+        report = StringIO()
+        timing.report(report, 2)
+        assert 'echo ${x}' in report.getvalue()
+    def test_failed_substitution(self):
+        # the line's phases are unwound even if the substitution fails.
+        set_output(StringIO())
+        try:
+            parse.execute_string('echo ${1/0}\n')
+        except Exception:
+            pass
+        else:
+            assert False
+        finally:
+            set_output(None)
+        assert timing._timers == []
+        [stats] = timing.get_stats()
+        assert stats.calls == 1 and 'subst' in stats.phases
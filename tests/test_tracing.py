@@ -0,0 +1,61 @@
+import json
+from StringIO import StringIO
+
+from twine import tracing, parse, set_output
+
+class TestTracing:
+    def setUp(self):
+        tracing.clear()
+        tracing.enable()
+        self.output = StringIO()
+        set_output(self.output)
+    def tearDown(self):
+        tracing.enable(False)
+        tracing.clear()
+        set_output(None)
+    def test_command_spans(self):
+        parse.execute_string('setlocal x 1\necho ${x}\n')
+        events = tracing.get_events()
+        assert [ e['name'] for e in events ] == ['setlocal', 'echo']
+        for e in events:
+            assert e['ph'] == 'X' and e['cat'] == 'command'
+            assert e['dur'] >= 0
+    def test_failed_command(self):
+        try:
+            parse.execute_string('run "1/0"\n')
+        except Exception:
+            pass
+        assert [ e['name'] for e in tracing.get_events() ] == ['run']
+    def test_write(self):
+        parse.execute_string('echo hello\n')
+        fp = StringIO()
+        tracing.write(fp)
+        trace = json.loads(fp.getvalue())
+        phases = [ e['ph'] for e in trace['traceEvents'] ]
+        assert phases == ['M', 'X']
+    def test_disabled(self):
+        tracing.enable(False)
+        parse.execute_string('echo hello\n')
+        assert tracing.get_events() == []
+    def test_async_spans(self):
+        tracing.async_span('a', 'network', 1.0, dict(url='a'), end=3.0)
+        tracing.async_span('b', 'network', 2.0, dict(url='b'), end=4.0)
+        events = tracing.get_events()
+        assert [ (e['name'], e['ph']) for e in events ] == \
+               [('a', 'b'), ('a', 'e'), ('b', 'b'), ('b', 'e')]
+        assert events[0]['id'] == events[1]['id'] != events[2]['id']
+        assert events[0]['ts'] == 1000000 and events[1]['ts'] == 3000000
+        assert events[0]['args'] == dict(url='a')
+    def test_network_spans(self):
+        from twine import commands
+        commands.reset_browser('http')
+        try:
+            parse.execute_string('go http://127.0.0.1:5000/\n')
+        finally:
+            commands.reset_browser()
+        events = tracing.get_events()
+        network = [ e for e in events if e['cat'] == 'network' ]
+        assert [ e['ph'] for e in network ] == ['b', 'e']
+        assert network[0]['args']['status'] == '200'
+        # the command is the only complete event on the thread.
+        assert [ e['name'] for e in events if e['ph'] == 'X' ] == ['go']
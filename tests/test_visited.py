@@ -0,0 +1,56 @@
+from twine import commands
+from twine.errors import TwineException
+from twine.visited import normalize_url, make_store, BloomVisited
+
+class TestNormalize:
+    def test_normalize(self):
+        assert normalize_url('HTTP://Example.COM:80') == 'http://example.com/'
+        assert normalize_url('https://a.com:443/x?b=1#top') == \
+               'https://a.com/x?b=1'
+        assert normalize_url('http://User@A.com:8080/X') == \
+               'http://User@a.com:8080/X'
+        assert normalize_url('http://[::1]/') == 'http://[::1]/'
+
+class TestStores:
+    def check_store(self, store):
+        store.add('http://Example.com/a#x')
+        store.add('http://example.com:80/a')
+        assert 'http://example.com/a' in store
+        assert 'http://example.com/b' not in store
+        assert len(store) == 1
+        store.clear()
+        assert 'http://example.com/a' not in store
+        store.close()
+    def test_stores(self):
+        for kind in ('memory', 'sqlite', 'bloom'):
+            self.check_store(make_store(kind, 1000, 0.01))
+    def test_bloom_size(self):
+        bloom = BloomVisited(10000, 0.01)
+        assert len(bloom._bits) < 12500       # ~9.6 bits per URL
+        for i in range(10000):
+            bloom.add('http://example.com/%d' % i)
+        false = sum([ 'http://example.com/x%d' % i in bloom
+                      for i in range(10000) ])
+        assert false < 300
+    def test_bad_store(self):
+        try:
+            make_store('disk')
+        except ValueError:
+            pass
+        else:
+            assert False
+
+class TestOptions:
+    def tearDown(self):
+        commands.config('visited_store', 'memory')
+    def test_options(self):
+        commands.config('visited_store', 'bloom')
+        for key, value in (('visited_store', 'disk'),
+                           ('visited_capacity', '0'),
+                           ('visited_error_rate', '1.5')):
+            try:
+                commands.config(key, value)
+            except TwineException:
+                pass
+            else:
+                assert False, key
@@ -0,0 +1,56 @@
+import requests
+
+from twine import commands
+from twine.httpbrowser import HTTPBrowser
+from twine.errors import TwineException, TwineAssertionError
+
+html = """<html><body>
+<div id="results"><p class="item">one</p></div>
+</body></html>"""
+
+def make_browser():
+    response = requests.models.Response()
+    response._content = html
+    response.encoding = 'utf-8'
+    response.status_code = 200
+    response.url = 'http://example.com/'
+    response.headers['Content-Type'] = 'text/html'
+
+    browser = HTTPBrowser()
+    browser._set_page(response, False)
+    return browser
+
+class TestWait:
+    def setUp(self):
+        self.browser = make_browser()
+    def fails(self, fn, *args):
+        try:
+            fn(*args)
+        except TwineAssertionError:
+            pass
+        else:
+            assert False, args
+    def test_wait_for(self):
+        self.browser.wait_for('#results p.item', 1)
+        self.fails(self.browser.wait_for, '#results p.missing', 1)
+    def test_wait_for_text(self):
+        self.browser.wait_for_text('<p[^>]*>one<', 1)
+        self.fails(self.browser.wait_for_text, 'two', 1)
+    def test_wait_for_idle(self):
+        self.browser.wait_for_idle(1)
+    def test_wait_for_js(self):
+        try:
+            self.browser.wait_for_js('true', 1)
+        except TwineException:
+            pass
+        else:
+            assert False
+    def test_timeout(self):
+        assert commands._wait_timeout(None) == 10.0
+        assert commands._wait_timeout('2.5') == 2.5
+        try:
+            commands._wait_timeout('soon')
+        except TwineException:
+            pass
+        else:
+            assert False